@@ -35,14 +35,32 @@ class Module(object, metaclass=abc.ABCMeta):
 
         self.does_process_output = False
 
+        # Flag specifying whether the outputs of each command in a list of commands can be checkpointed
+        # so that a recreated preemptible instance resumes from the last completed command
+        self.is_checkpointable = False
+
         # Module output file directory
         self.output_dir = "/data/output/"
 
+        # Flag specifying whether the module writes large temporary files (e.g. sorting)
+        # Such modules get local SSD/NVMe disks mounted on their scratch directory when the platform supports it
+        self.is_scratch_intensive = False
+
+        # Module temporary file directory
+        self.scratch_dir = "/data/scratch/"
+
+        # Flag specifying whether the module only defines its outputs from its inputs (e.g. renaming keys)
+        # Such modules are resolved by the scheduler without provisioning a processor or transferring any file
+        self.is_controller_only = False
+
         # create a default argument(s) for all modules here
 
         # argument for multiplying the calculated storage for an individual module
         self.add_argument("storage_multiplier", False, False, 1)
 
+        # argument for dividing the cpus/memory requested by an individual module on platforms sharing nodes
+        self.add_argument("overcommit", False, False, 1)
+
     @abc.abstractmethod
     def define_input(self):
         pass
@@ -226,6 +244,14 @@ class Module(object, metaclass=abc.ABCMeta):
     def set_output_dir(self, new_output_dir):
         self.output_dir = new_output_dir
 
+    def get_scratch_dir(self):
+        return self.scratch_dir
+
+    def get_checkpoint_paths(self):
+        # Paths saved after each completed command of checkpointable modules (directories end with '/')
+        # Modules keeping intermediate files outside of the output directory can override it
+        return [self.output_dir]
+
     def get_input_values(self):
         # Get list of current input values
         return [arg.get_value() for arg in list(self.arguments.values())]
@@ -13,6 +13,9 @@ class _GATKBase(Module):
         # Initialize the gatk version
         self.gatk_version = None
 
+        # GATK temporary files are written to the scratch directory
+        self.is_scratch_intensive = True
+
     def define_base_args(self):
 
         # Set GATK executable arguments
@@ -48,7 +51,7 @@ class _GATKBase(Module):
         gatk    = self.get_argument("gatk")
         mem     = self.get_argument("mem")
         java = self.get_argument("java")
-        jvm_options = "-Xmx{0}G -Djava.io.tmpdir={1}".format(mem * 4 // 5, "/tmp/")
+        jvm_options = "-Xmx{0}G -Djava.io.tmpdir={1}".format(mem * 4 // 5, self.get_scratch_dir())
 
         if self.get_gatk_version() < 4:
             return "{0} {1} -jar {2} -T".format(java, jvm_options, gatk)
@@ -395,7 +398,7 @@ class IndexVCF(_GATKBase):
 
         # Generate command with java if not running on docker
         java = self.get_argument("java")
-        jvm_options = "-Xmx%dG -Djava.io.tmpdir=%s" % (mem * 4 // 5, "/tmp/")
+        jvm_options = "-Xmx%dG -Djava.io.tmpdir=%s" % (mem * 4 // 5, self.get_scratch_dir())
         cmd = "%s %s -cp %s org.broadinstitute.gatk.tools.CatVariants" % (java, jvm_options, gatk)
 
         # Generating the CatVariants options
@@ -6,6 +6,7 @@ class RenameUMI(Module):
     def __init__(self, module_id, is_docker=False):
         super(RenameUMI, self).__init__(module_id, is_docker)
         self.output_keys = ["umi_bam"]
+        self.is_controller_only = True
 
     def define_input(self):
         self.add_argument("bam", is_required=True)
@@ -26,6 +27,7 @@ class RenameTranscriptomeBamToBam(Module):
     def __init__(self, module_id, is_docker=False):
         super(RenameTranscriptomeBamToBam, self).__init__(module_id, is_docker)
         self.output_keys = ["bam"]
+        self.is_controller_only = True
 
     def define_input(self):
         self.add_argument("transcriptome_mapped_bam", is_required=True)
@@ -46,6 +48,7 @@ class RenameBamToTranscriptomeBam(Module):
     def __init__(self, module_id, is_docker=False):
         super(RenameBamToTranscriptomeBam, self).__init__(module_id, is_docker)
         self.output_keys = ["transcriptome_mapped_bam"]
+        self.is_controller_only = True
 
     def define_input(self):
         self.add_argument("bam", is_required=True)
@@ -66,6 +69,7 @@ class RenameRNA(Module):
     def __init__(self, module_id, is_docker=False):
         super(RenameRNA, self).__init__(module_id, is_docker)
         self.output_keys    = ["rna_bam", "rna_bam_idx"]
+        self.is_controller_only = True
 
     def define_input(self):
         self.add_argument("bam",        is_required=True)
@@ -91,6 +95,7 @@ class RenameRnaBamToBam(Module):
     def __init__(self, module_id, is_docker=False):
         super(RenameRnaBamToBam, self).__init__(module_id, is_docker)
         self.output_keys = ["bam"]
+        self.is_controller_only = True
 
     def define_input(self):
         self.add_argument("rna_bam", is_required=True)
@@ -111,6 +116,7 @@ class RenameTranscriptomeBamToBam(Module):
     def __init__(self, module_id, is_docker=False):
         super(RenameTranscriptomeBamToBam, self).__init__(module_id, is_docker)
         self.output_keys = ["bam"]
+        self.is_controller_only = True
 
     def define_input(self):
         self.add_argument("transcriptome_mapped_bam", is_required=True)
@@ -131,6 +137,7 @@ class RenameBamToSplicedTxRNABam(Module):
     def __init__(self, module_id, is_docker=False):
         super(RenameBamToSplicedTxRNABam, self).__init__(module_id, is_docker)
         self.output_keys = ["spliced_rna_transcriptome_bam"]
+        self.is_controller_only = True
 
     def define_input(self):
         self.add_argument("bam", is_required=True)
@@ -150,6 +157,7 @@ class RenameBamToSplicedTxDNABam(Module):
     def __init__(self, module_id, is_docker=False):
         super(RenameBamToSplicedTxDNABam, self).__init__(module_id, is_docker)
         self.output_keys = ["spliced_dna_transcriptome_bam"]
+        self.is_controller_only = True
 
     def define_input(self):
         self.add_argument("bam", is_required=True)
@@ -170,6 +178,7 @@ class RenameBamToShortInsertTxBam(Module):
     def __init__(self, module_id, is_docker=False):
         super(RenameBamToShortInsertTxBam, self).__init__(module_id, is_docker)
         self.output_keys = ["short_insert_rna_transcriptome_bam"]
+        self.is_controller_only = True
 
     def define_input(self):
         self.add_argument("bam", is_required=True)
@@ -190,6 +199,7 @@ class RenameLongInsertBamToBam(Module):
     def __init__(self, module_id, is_docker=False):
         super(RenameLongInsertBamToBam, self).__init__(module_id, is_docker)
         self.output_keys = ["bam"]
+        self.is_controller_only = True
 
     def define_input(self):
         self.add_argument("long_insert_bam", is_required=True)
@@ -210,6 +220,7 @@ class RenameBamToLongInsertTxRNABam(Module):
     def __init__(self, module_id, is_docker=False):
         super(RenameBamToLongInsertTxRNABam, self).__init__(module_id, is_docker)
         self.output_keys = ["long_insert_rna_transcriptome_bam"]
+        self.is_controller_only = True
 
     def define_input(self):
         self.add_argument("bam", is_required=True)
@@ -230,6 +241,7 @@ class RenameBamToLongInsertTxDNABam(Module):
     def __init__(self, module_id, is_docker=False):
         super(RenameBamToLongInsertTxDNABam, self).__init__(module_id, is_docker)
         self.output_keys = ["long_insert_dna_transcriptome_bam"]
+        self.is_controller_only = True
 
     def define_input(self):
         self.add_argument("bam", is_required=True)
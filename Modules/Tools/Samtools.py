@@ -1,5 +1,6 @@
 from Modules import Module
 import logging
+import os
 
 class Index(Module):
     def __init__(self, module_id, is_docker = False):
@@ -88,6 +89,9 @@ class Sort(Module):
         super(Sort, self).__init__(module_id, is_docker)
         self.output_keys = ["bam", "transcriptome_mapped_bam"]
 
+        # Sorting spills temporary files to the scratch directory
+        self.is_scratch_intensive = True
+
     def define_input(self):
         self.add_argument("bam")
         self.add_argument("transcriptome_mapped_bam")
@@ -145,10 +149,12 @@ class Sort(Module):
 
             if isinstance(bam, list):
                 for b_in, b_out in zip(bam, sorted_bam):
-                    bam_cmd += "{0} sort {1} -o {2} !LOG3! & ".format(samtools, b_in, b_out)
+                    bam_cmd += "{0} sort {1} -o {2} -T {3} !LOG3! & ".format(samtools, b_in, b_out,
+                                                                          self.__get_tmp_prefix(b_out))
                 bam_cmd += "wait"
             else:
-                bam_cmd += "{0} sort {1} -o {2} !LOG3!".format(samtools, bam, sorted_bam)
+                bam_cmd += "{0} sort {1} -o {2} -T {3} !LOG3!".format(samtools, bam, sorted_bam,
+                                                                   self.__get_tmp_prefix(sorted_bam))
 
         if transcriptome_mapped_bam:
 
@@ -157,11 +163,13 @@ class Sort(Module):
             if transcriptome_mapped_bam:
                 if isinstance(transcriptome_mapped_bam, list):
                     for b_in, b_out in zip(transcriptome_mapped_bam, sorted_transcriptome_bam):
-                        transcriptome_bam_cmd += "{0} sort {1} -o {2} !LOG3! & ".format(samtools, b_in, b_out)
+                        transcriptome_bam_cmd += "{0} sort {1} -o {2} -T {3} !LOG3! & ".format(
+                            samtools, b_in, b_out, self.__get_tmp_prefix(b_out))
                     transcriptome_bam_cmd += "wait"
                 else:
-                    transcriptome_bam_cmd += "{0} sort {1} -o {2} !LOG3!".format(samtools, transcriptome_mapped_bam,
-                                                              sorted_transcriptome_bam)
+                    transcriptome_bam_cmd += "{0} sort {1} -o {2} -T {3} !LOG3!".format(samtools, transcriptome_mapped_bam,
+                                                              sorted_transcriptome_bam,
+                                                              self.__get_tmp_prefix(sorted_transcriptome_bam))
 
         if bam and transcriptome_mapped_bam:
             cmd = f'{bam_cmd};{transcriptome_bam_cmd}'
@@ -172,6 +180,10 @@ class Sort(Module):
 
         return cmd
 
+    def __get_tmp_prefix(self, sorted_bam):
+        # Prefix of the temporary files of a sort, unique for each sorted file
+        return os.path.join(self.get_scratch_dir(), os.path.basename(str(sorted_bam)))
+
 
 class Stats(Module):
     def __init__(self, module_id, is_docker = False):
@@ -8,6 +8,9 @@ class Star(Module):
         self.output_keys = ["bam", "transcriptome_mapped_bam", "raw_read_counts",
                             "splice_junction_out", "final_log"]
 
+        # Sorting by coordinate spills temporary files to the scratch directory
+        self.is_scratch_intensive = True
+
     def define_input(self):
         self.add_argument("R1",                         is_required=True)
         self.add_argument("R2")
@@ -53,6 +56,9 @@ class Star(Module):
         # Generate output file name prefix for STAR
         output_file_name_prefix = bam.split(".")[0] + "."
 
+        # STAR creates its temporary directory itself, so it must not exist yet
+        tmp_dir = os.path.join(self.get_scratch_dir(), os.path.basename(bam.split(".")[0]) + "_STARtmp")
+
         # Check the input FASTQ format
         if R1.endswith(".gz"):
             read_file_command = "zcat"
@@ -68,22 +74,23 @@ class Star(Module):
         if self.get_argument("R2") is not None:
             cmd = "{0} --runThreadN {1} --genomeDir {2} --readFilesIn {3} {4} --outFileNamePrefix {5} --readFilesCommand {6} " \
                   "--quantMode {7} --outSAMunmapped {8} --outSAMtype {9} --twopassMode {10} --outSAMattrRGline {11} " \
-                  "--outSAMmapqUnique {12} --quantTranscriptomeBan {13} !LOG3!".format(star, nr_cpus, ref, R1, R2,
+                  "--outSAMmapqUnique {12} --quantTranscriptomeBan {13} --outTmpDir {14} !LOG3!".format(star, nr_cpus, ref, R1, R2,
                                                                                        output_file_name_prefix,
                                                                                        read_file_command, quant_mod,
                                                                                        out_unmapped_within_sam,
                                                                                        output_file_type, twopass_mode,
                                                                                        read_group, out_sam_mapq_unique,
-                                                                                       quant_transcriptome_ban)
+                                                                                       quant_transcriptome_ban, tmp_dir)
         else:
             cmd = "{0} --runThreadN {1} --genomeDir {2} --readFilesIn {3} --outFileNamePrefix {4} --readFilesCommand {5} " \
                   "--quantMode {6} --outSAMunmapped {7} --outSAMtype {8} --twopassMode {9} --outSAMattrRGline {10} " \
-                  "--outSAMmapqUnique {11} --quantTranscriptomeBan {12} !LOG3!".format(star,nr_cpus, ref, R1,
+                  "--outSAMmapqUnique {11} --quantTranscriptomeBan {12} --outTmpDir {13} !LOG3!".format(star,nr_cpus, ref, R1,
                                                                                        output_file_name_prefix,
                                                                                        read_file_command, quant_mod,
                                                                                        out_unmapped_within_sam,
                                                                                        output_file_type, twopass_mode,
                                                                                        read_group, out_sam_mapq_unique,
-                                                                                       quant_transcriptome_ban)
+                                                                                       quant_transcriptome_ban, tmp_dir)
 
-        return cmd
+        # Remove the temporary directory left by a previous attempt
+        return "rm -rf {0} ; {1}".format(tmp_dir, cmd)
@@ -9,6 +9,9 @@ class Strelka2(Module):
         # Initialze Strelka2's run directory
         self.run_directory = None
 
+        # Resume from the configured run directory if the instance is preempted
+        self.is_checkpointable = True
+
     def define_input(self):
         self.add_argument("sample_name",    is_required=True)
         self.add_argument("bam",            is_required=True)
@@ -1,14 +1,15 @@
 import logging
 import importlib
 import json
+import math
 import os
 import time
 from collections import OrderedDict
 
-from System.Graph import Graph, Scheduler, ScriptTask
+from System.Graph import Graph, Scheduler, ScriptTask, TmpOutputCleaner
 from System.Datastore import ResourceKit, SampleSet, Datastore
 from System.Validators import GraphValidator, InputValidator, SampleValidator
-from System.Platform import StorageHelper, DockerHelper
+from System.Platform import StorageHelper, DockerHelper, DockerImageManager, ValidationCache
 from System import CC_MAIN_DIR
 
 
@@ -55,10 +56,19 @@ class GAPipeline(object):
         # Task scheduler for running jobs
         self.scheduler = None
 
+        # Manager of docker images used by the pipeline
+        self.image_manager = None
+
+        # Cleaner for deleting temporary output during the run
+        self.tmp_output_cleaner = None
+
         # Helper classes for handling platform operations
         self.storage_helper     = None
         self.docker_helper      = None
 
+        # Time (sec) spent validating pipeline inputs on the platform
+        self.input_validation_time = None
+
     def load(self):
 
         # Load resource kit
@@ -78,9 +88,12 @@ class GAPipeline(object):
         # Initialize the platform
         self.platform.init_platform()
 
+        # Create docker image manager
+        self.image_manager = DockerImageManager()
+
         # Create datastore and scheduler
         self.datastore = Datastore(self.graph, self.resource_kit, self.sample_data, self.platform)
-        self.scheduler = Scheduler(self.graph, self.datastore, self.platform, self.script_tasks)
+        self.scheduler = Scheduler(self.graph, self.datastore, self.platform, self.script_tasks, image_manager=self.image_manager)
 
     def validate(self):
 
@@ -107,29 +120,47 @@ class GAPipeline(object):
             raise SystemError("One or more errors have been encountered during validation. "
                               "See the above logs for more information")
 
+        # Load docker image metadata validated in previous runs
+        validation_cache = ValidationCache()
+
         # Create storage/docker helpers for checking input files
         self.storage_helper     = StorageHelper(None)
-        self.docker_helper      = DockerHelper(None)
+        self.docker_helper      = DockerHelper(None, validation_cache=validation_cache)
 
         # Validate all pipeline inputs can be found on platform
+        validation_start = time.time()
         input_validator = InputValidator(self.resource_kit, self.sample_data, self.storage_helper, self.docker_helper)
         has_errors = input_validator.validate() or has_errors
+        validation_cache.save()
+        self.input_validation_time = time.time() - validation_start
+        logging.info("Input validation took %.2f seconds." % self.input_validation_time)
 
         # Stop the pipeline if there are any errors
         if has_errors:
             raise SystemError("One or more errors have been encountered during validation. "
                               "See the above logs for more information")
 
+        # Resolve docker images used by the graph once for all tasks
+        self.image_manager.set_docker_helper(self.docker_helper)
+        self.image_manager.resolve(self.graph, self.resource_kit)
+
         logging.info("CloudCounductor run validated! Beginning pipeline execution.")
 
     def run(self, rm_tmp_output_on_success=True):
+        # Delete temporary output incrementally as soon as all its consumers have finished
+        if rm_tmp_output_on_success and not self.__generate_script:
+            self.tmp_output_cleaner = TmpOutputCleaner(self.graph, self.datastore, self.storage_helper, self.platform)
+            self.scheduler.set_tmp_output_cleaner(self.tmp_output_cleaner)
+
         # Run until all tasks are complete
         self.scheduler.run()
 
         # Remove temporary output on success
         if rm_tmp_output_on_success:
+            if self.tmp_output_cleaner is not None:
+                self.tmp_output_cleaner.wait_completion()
             workspace = self.datastore.get_task_workspace()
-            self.storage_helper.rm(path=workspace.get_tmp_output_dir(), job_name="rm_tmp_output", wait=True)
+            self.storage_helper.rm(path=workspace.get_tmp_output_dir(), job_name="rm_tmp_output", wait=True, num_threads=10)
 
     def save_progress(self):
         pass
@@ -198,6 +229,22 @@ class GAPipeline(object):
         # Create a pipeline report that summarizes features of pipeline
         report = GAPReport(self.pipeline_id, err, err_msg, git_version)
 
+        # Register time spent validating inputs
+        report.set_input_validation_time(self.input_validation_time)
+
+        # Register docker images used by the pipeline
+        if self.image_manager is not None:
+            report.set_docker_images(self.image_manager.get_report())
+
+        # Register storage saved by deleting temporary output early
+        if self.tmp_output_cleaner is not None:
+            report.set_tmp_storage_saved(self.tmp_output_cleaner.get_storage_saved())
+
+        # Register preemptible capacity statistics per zone
+        if self.platform is not None:
+            report.set_capacity_stats(self.platform.get_capacity_stats())
+            report.set_packing_stats(self.platform.get_packing_stats())
+
         # Register runtime data for pipeline tasks
         if self.scheduler is not None:
             task_workers = self.scheduler.get_task_workers()
@@ -210,7 +257,20 @@ class GAPipeline(object):
                 start_time  = task_worker.get_start_time()
                 end_time    = task_worker.get_stop_time()
                 cmd         = task_worker.get_cmd()
-                task_data   = {"parent_task" : task_name.split(".")[0]}
+                task_data   = {"parent_task" : task_name.split(".")[0],
+                               "docker_pull_time" : task_worker.get_docker_pull_time(),
+                               "ready_time(sec)" : task_worker.get_ready_time()}
+
+                # Register data transferred by the task
+                transfer_stats = task_worker.get_transfer_stats()
+                if transfer_stats is not None:
+                    task_data.update(transfer_stats)
+
+                # Register disk IO of the task commands if it was measured
+                io_stats = task_worker.get_io_stats()
+                if io_stats is not None:
+                    for stat_name, stat_value in io_stats.items():
+                        task_data["io_%s" % stat_name] = stat_value
                 report.register_task(task_name=task_name,
                                      start_time=start_time,
                                      end_time=end_time,
@@ -254,6 +314,21 @@ class GAPReport(object):
         # Time of pipeline start
         self.start_time = None
 
+        # Time (sec) spent validating pipeline inputs
+        self.input_validation_time = None
+
+        # Docker images used by the pipeline
+        self.docker_images = {}
+
+        # Temporary output storage (GB-hours) saved by deleting intermediate files early
+        self.tmp_storage_saved = 0
+
+        # Preemptible instance creations, creation failures and preemptions per zone
+        self.capacity_stats = {}
+
+        # Resources requested by the tasks over resources allocatable on the nodes they ran on
+        self.packing_stats = {}
+
         # Output files produced by successful modules
         self.output_files = []
 
@@ -285,6 +360,31 @@ class GAPReport(object):
                 end_time = task["end_time"]
         return end_time - start_time
 
+    @property
+    def ready_time_summary(self):
+        # Percentiles of the time (sec) instances took to become ready after their creation request
+        ready_times = sorted(float(task["ready_time(sec)"]) for task in self.tasks
+                             if task.get("ready_time(sec)") is not None)
+        if not ready_times:
+            return {}
+
+        summary = OrderedDict()
+        for percentile in [50, 90, 99]:
+            # Nearest-rank percentile
+            rank = max(int(math.ceil(percentile / 100.0 * len(ready_times))), 1)
+            summary[f"p{percentile}"] = ready_times[rank - 1]
+        summary["max"] = ready_times[-1]
+        summary["count"] = len(ready_times)
+        return summary
+
+    @property
+    def transfer_summary(self):
+        # Total data moved from and to the bucket, handed off through the shared workspace, and transfer time
+        summary = OrderedDict()
+        for key in ["bucket_download(GB)", "bucket_upload(GB)", "shared_handoff(GB)", "transfer_time(sec)"]:
+            summary[key] = round(sum(float(task[key]) for task in self.tasks if task.get(key) is not None), 3)
+        return summary
+
     @property
     def total_output_size(self):
         size = 0
@@ -304,6 +404,21 @@ class GAPReport(object):
     def set_start_time(self, start_time):
         self.start_time = start_time
 
+    def set_input_validation_time(self, validation_time):
+        self.input_validation_time = validation_time
+
+    def set_docker_images(self, docker_images):
+        self.docker_images = docker_images
+
+    def set_tmp_storage_saved(self, tmp_storage_saved):
+        self.tmp_storage_saved = tmp_storage_saved
+
+    def set_capacity_stats(self, capacity_stats):
+        self.capacity_stats = capacity_stats
+
+    def set_packing_stats(self, packing_stats):
+        self.packing_stats = packing_stats
+
     def register_task(self, task_name, start_time, end_time, run_time, cost, cmd=None, task_data=None):
         # Register information about a specific processor in the report
 
@@ -344,7 +459,14 @@ class GAPReport(object):
         report["total_cost"] = self.total_cost
         report["total_runtime"] = self.total_runtime
         report["total_proc_time"] = self.total_processing_time
+        report["input_validation_time"] = self.input_validation_time
+        report["instance_ready_time"] = self.ready_time_summary
+        report["tmp_storage_saved(GB-hours)"] = self.tmp_storage_saved
+        report["capacity_by_zone"] = self.capacity_stats
+        report["packing_efficiency"] = self.packing_stats
         report["total_output_size"] = self.total_output_size
+        report["transfers"] = self.transfer_summary
+        report["docker_images"] = self.docker_images
         report["files"] = self.output_files
         report["tasks"] = self.tasks
         return report
@@ -1,36 +1,76 @@
+import hashlib
+import json
 import logging
 import os
+import re
+import time
 
 from System.Platform import Platform, StorageHelper, DockerHelper
 
 
 class ModuleExecutor(object):
 
-    def __init__(self, task_id, processor, final_output_dir, final_tmp_dir, docker_image=None):
+    # Whole disk devices listed in /proc/diskstats
+    DISK_DEVICE = re.compile(r"^(sd[a-z]+|vd[a-z]+|xvd[a-z]+|nvme[0-9]+n[0-9]+)$")
+
+    def __init__(self, task_id, processor, final_output_dir, final_tmp_dir, docker_image=None, image_manager=None):
         self.task_id        = task_id
         self.processor      = processor
         self.storage_helper = StorageHelper(self.processor)
         self.docker_helper  = DockerHelper(self.processor)
         self.docker_image   = docker_image
+        self.image_manager  = image_manager
+
+        # Time (sec) spent pulling the docker image
+        self.docker_pull_time = None
+
+        # Long-lived container of the task in which all commands are run (None = new container per command)
+        self.docker_container = None
+
+        # Disk IO of the task commands: device counters when the commands started and the resulting statistics
+        self.io_counters = None
+        self.io_stats = None
+
+        # Files moved from and to the bucket or handed off through the shared workspace, and transfer time (sec)
+        self.transferred_files = {"bucket_download": [], "bucket_upload": [], "shared_handoff": []}
+        self.transfer_time = 0
 
         self.final_output_dir = final_output_dir
         self.final_tmp_dir = final_tmp_dir
 
+        # Checkpoints of completed commands are saved next to the temporary outputs
+        self.checkpoint_dir = f"{self.final_tmp_dir.rstrip('/')}/checkpoint_{self.task_id}"
+
+        # Jobs replaced by the last checkpoint on a recreated processor
+        self.checkpointed_jobs = []
+
+        # Whether checkpoints were saved or restored and need to be removed once the outputs are saved
+        self.has_checkpoints = False
+
+        # Input paths and sizes of the task, and hash of the commands and inputs written in the checkpoint marker
+        self.checkpoint_inputs = []
+        self.checkpoint_signature = None
+
         # Create workspace directory structure
         self.__create_workspace()
 
     def load_input(self, inputs):
 
+        # Remember the original inputs, as checkpoints are only valid for the same inputs
+        self.checkpoint_inputs = sorted([x.get_path(), x.get_size() or 0] for x in inputs)
+
         # List of jobs that have been started in process of loading input
         job_names = []
+        transfer_start = time.time()
 
-        # Pull docker image if necessary
+        # Start pulling docker image if necessary
+        # The pull runs in parallel with the input transfers and is only waited on once they are done
+        pull_job_name = None
         if self.docker_image is not None:
             docker_image_name = self.docker_image.get_image_name().split("/")[0]
             docker_image_name = docker_image_name.replace(":", "_")
-            job_name = "docker_pull_%s" % docker_image_name
-            self.docker_helper.pull(self.docker_image.get_image_name(), job_name=job_name)
-            job_names.append(job_name)
+            pull_job_name = "docker_pull_%s" % docker_image_name
+            self.docker_helper.pull(self.docker_image.get_image_name(), job_name=pull_job_name, timed=True)
 
         # Load input files
         # Inputs: list containing remote files, local files, and docker images
@@ -41,10 +81,12 @@ class ModuleExecutor(object):
         loading_counter = 0
         for task_input in inputs:
 
-            # Don't transfer local files
+            # Don't transfer local files (e.g. outputs of parent tasks in the shared workspace)
             if ":" not in task_input.get_path():
                 continue
 
+            self.transferred_files["bucket_download"].append(task_input)
+
             # Directory where input will be transferred
             dest_dir = "/data/"
 
@@ -81,7 +123,8 @@ class ModuleExecutor(object):
                 # Move file to dest_path
                 self.storage_helper.mv(src_path=src_path,
                                        dest_path=dest_path,
-                                       job_name=job_name)
+                                       job_name=job_name,
+                                       file_size=task_input.get_size())
                 loading_counter += 1
 
                 # Add transfer path to list of remote paths that have been transferred to local workspace
@@ -107,11 +150,26 @@ class ModuleExecutor(object):
         if not self.processor.batch_processing:
             for job_name in job_names:
                 self.processor.wait_process(job_name)
+            self.transfer_time += time.time() - transfer_start
+
+            # Wait for docker image and record how long it took to pull
+            if pull_job_name is not None:
+                out, err = self.processor.wait_process(pull_job_name)
+                self.docker_pull_time = self.docker_helper.get_pull_time(out)
+                logging.debug("(%s) Docker image pulled in %s seconds." % (self.task_id, self.docker_pull_time))
+                if self.image_manager is not None:
+                    self.image_manager.record_pull_time(self.task_id, self.docker_image.get_image_name(), self.docker_pull_time)
+
+                # Start the container where all the task commands will be run
+                self.__start_container()
 
         # Recursively give every permission to all files we just added
         logging.info("(%s) Final workspace perm. update for task '%s'..." % (self.processor.name, self.task_id))
         self.__grant_workspace_perms(job_name="grant_final_wrkspace_perms")
 
+    def get_docker_pull_time(self):
+        return self.docker_pull_time
+
     def run(self, cmd, job_name=None):
 
         # Check or create job name
@@ -122,9 +180,131 @@ class ModuleExecutor(object):
         docker_image_name = None if self.docker_image is None else self.docker_image.get_image_name()
 
         # Begin running job and return stdout, stderr after job has finished running
-        self.processor.run(job_name, cmd, docker_image=docker_image_name)
+        self.processor.run(job_name, cmd, docker_image=docker_image_name, docker_container=self.docker_container)
         return self.processor.wait_process(job_name)
 
+    def start_io_measurement(self):
+        # Record the disk IO counters of the processor before running the task commands
+        if self.processor.batch_processing:
+            return
+        self.io_counters = self.__get_io_counters(job_name=f"io_stats_start_{self.task_id}")
+
+    def stop_io_measurement(self):
+        # Compute the disk IO of the task commands since start_io_measurement
+        if self.io_counters is None:
+            return
+
+        start_time, start_read, start_written = self.io_counters
+        end_time, end_read, end_written = self.__get_io_counters(job_name=f"io_stats_stop_{self.task_id}")
+        elapsed = max(end_time - start_time, 1)
+
+        read_gb = (end_read - start_read) / 1024 ** 3
+        written_gb = (end_written - start_written) / 1024 ** 3
+        self.io_stats = {
+            "read(GB)": round(read_gb, 3),
+            "written(GB)": round(written_gb, 3),
+            "throughput(MB/s)": round((read_gb + written_gb) * 1024 / elapsed, 3)
+        }
+        logging.debug(f"({self.task_id}) Disk IO: {self.io_stats}")
+
+    def get_io_stats(self):
+        return self.io_stats
+
+    def can_checkpoint(self):
+        # Checkpoints are only useful if the processor can be recreated and are saved to remote storage
+        return self.processor.can_restore_checkpoints() and not self.processor.batch_processing \
+            and ":" in self.final_tmp_dir
+
+    def get_checkpoint_step(self, cmds):
+        # Return the last command step saved by a previous attempt of the same commands on the same inputs,
+        # read from the checkpoint marker (None if there is no matching complete checkpoint)
+        # The output directory is not unique per run, so checkpoints left by any other attempt are removed
+        self.checkpoint_signature = hashlib.sha256(
+            json.dumps({"cmds": cmds, "inputs": self.checkpoint_inputs}, sort_keys=True).encode()).hexdigest()
+
+        marker = self.storage_helper.read_file(f"{self.checkpoint_dir}/CHECKPOINT")
+        fields = marker.split() if marker is not None else []
+        if len(fields) == 2 and fields[0].isdigit() and fields[1] == self.checkpoint_signature:
+            return int(fields[0])
+
+        if marker is not None:
+            logging.warning(f"({self.task_id}) Ignoring the checkpoint in '{self.checkpoint_dir}' as it was saved "
+                            f"for different commands or inputs.")
+
+        # Start fresh
+        self.__remove_checkpoints()
+        return None
+
+    def save_checkpoint(self, step, step_job_name, paths):
+        # Save the paths produced by a completed command, followed by a marker indicating the checkpoint is complete
+
+        # Transfer the paths to the checkpoint directory
+        job_names = []
+        for idx, path in enumerate(paths):
+            job_name = f"checkpoint_{self.task_id}_{step}_{idx}"
+            self.storage_helper.mv(path.rstrip("/"), f"{self.checkpoint_dir}/{idx}", job_name=job_name)
+            job_names.append(job_name)
+
+        for job_name in job_names:
+            self.processor.wait_process(job_name)
+
+        # Write the checkpoint marker only once all the paths have been saved
+        marker_job_name = f"checkpoint_marker_{self.task_id}_{step}"
+        self.processor.run(job_name=marker_job_name, cmd=f"echo '{step} {self.checkpoint_signature}' | sudo tee /data/.checkpoint > /dev/null")
+        self.processor.wait_process(marker_job_name)
+
+        marker_mv_job_name = f"checkpoint_mv_marker_{self.task_id}_{step}"
+        self.storage_helper.mv("/data/.checkpoint", f"{self.checkpoint_dir}/CHECKPOINT", job_name=marker_mv_job_name,
+                               wait=True)
+
+        # On a recreated processor, the checkpoint is restored instead of rerunning the command and saving it
+        self.checkpointed_jobs.extend([step_job_name] + job_names + [marker_job_name, marker_mv_job_name])
+        self.has_checkpoints = True
+        self.processor.add_durable_checkpoint(self.checkpointed_jobs,
+                                              lambda: self.restore_checkpoint(step, paths))
+
+        logging.debug(f"({self.task_id}) Saved checkpoint of command {step} to '{self.checkpoint_dir}'.")
+
+    def restore_checkpoint(self, step, paths):
+        # Transfer the paths saved by a checkpoint back to the workspace
+        logging.info(f"({self.task_id}) Restoring checkpoint of command {step} from '{self.checkpoint_dir}'.")
+
+        restore_id = Platform.generate_unique_id()
+        self.has_checkpoints = True
+
+        # Remove whatever later commands left in the saved paths, so they are exactly as they were checkpointed
+        clear_job_name = f"clear_checkpoint_paths_{self.task_id}_{step}_{restore_id}"
+        self.processor.run(job_name=clear_job_name, cmd=f"sudo rm -rf {' '.join(x.rstrip('/') for x in paths)}")
+        self.processor.wait_process(clear_job_name)
+
+        job_names = []
+        for idx, path in enumerate(paths):
+            job_name = f"restore_checkpoint_{self.task_id}_{step}_{idx}_{restore_id}"
+            if path.endswith("/"):
+                # Directories are saved under their name in the checkpoint directory
+                dir_name = path.rstrip("/").rsplit("/", 1)[-1]
+                parent_dir = path.rstrip("/").rsplit("/", 1)[0]
+                self.storage_helper.mv(f"{self.checkpoint_dir}/{idx}/{dir_name}", f"{parent_dir}/", job_name=job_name)
+            else:
+                self.storage_helper.mv(f"{self.checkpoint_dir}/{idx}", path, job_name=job_name)
+            job_names.append(job_name)
+
+        for job_name in job_names:
+            self.processor.wait_process(job_name)
+
+        self.__grant_workspace_perms(job_name=f"grant_restored_wrkspace_perms_{restore_id}")
+
+    def clear_checkpoints(self):
+        # Remove the saved checkpoints once they are no longer needed
+        if self.has_checkpoints:
+            self.__remove_checkpoints()
+
+    def __remove_checkpoints(self):
+        try:
+            self.storage_helper.rm(f"{self.checkpoint_dir}/")
+        except BaseException as e:
+            logging.warning(f"({self.task_id}) Could not remove checkpoints from '{self.checkpoint_dir}': {e}")
+
     def save_output(self, outputs, final_output_types):
         # Return output files to workspace output dir
 
@@ -134,6 +314,10 @@ class ModuleExecutor(object):
 
         # List of output file paths. We create this list to ensure the files are not being overwritten
         output_filepaths = []
+        transfer_start = time.time()
+
+        # Destination directory of each output file
+        destinations = []
 
         for output_file in outputs:
             if output_file.get_type() in final_output_types:
@@ -158,6 +342,22 @@ class ModuleExecutor(object):
                 # Just add the new path to the list of output file paths
                 output_filepaths.append(destination_path)
 
+            destinations.append((output_file, dest_dir))
+
+        # Create all local output directories (e.g. in the shared workspace) in one step before the transfers,
+        # so that consecutive transfers can be run together
+        local_dirs = sorted({dest_dir for _, dest_dir in destinations if ":" not in dest_dir})
+        if local_dirs:
+            self.storage_helper.mkdirs(local_dirs, job_name="mkdir_output_%s" % self.task_id, wait=True)
+
+        for output_file, dest_dir in destinations:
+
+            # Temporary outputs stay in the shared workspace when the platform has one
+            if ":" not in dest_dir:
+                self.transferred_files["shared_handoff"].append(output_file)
+            else:
+                self.transferred_files["bucket_upload"].append(output_file)
+
             # Transfer to correct output directory
             job_name = "save_output_%s_%s_%s" % (self.task_id, output_file.get_type(), count)
             curr_path = output_file.get_transferrable_path()
@@ -176,6 +376,15 @@ class ModuleExecutor(object):
         # Wait for transfers to complete
         for job_name in job_names:
             self.processor.wait_process(job_name)
+        if not self.processor.batch_processing:
+            self.transfer_time += time.time() - transfer_start
+
+    def get_transfer_stats(self):
+        # Sizes are summed when requested, as output sizes are only known once the outputs are saved
+        stats = {f"{kind}(GB)": round(sum(x.get_size() or 0 for x in files), 3)
+                 for kind, files in self.transferred_files.items()}
+        stats["transfer_time(sec)"] = round(self.transfer_time, 3) if not self.processor.batch_processing else None
+        return stats
 
     def update_file_sizes(self, outputs):
         # Calculate output file size
@@ -197,9 +406,17 @@ class ModuleExecutor(object):
     def __create_workspace(self):
         # Create all directories specified in task workspace
         logging.info("(%s) Creating workspace for task '%s'..." % (self.processor.name, self.task_id))
-        for dir_type, dir_obj in [("wrk_dir", "/data"), ("wrk_log_dir", "/data/log"), ("wrk_out_dir", "/data/output")]:
+        for dir_type, dir_obj in [("wrk_dir", "/data"), ("wrk_log_dir", "/data/log"), ("wrk_out_dir", "/data/output"),
+                                  ("wrk_scratch_dir", "/data/scratch")]:
             self.storage_helper.mkdir(dir_obj, job_name="mkdir_%s" % dir_type, wait=True)
 
+        # Mount the local scratch disks of the processor (if any) on the scratch directory
+        scratch_cmd = self.processor.get_scratch_cmd("/data/scratch")
+        if scratch_cmd is not None:
+            logging.info("(%s) Mounting local scratch disks..." % self.processor.name)
+            self.processor.run(job_name="mount_scratch", cmd=scratch_cmd)
+            self.processor.wait_process("mount_scratch")
+
         # Give everyone all the permissions on working directory
         logging.info("(%s) Updating workspace permissions..." % self.processor.name)
         self.__grant_workspace_perms(job_name="grant_initial_wrkspace_perms")
@@ -207,6 +424,31 @@ class ModuleExecutor(object):
         # Wait for all the above commands to complete
         logging.info("(%s) Successfully created workspace for task '%s'!" % (self.processor.name, self.task_id))
 
+    def __start_container(self):
+        # Start a single container for the task, so that commands skip the container startup cost
+        container_name = "cc-%s" % re.sub(r"[^a-zA-Z0-9_.-]", "-", self.task_id)
+        job_name = f"docker_start_{self.task_id}"
+        self.docker_helper.start_container(self.docker_image.get_image_name(), container_name, job_name=job_name)
+        self.processor.wait_process(job_name)
+        self.docker_container = container_name
+
+    def __get_io_counters(self, job_name):
+        # Return the time and the bytes read and written by all the disks of the processor
+        # Partitions and RAID devices are skipped, as their IO is already counted by the underlying disks
+        self.processor.run(job_name=job_name, cmd="date +%s.%N && cat /proc/diskstats")
+        out, err = self.processor.wait_process(job_name)
+
+        lines = out.strip().split("\n")
+        read_bytes, written_bytes = 0, 0
+        for line in lines[1:]:
+            fields = line.split()
+            if len(fields) < 10 or not self.DISK_DEVICE.match(fields[2]):
+                continue
+            read_bytes += int(fields[5]) * 512
+            written_bytes += int(fields[9]) * 512
+
+        return float(lines[0]), read_bytes, written_bytes
+
     def __grant_workspace_perms(self, job_name):
         cmd = "sudo chmod -R 777 /data"
         self.processor.run(job_name=job_name, cmd=cmd)
@@ -6,7 +6,7 @@ from System.Graph import TaskWorker, ScriptTask
 
 class Scheduler(object):
 
-    def __init__(self, task_graph, datastore, platform, script_tasks):
+    def __init__(self, task_graph, datastore, platform, script_tasks, image_manager=None):
 
         # Initialize pipeline definition variables
         self.task_graph     = task_graph
@@ -16,12 +16,21 @@ class Scheduler(object):
         # Initialize task dict for script generation
         self.script_tasks = script_tasks
 
+        # Manager of docker images used by the pipeline
+        self.image_manager = image_manager
+
+        # Optional cleaner that deletes temporary outputs once they have been consumed
+        self.tmp_output_cleaner = None
+
         # Initialize set of task workers
         self.task_workers = {}
 
     def get_task_workers(self):
         return self.task_workers
 
+    def set_tmp_output_cleaner(self, tmp_output_cleaner):
+        self.tmp_output_cleaner = tmp_output_cleaner
+
     def run(self):
         try:
             self.__run_tasks()
@@ -53,8 +62,15 @@ class Scheduler(object):
                     if task_id not in self.script_tasks:
                         self.script_tasks[task_id] = ScriptTask(task_id)
                         self.script_tasks[task_id].parents = self.task_graph.get_parents(task_id)
-                    self.task_workers[task_id] = TaskWorker(task, self.datastore, self.platform, self.script_tasks[task_id])
-                    self.task_workers[task_id].start()
+                    self.task_workers[task_id] = TaskWorker(task, self.datastore, self.platform, self.script_tasks[task_id],
+                                                          image_manager=self.image_manager)
+
+                    # Resolve metadata-only tasks right away in the scheduler thread, so that children can start
+                    if self.task_workers[task_id].is_controller_task():
+                        self.task_workers[task_id].run()
+                        self.__finalize_task_worker(self.task_workers[task_id])
+                    else:
+                        self.task_workers[task_id].start()
 
             # Sleeping for 5 seconds before checking again
             if len(self.script_tasks) == 0:
@@ -86,6 +102,10 @@ class Scheduler(object):
             # Set task to complete if task worker completed successfully
             task.set_complete(True)
 
+            # Delete temporary outputs that are no longer needed
+            if self.tmp_output_cleaner is not None:
+                self.tmp_output_cleaner.task_complete(task.get_ID())
+
     def __finalize(self):
 
         # Prevent any new processors from being created on platform
@@ -25,6 +25,7 @@ class ScriptTask(object):
         self.input_values               = {}
         self.output_files               = []
         self.extra_volumes              = []
+        self.config_map_volumes         = []
         self.labels                     = []
         self.annotations                = []
         self.num_retries                = 3
@@ -56,6 +57,7 @@ class ScriptTask(object):
         task["input_values"]                = self.input_values
         task["output_files"]                = self.output_files
         task["extra_volumes"]               = self.extra_volumes
+        task["config_map_volumes"]          = self.config_map_volumes
         task["labels"]                      = self.labels
         task["annotations"]                 = self.annotations
         task["num_retries"]                 = self.num_retries
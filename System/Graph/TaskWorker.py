@@ -21,7 +21,7 @@ class TaskWorker(Thread):
 
     STATUSES        = ["IDLE", "LOADING", "RUNNING", "FINALIZING", "COMPLETE", "CANCELLING", "FINALIZED"]
 
-    def __init__(self, task, datastore, platform, script_task=None):
+    def __init__(self, task, datastore, platform, script_task=None, image_manager=None):
         # Class for executing task
 
         # Initialize new thread
@@ -39,6 +39,9 @@ class TaskWorker(Thread):
         # Platform upon which task will be executed
         self.platform = platform
 
+        # Manager of docker images used by the pipeline
+        self.image_manager = image_manager
+
         # Status attributes
         self.status_lock = threading.Lock()
         self.status = TaskWorker.IDLE
@@ -104,6 +107,33 @@ class TaskWorker(Thread):
     def get_cmd(self):
         return self.cmd
 
+    def get_ready_time(self):
+        if self.proc is None:
+            return None
+        else:
+            return self.proc.get_ready_time()
+
+    def get_docker_pull_time(self):
+        if self.module_executor is None:
+            return None
+        return self.module_executor.get_docker_pull_time()
+
+    def get_io_stats(self):
+        if self.module_executor is None:
+            return None
+        return self.module_executor.get_io_stats()
+
+    def get_transfer_stats(self):
+        if self.module_executor is None:
+            return None
+        return self.module_executor.get_transfer_stats()
+
+    def is_controller_task(self):
+        # Final outputs still need to be copied to the final output directory by a processor
+        if not self.module.is_controller_only:
+            return False
+        return not set(self.module.get_output_types() or []) & set(self.task.get_final_output_keys() or [])
+
     def get_new_output_dirs(self):
 
         task_id = self.task.get_ID()
@@ -113,8 +143,11 @@ class TaskWorker(Thread):
         if self.task.is_split():
             task_id = task_id.replace(".", "/")
 
+        # Temporary outputs are handed off to children through the shared workspace if the platform has one
+        tmp_base_dir = self.platform.get_shared_workspace() or self.platform.get_final_output_dir()
+
         final_output_dir = os.path.join(self.platform.get_final_output_dir(), task_id)
-        final_tmp_dir = os.path.join(self.platform.get_final_output_dir(), "tmp", task_id)
+        final_tmp_dir = os.path.join(tmp_base_dir, "tmp", task_id)
 
         if visible_samples is not None and len(visible_samples) <= 1 and not self.datastore.is_multisample():
             # Single sample output of multi-sample analysis always goes in sample level folder
@@ -122,7 +155,7 @@ class TaskWorker(Thread):
             # Remove sample name from path if it already appears and put it as the first directory
             task_id = task_id.replace(sample_name + "/", "")
             final_output_dir = os.path.join(self.platform.get_final_output_dir(), sample_name, task_id)
-            final_tmp_dir = os.path.join(self.platform.get_final_output_dir(), "tmp", sample_name, task_id)
+            final_tmp_dir = os.path.join(tmp_base_dir, "tmp", sample_name, task_id)
 
         return final_output_dir, final_tmp_dir
 
@@ -132,10 +165,18 @@ class TaskWorker(Thread):
             # Set the input arguments that will be passed to the task module
             self.datastore.set_task_input_args(self.task.get_ID())
 
+            # Define the outputs of metadata-only modules in the controller without running any command
+            if self.is_controller_task():
+                self.__resolve_output()
+                with self.status_lock:
+                    self.__err = False
+                return
+
             # Compute task resource requirements
             cpus                = self.module.get_argument("nr_cpus")
             mem                 = self.module.get_argument("mem")
             storage_multiplier  = int(self.module.get_argument("storage_multiplier"))
+            overcommit          = float(self.module.get_argument("overcommit"))
 
             # see if we're forcing standard instances
             try:
@@ -171,8 +212,15 @@ class TaskWorker(Thread):
 
             # Create the specific processor for the task
             if has_command:
+                # Request local scratch disks for modules writing large temporary files
+                scratch_space = self.__compute_scratch_requirements(input_files)
+                if scratch_space:
+                    logging.debug("(%s) Scratch space: %s" % (self.task.get_ID(), scratch_space))
+
                 # Get processor capable of running job
-                self.proc = self.platform.get_instance(cpus, mem, disk_space, task_id=self.task.get_ID(), force_standard=force_standard, script_task=self.script_task)
+                self.proc = self.platform.get_instance(cpus, mem, disk_space, task_id=self.task.get_ID(), force_standard=force_standard, script_task=self.script_task,
+                                                       scratch_space=scratch_space, io_intensive=self.module.is_scratch_intensive,
+                                                       overcommit=overcommit)
                 logging.debug("(%s) Successfully acquired processor!" % self.task.get_ID())
             else:
                 # Get small processor
@@ -190,7 +238,8 @@ class TaskWorker(Thread):
                                                   processor=self.proc,
                                                   final_output_dir=final_out_dir,
                                                   final_tmp_dir= final_tmp_dir,
-                                                  docker_image=docker_image)
+                                                  docker_image=docker_image,
+                                                  image_manager=self.image_manager)
 
             # Check to see if pipeline has been cancelled
             self.__check_cancelled()
@@ -208,6 +257,9 @@ class TaskWorker(Thread):
                 self.set_status(self.RUNNING)
                 self.cmd = self.module.update_command()
 
+                # Measure the disk IO of the command(s)
+                self.module_executor.start_io_measurement()
+
                 if not self.module.is_resumable:
                     logging.debug("Module (%s) is not resumable adding checkpoint(s)!" % self.module.get_ID())
                     self.proc.add_checkpoint()  # mark a checkpoint after all the input is done
@@ -221,15 +273,30 @@ class TaskWorker(Thread):
                     # Initialize the output and error placeholders
                     out, err = None, None
 
+                    # Save the outputs of each completed command if the processor may be recreated
+                    checkpoint = self.module.is_checkpointable and self.module_executor.can_checkpoint()
+
+                    # Skip the commands completed by a previous attempt of the task, restoring their outputs
+                    resume_step = self.__get_resume_step() if checkpoint else None
+
                     # Process each command
                     for cmd_id, cmd in enumerate(self.cmd):
 
                         # Create a unique job_name
                         job_name = "{0}_{1}".format(self.task.get_ID(), cmd_id)
 
+                        if resume_step is not None and cmd_id <= resume_step:
+                            if cmd_id == resume_step:
+                                self.module_executor.restore_checkpoint(resume_step, self.module.get_checkpoint_paths())
+                            continue
+
                         # Run the actual command
                         out, err = self.module_executor.run(cmd, job_name=job_name)
 
+                        # Checkpoint every command, so that a preemption while saving the outputs does not rerun it
+                        if checkpoint:
+                            self.module_executor.save_checkpoint(cmd_id, job_name, self.module.get_checkpoint_paths())
+
                         # Check to see if pipeline has been cancelled
                         self.__check_cancelled()
 
@@ -247,8 +314,20 @@ class TaskWorker(Thread):
 
                 else:
 
-                    # Run the actual command
-                    out, err = self.module_executor.run(self.cmd)
+                    # Save the outputs of the command if the processor may be recreated
+                    checkpoint = self.module.is_checkpointable and self.module_executor.can_checkpoint()
+                    resume_step = self.__get_resume_step() if checkpoint else None
+
+                    if resume_step is not None:
+                        # Restore the outputs of the command completed by a previous attempt of the task
+                        self.module_executor.restore_checkpoint(resume_step, self.module.get_checkpoint_paths())
+                        out, err = None, None
+                    else:
+                        # Run the actual command
+                        out, err = self.module_executor.run(self.cmd)
+
+                        if checkpoint:
+                            self.module_executor.save_checkpoint(0, self.task.get_ID(), self.module.get_checkpoint_paths())
 
                     # Check to see if pipeline has been cancelled
                     self.__check_cancelled()
@@ -265,6 +344,8 @@ class TaskWorker(Thread):
                     if not self.module.is_resumable:
                         self.proc.add_checkpoint(False)  # mark a checkpoint after the command has been run
 
+                self.module_executor.stop_io_measurement()
+
             if not self.proc.batch_processing:
                 # Set the status to finalized
                 self.set_status(self.FINALIZING)
@@ -275,6 +356,9 @@ class TaskWorker(Thread):
             if len(output_files) > 0:
                 self.module_executor.save_output(output_files, final_output_types)
 
+            # Checkpoints are no longer needed once the outputs are saved
+            self.module_executor.clear_checkpoints()
+
             # wait for all processes if processor runs them in a batch
             if self.proc.batch_processing:
                 # add return logs to the commands before running
@@ -343,6 +427,18 @@ class TaskWorker(Thread):
         with self.status_lock:
             return self.__cancelled
 
+    def __get_resume_step(self):
+        # Last command completed by a previous attempt of the task, according to its checkpoint marker
+        # Modules post-processing the output of their last command always rerun it, as its output is not saved
+        nr_cmds = len(self.cmd) if isinstance(self.cmd, list) else 1
+        last_step = nr_cmds - 2 if self.module.does_process_output else nr_cmds - 1
+        resume_step = self.module_executor.get_checkpoint_step(self.cmd)
+        if resume_step is None or resume_step > last_step:
+            return None
+
+        logging.info(f"({self.task.get_ID()}) Resuming after command {resume_step} completed by a previous attempt.")
+        return resume_step
+
     def __clean_up(self):
 
         # Do nothing if errors occurred before processor was even created
@@ -370,6 +466,18 @@ class TaskWorker(Thread):
             if str(e) != "":
                 logging.error("Received following error:\n%s" % e)
 
+    def __resolve_output(self):
+        # Output files keep the paths of the input files they are defined from, so nothing is transferred
+        self.set_status(self.RUNNING)
+        self.module.get_command(self.script_task)
+        logging.debug("(%s) Resolved output without a processor!" % self.task.get_ID())
+
+        if self.script_task:
+            self.script_task.module_name = self.task.get_module_name()
+            self.script_task.submodule_name = self.task.get_submodule_name()
+            self.script_task.input_values = {x: self.module.get_argument(x) for x in self.module.get_arguments()}
+            self.script_task.output_files = [x.path for x in self.datastore.get_task_output_files(self.task.get_ID())]
+
     def __compute_disk_requirements(self, input_files, docker_image, input_multiplier=None):
         # Compute size of disk needed to store input/output files
         input_size = 0
@@ -419,6 +527,24 @@ class TaskWorker(Thread):
 
         return disk_size
 
+    def __compute_scratch_requirements(self, input_files):
+        # Compute size of local scratch space needed by modules writing large temporary files
+        if not self.module.is_scratch_intensive:
+            return 0
+
+        # Temporary files are usually as large as the uncompressed input
+        input_size = 0
+        for input_file in input_files:
+            if not input_file.get_size():
+                continue
+            # Overestimate for gzipped files
+            if input_file.get_path().endswith(".gz"):
+                input_size += input_file.get_size()*5
+            else:
+                input_size += input_file.get_size()
+
+        return int(math.ceil(2 * input_size))
+
     def __check_cancelled(self):
         if self.__cancelled:
             raise RuntimeError("(%s) Task failed due to cancellation!")
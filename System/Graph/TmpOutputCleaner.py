@@ -0,0 +1,170 @@
+import os
+import logging
+import threading
+import time
+
+from System.Workers import ThreadPool, PoolWorker
+
+
+class CleanupWorker(PoolWorker):
+    # ThreadPool worker running the deletions scheduled by the cleaner
+    def task(self, delete, paths):
+        delete(paths)
+
+
+class TmpOutputCleaner(object):
+    # Deletes the temporary outputs of a task as soon as every task consuming them has finished
+
+    def __init__(self, task_graph, datastore, storage_helper, platform, num_threads=10):
+
+        # Pipeline definition variables
+        self.task_graph     = task_graph
+        self.datastore      = datastore
+
+        # Helper used to delete the temporary output from the bucket
+        self.storage_helper = storage_helper
+
+        # Platform deleting the temporary output from its shared workspace (not mounted on the controller)
+        self.platform       = platform
+
+        # Thread pool for deleting temporary outputs in parallel
+        # Its queue is unbounded so that the Scheduler thread never blocks when scheduling deletions
+        self.thread_pool = ThreadPool(num_threads, worker_class=CleanupWorker, queue_size=0)
+
+        # Complete tasks whose outputs have not been scheduled for deletion yet
+        self.complete_tasks = set()
+
+        # Tasks whose temporary outputs have already been scheduled for deletion
+        self.cleaned_tasks = set()
+
+        # Number of complete tasks not cleaned yet referencing each output path (e.g. re-keyed outputs),
+        # and the paths referenced by each of these tasks
+        self.path_refs = {}
+        self.task_paths = {}
+
+        # Size (GB) of the paths scheduled for deletion and the deletion timestamps
+        self.pending = {}
+        self.deleted = {}
+
+        self.lock = threading.Lock()
+
+    def task_complete(self, task_id):
+        # Keep the output paths of the completed task in use until its own outputs are cleaned
+        with self.lock:
+            self.complete_tasks.add(task_id)
+        self.__add_references(task_id)
+
+        # Check whether the completed task was the last consumer of any of its parents' outputs
+        for parent_id in self.task_graph.get_parents(task_id):
+            self.__clean_if_consumed(parent_id)
+
+        # Outputs of tasks without children are never consumed
+        self.__clean_if_consumed(task_id)
+
+    def wait_completion(self):
+        # Wait for all scheduled deletions to finish
+        self.thread_pool.wait_completion()
+
+    def get_storage_saved(self, end_time=None):
+        # Return the storage (GB-hours) saved by deleting temporary outputs before the end of the pipeline
+        end_time = time.time() if end_time is None else end_time
+        with self.lock:
+            return sum(size * max(end_time - timestamp, 0) / 3600.0 for size, timestamp in self.deleted.values())
+
+    def __clean_if_consumed(self, task_id):
+
+        task = self.task_graph.get_tasks(task_id)
+
+        # Only complete tasks can have temporary outputs
+        if not task.is_complete() or task.is_deprecated():
+            return
+
+        # Check that every child consuming the output has finished
+        for child_id in self.task_graph.get_children(task_id):
+            if not self.task_graph.get_tasks(child_id).is_complete():
+                return
+
+        with self.lock:
+            if task_id in self.cleaned_tasks or task_id not in self.complete_tasks:
+                return
+            self.cleaned_tasks.add(task_id)
+            self.complete_tasks.remove(task_id)
+            self.__remove_references(task_id)
+
+        shared_paths = []
+        for output_file in self.__get_tmp_output_files(task):
+            path = output_file.get_transferrable_path()
+
+            with self.lock:
+                # Keep paths still referenced by outputs of tasks that may be consumed later
+                if path in self.path_refs:
+                    logging.debug(f"Keeping temporary output {path} of task '{task_id}' as it is still in use.")
+                    continue
+                self.pending[path] = output_file.get_size() or 0
+
+            logging.debug(f"Deleting temporary output {path} of task '{task_id}'.")
+
+            # Temporary outputs of the shared workspace are deleted together
+            if ":" not in path:
+                shared_paths.append(path)
+            else:
+                self.thread_pool.add_task(self.__rm_bucket_paths, [path])
+
+        if shared_paths:
+            self.thread_pool.add_task(self.__rm_shared_paths, shared_paths)
+
+    def __rm_bucket_paths(self, paths):
+        for path in paths:
+            try:
+                self.storage_helper.rm(path)
+            except BaseException as e:
+                # Paths that cannot be deleted are left for the end-of-run cleanup
+                logging.warning(f"Unable to delete {path}: {e}")
+                continue
+            self.__mark_deleted(path)
+
+    def __rm_shared_paths(self, paths):
+        try:
+            deleted = self.platform.rm_shared_paths(paths)
+        except BaseException as e:
+            logging.warning(f"Unable to delete {' '.join(paths)}: {e}")
+            deleted = False
+
+        # Paths that cannot be deleted are left for the end-of-run cleanup
+        if deleted:
+            for path in paths:
+                self.__mark_deleted(path)
+
+    def __mark_deleted(self, path):
+        with self.lock:
+            self.deleted[path] = (self.pending.pop(path, 0), time.time())
+
+    def __get_tmp_output_files(self, task):
+        # Return the output files of a task that lie in the temporary output directory of the run
+        # (in the bucket or in the shared workspace), including the ones saved by other tasks (e.g. re-keyed outputs)
+        tmp_dir = self.__get_tmp_base_dir()
+        final_output_keys = task.get_final_output_keys()
+        return [output_file for output_file in self.datastore.get_task_output_files(task.get_ID())
+                if output_file.get_type() not in final_output_keys
+                and output_file.get_path().startswith(tmp_dir)]
+
+    def __get_tmp_base_dir(self):
+        # Same location as the temporary output directories of the task workers
+        tmp_base_dir = self.platform.get_shared_workspace() or self.platform.get_final_output_dir()
+        return os.path.join(tmp_base_dir, "tmp", "")
+
+    def __add_references(self, task_id):
+        paths = {output_file.get_transferrable_path() for output_file in self.datastore.get_task_output_files(task_id)}
+        with self.lock:
+            if task_id in self.task_paths or task_id in self.cleaned_tasks:
+                return
+            self.task_paths[task_id] = paths
+            for path in paths:
+                self.path_refs[path] = self.path_refs.get(path, 0) + 1
+
+    def __remove_references(self, task_id):
+        # Must be called with the lock held
+        for path in self.task_paths.pop(task_id, set()):
+            self.path_refs[path] -= 1
+            if self.path_refs[path] == 0:
+                self.path_refs.pop(path)
@@ -3,5 +3,6 @@ from .Graph import Graph
 from .ModuleExecutor import ModuleExecutor
 from .TaskWorker import TaskWorker
 from .ScriptTask import ScriptTask
+from .TmpOutputCleaner import TmpOutputCleaner
 from .Scheduler import Scheduler
 
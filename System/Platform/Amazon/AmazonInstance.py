@@ -26,18 +26,21 @@ from System.Platform.Amazon.EnhancedEC2NodeDriver import EnhancedEC2NodeDriver
 
 class AmazonInstance(CloudInstance):
 
+    # Maximum number of zones and instance families tried before falling back to an on-demand instance
+    MAX_SPOT_ATTEMPTS = 3
+
+    # NVMe instance store disks
+    SCRATCH_DEVICES = "/dev/disk/by-id/nvme-Amazon_EC2_NVMe_Instance_Storage_*"
+
     def __init__(self, name, nr_cpus, mem, disk_space, **kwargs):
 
         super(AmazonInstance, self).__init__(name, nr_cpus, mem, disk_space, **kwargs)
 
-        # Create libcloud driver
-        # driver_class = get_driver(Provider.EC2)
-        # self.driver = driver_class(self.identity, self.secret, region=self.region)
-        self.driver = EnhancedEC2NodeDriver(self.identity, self.secret, region=self.region)
+        # Use the libcloud driver of the platform
+        self.driver = self.platform.get_driver()
 
         self.instance_type = None
         self.is_preemptible = False
-        self.instance_type_list = None
 
         # Obtain the Google JSON path
         self.google_json = kwargs.get("google_json", None)
@@ -55,32 +58,36 @@ class AmazonInstance(CloudInstance):
             )
         )
 
-        self.instance_type_list = self.platform.get_instance_type_list()
+        # Catalog of instance types shared by all instances of the platform
+        self.instance_catalog = self.platform.get_instance_catalog()
 
         # Set additional SSH options
         self.set_ssh_option("SendEnv", "AWS_ACCESS_KEY_ID")
         self.set_ssh_option("SendEnv", "AWS_SECRET_ACCESS_KEY")
 
-    def get_instance_size(self):
+    def get_instance_size(self, excluded_options=None):
         '''Select optimal instance type for provided region, number of cpus, and memory allocation'''
-        selected_instance_type = None
-
-        for instance_type in self.instance_type_list:
-            # get number of cpus in instance type
-            type_cpus = instance_type['VCpuInfo']['DefaultVCpus']
-            # get amount of mem in instance type in MiB
-            type_mem = instance_type['MemoryInfo']['SizeInMiB']
-            if type_cpus >= self.nr_cpus and type_mem >= self.mem * 1024:
-                if not selected_instance_type:
-                    selected_instance_type = instance_type
-                else:
-                    # select the cheaper of the two instance types
-                    if self.is_preemptible and hasattr(instance_type, 'spotPrice') and instance_type['spotPrice'] < selected_instance_type['spotPrice']:
-                        selected_instance_type = instance_type
-                    elif instance_type['price'] < selected_instance_type['price']:
-                        selected_instance_type = instance_type
-
-        return selected_instance_type
+        instance_type = self.__select_instance_type(self.scratch_space, excluded_options)
+
+        # Use the EBS volume for scratch space if no instance type has enough instance store
+        if instance_type is None and self.scratch_space:
+            logging.warning(f"({self.name}) No instance type with {self.scratch_space}GB of instance store fits the "
+                            f"instance. Scratch space will be on the EBS volume.")
+            instance_type = self.__select_instance_type(excluded_options=excluded_options)
+
+        if instance_type is None:
+            raise RuntimeError(f"({self.name}) No AWS instance type with {self.nr_cpus} vCPUs and {self.mem}GB of memory is available!")
+
+        # Instance store disks are attached automatically
+        self.scratch_disks = 0 if not self.scratch_space else self.instance_catalog.get_scratch_disks(instance_type)
+
+        return instance_type
+
+    def get_machine_family(self):
+        return None if self.instance_type is None else self.instance_catalog.get_family(self.instance_type["InstanceType"])
+
+    def record_preemption(self):
+        self.__record_capacity_event("preemptions")
 
     def create_instance(self):
 
@@ -88,7 +95,7 @@ class AmazonInstance(CloudInstance):
         self.instance_type = self.get_instance_size()
         size_name = self.instance_type['InstanceType']
         logging.info(f"({self.name}) SELECTED AWS INSTANCE TYPE: {self.instance_type}")
-        node_size = [size for size in self.driver.list_sizes() if size.id == size_name][0]
+        node_size = self.instance_catalog.get_node_size(self.driver, size_name)
 
         device_mappings = [
             {
@@ -115,7 +122,7 @@ class AmazonInstance(CloudInstance):
             raise RuntimeError(f"({self.name}) There was an issue with creating the new instance.")
 
         # Get list of running nodes
-        running_nodes = self.__aws_request(self.driver.wait_until_running, [node], wait_period=20)
+        running_nodes = self.__aws_request(self.driver.wait_until_running, [node], wait_period=5)
 
         # Obtain our node
         self.node, external_IP = [(n, ext_IP[0]) for n, ext_IP in running_nodes if n.uuid == node.uuid][0]
@@ -211,12 +218,25 @@ class AmazonInstance(CloudInstance):
         if self.node is None:
             return CloudInstance.OFF
 
-        node_list = self.__aws_request(self.driver.list_nodes, ex_node_ids=[self.node.id])
+        # Obtain the node from the status listing shared by all instances
+        node = None
+        status_poller = self.platform.get_status_poller()
+        if status_poller is not None:
+            try:
+                node = status_poller.get_node(self.node.id)
+            except RuntimeError as e:
+                logging.debug(f"({self.name}) {e} Querying instance directly.")
 
-        if not node_list or len(node_list) == 0:
-            return CloudInstance.OFF
+        # Query the instance directly if it was not listed
+        if node is None:
+            node_list = self.__aws_request(self.driver.list_nodes, ex_node_ids=[self.node.id])
+
+            if not node_list or len(node_list) == 0:
+                return CloudInstance.OFF
+
+            node = node_list[0]
 
-        self.node = node_list[0]
+        self.node = node
 
         # Define mapping between the cloud status and the current class status
         status_map = {
@@ -264,12 +284,13 @@ class AmazonInstance(CloudInstance):
         node_list = self.__aws_request(self.driver.list_nodes, ex_filters=inst_type_filter)
         return node_list
 
-    def __create_spot_instance(self, node_size, device_mappings):
+    def __create_spot_instance(self, node_size, device_mappings, attempt=1, failed_options=None):
         try:
-            logging.info(f"({self.name}) Attempting to create a spot instance of type: {self.instance_type['InstanceType']}")
+            logging.info(f"({self.name}) Attempting to create a spot instance of type: {self.instance_type['InstanceType']} in zone {self.zone}")
             node = self.__aws_request(self.driver.create_node, name=self.name,
                                             image=self.disk_image,
                                             size=node_size,
+                                            location=self.platform.get_location(self.zone),
                                             ex_keyname=self.platform.get_ssh_key_pair(),
                                             ex_security_groups=[self.platform.get_security_group()],
                                             ex_blockdevicemappings=device_mappings,
@@ -277,6 +298,8 @@ class AmazonInstance(CloudInstance):
                                             ex_spot_price=self.instance_type['price'],
                                             interruption_behavior='stop',
                                             ex_terminate_on_shutdown=False)
+            if node:
+                self.__record_capacity_event("created")
             return node
         except Exception as e:
             exception_string = str(e)
@@ -288,6 +311,23 @@ class AmazonInstance(CloudInstance):
             logging.debug(f"({self.name}) Failed to create a spot instance of type: {self.instance_type['InstanceType']}")
             logging.debug(f"({self.name}) There was an issue when creating a spot instance: {exception_string}")
             if 'MaxSpotInstanceCountExceeded' in exception_string or 'InsufficientInstanceCapacity' in exception_string or 'InstanceLimitExceeded' in exception_string:
+                self.__record_capacity_event("creation_failures")
+
+                # Spot capacity may still be available in another zone or instance family
+                # Zones and families that already failed are not tried again
+                failed_options = (failed_options or set()) | {(self.zone, self.get_machine_family())}
+                if 'InsufficientInstanceCapacity' in exception_string and attempt < self.MAX_SPOT_ATTEMPTS:
+                    zone, instance_type = self.zone, self.instance_type
+                    try:
+                        self.instance_type = self.get_instance_size(excluded_options=failed_options)
+                    except RuntimeError:
+                        logging.info(f"({self.name}) No other zone or instance family left to try for a spot instance.")
+                        self.zone, self.instance_type = zone, instance_type
+                    else:
+                        logging.info(f"({self.name}) No spot capacity left. Trying instance type {self.instance_type['InstanceType']} in zone {self.zone}.")
+                        node_size = self.instance_catalog.get_node_size(self.driver, self.instance_type['InstanceType'])
+                        return self.__create_spot_instance(node_size, device_mappings, attempt + 1, failed_options)
+
                 logging.info(f"({self.name}) Changing from spot instance to on-demand because we hit our limit of spot instances!")
                 self.is_preemptible = False
                 node = self.__create_on_demand_instance(node_size, device_mappings)
@@ -297,10 +337,11 @@ class AmazonInstance(CloudInstance):
 
     def __create_on_demand_instance(self, node_size, device_mappings):
         try:
-            logging.info(f"({self.name}) Attempting to create an on demand instance of type: {self.instance_type['InstanceType']}")
+            logging.info(f"({self.name}) Attempting to create an on demand instance of type: {self.instance_type['InstanceType']} in zone {self.zone}")
             node = self.__aws_request(self.driver.create_node, name=self.name,
                                             image=self.disk_image,
                                             size=node_size,
+                                            location=self.platform.get_location(self.zone),
                                             ex_keyname=self.platform.get_ssh_key_pair(),
                                             ex_security_groups=[self.platform.get_security_group()],
                                             ex_blockdevicemappings=device_mappings,
@@ -322,11 +363,46 @@ class AmazonInstance(CloudInstance):
                 self.instance_type = self.get_instance_size()
                 size_name = self.instance_type['InstanceType']
                 logging.info(f"({self.name}) NEWLY SELECTED AWS INSTANCE TYPE: {self.instance_type}")
-                node_size = [size for size in self.driver.list_sizes() if size.id == size_name][0]
+                node_size = self.instance_catalog.get_node_size(self.driver, size_name)
                 return self.__create_on_demand_instance(node_size, device_mappings)
             else:
                 return None
 
+    def __select_instance_type(self, scratch_space=0, excluded_options=None):
+        if not self.is_preemptible:
+            return self.instance_catalog.get_cheapest(self.nr_cpus, self.mem, scratch_space=scratch_space)
+
+        # Spread spot instances across the allowed zones and equivalent instance families
+        instance_types = self.instance_catalog.get_cheapest_per_family(self.nr_cpus, self.mem, preemptible=True,
+                                                                       scratch_space=scratch_space)
+        if not instance_types:
+            return None
+
+        # Weight each zone and instance family by its recent spot capacity and its price
+        options = []
+        for zone in self.platform.get_preemptible_zones():
+            for family, instance_type in instance_types.items():
+                if excluded_options and (zone, family) in excluded_options:
+                    continue
+                options.append({
+                    "zone": zone,
+                    "family": family,
+                    "price": instance_type.get("spotPrice") or instance_type["price"],
+                    "instance_type": instance_type
+                })
+
+        if not options:
+            return None
+
+        option = self.platform.get_capacity_tracker().choose(options)
+        self.zone = option["zone"]
+        return option["instance_type"]
+
+    def __record_capacity_event(self, event):
+        # Only the capacity of spot instances is tracked
+        if self.is_preemptible:
+            self.platform.get_capacity_tracker().record(self.zone, self.get_machine_family(), event)
+
     def __aws_request(self, method, *args, **kwargs):
         """ Function for handling AWS requests and rate limit issues """
         # retry command up to 8 times
@@ -359,11 +435,7 @@ class AmazonInstance(CloudInstance):
         return False
 
     def __filter_instance_type(self, instance_type):
-        if self.instance_type_list:
-            for inst_type in self.instance_type_list:
-                if inst_type['InstanceType'] == instance_type:
-                    self.instance_type_list.remove(inst_type)
-                    break
+        self.instance_catalog.exclude(instance_type)
 
     def __cancel_spot_instance_request(self):
         client = boto3.client('ec2', aws_access_key_id=self.identity, aws_secret_access_key=self.secret, region_name='us-east-1', config=self.boto_config)
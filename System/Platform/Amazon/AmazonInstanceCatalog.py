@@ -0,0 +1,200 @@
+import os
+import json
+import time
+import bisect
+import logging
+import threading
+
+from System import CC_CACHE_DIR
+
+
+class AmazonInstanceCatalog(object):
+    # Catalog of AWS instance types shared by all instances of a platform
+    # Types are indexed by vCPUs and memory, with the cheapest fitting type found through binary search
+
+    # Time (sec) after which a cached catalog is rebuilt
+    CACHE_TTL = 24 * 3600
+
+    def __init__(self, instance_types):
+
+        # Instance type descriptions (as returned by describe_instance_types, with 'price' and 'spotPrice' added)
+        self.instance_types = instance_types
+
+        # Index used for finding the cheapest instance type for a given price key ('price' or 'spotPrice')
+        self.index = {}
+
+        # Node sizes of the libcloud driver, indexed by instance type name
+        self.node_sizes = None
+
+        self.lock = threading.Lock()
+
+        self.__build_index()
+
+    def get_instance_types(self):
+        return self.instance_types
+
+    def get_cheapest(self, nr_cpus, mem, preemptible=False, scratch_space=0):
+        # Return the cheapest instance type with at least nr_cpus vCPUs and mem GB of memory (None if none fits)
+        # Requests for scratch space (GB) need instance types with enough NVMe instance store
+        # Preemptible requests fall back to on-demand prices when no type with a spot price fits
+        for price_key in self.__get_price_keys(preemptible):
+            if scratch_space:
+                instance_types = self.__get_cheapest_per_family(nr_cpus, mem, price_key, scratch_space).values()
+                selected = min(instance_types, key=lambda x: x[price_key], default=None)
+            else:
+                selected = self.__get_cheapest(nr_cpus, mem, price_key)
+
+            if selected is not None:
+                return selected
+
+        return None
+
+    def get_cheapest_per_family(self, nr_cpus, mem, preemptible=False, scratch_space=0):
+        # Return the cheapest fitting instance type of each instance family (e.g. 'm5'), indexed by family
+        for price_key in self.__get_price_keys(preemptible):
+            selected = self.__get_cheapest_per_family(nr_cpus, mem, price_key, scratch_space)
+            if selected:
+                return selected
+
+        return {}
+
+    @staticmethod
+    def get_family(instance_type_name):
+        return instance_type_name.split(".")[0]
+
+    @staticmethod
+    def get_scratch_space(instance_type):
+        # Size (GB) of the NVMe instance store of an instance type (0 if it has none)
+        storage_info = instance_type.get("InstanceStorageInfo", None)
+        if not storage_info or storage_info.get("NvmeSupport", "unsupported") == "unsupported":
+            return 0
+        return storage_info.get("TotalSizeInGB", 0)
+
+    @staticmethod
+    def get_scratch_disks(instance_type):
+        # Number of NVMe instance store disks of an instance type
+        if not AmazonInstanceCatalog.get_scratch_space(instance_type):
+            return 0
+        return sum(disk.get("Count", 0) for disk in instance_type["InstanceStorageInfo"].get("Disks", []))
+
+    def exclude(self, instance_type_name):
+        # Remove an instance type from the catalog (e.g. when there is no capacity left for it)
+        with self.lock:
+            self.instance_types = [x for x in self.instance_types if x["InstanceType"] != instance_type_name]
+        self.__build_index()
+
+    def get_node_size(self, driver, instance_type_name):
+        # Return the libcloud NodeSize of an instance type, listing the driver sizes only once
+        with self.lock:
+            if self.node_sizes is None:
+                self.node_sizes = {size.id: size for size in driver.list_sizes()}
+            return self.node_sizes[instance_type_name]
+
+    def save(self, cache_file):
+        # Persist the catalog so future runs can skip querying AWS
+        try:
+            os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+            tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+            with open(tmp_file, "w") as out:
+                json.dump(self.instance_types, out, default=str)
+            os.replace(tmp_file, cache_file)
+        except OSError as e:
+            logging.warning(f"Could not cache AWS instance type catalog: {e}")
+
+    @staticmethod
+    def load(cache_file):
+        # Return the catalog saved in the cache file, or None if missing or outdated
+        if not os.path.isfile(cache_file) or time.time() - os.path.getmtime(cache_file) >= AmazonInstanceCatalog.CACHE_TTL:
+            return None
+
+        try:
+            with open(cache_file) as inp:
+                return AmazonInstanceCatalog(json.load(inp))
+        except (OSError, ValueError, KeyError) as e:
+            logging.warning(f"Could not read cached AWS instance type catalog: {e}")
+            return None
+
+    @staticmethod
+    def get_cache_file(region, zone, instance_type_filter=None):
+        # Catalogs depend on location (prices) and on the instance types allowed by the platform config
+        type_filter = "-".join(sorted(instance_type_filter)) if instance_type_filter else "all"
+        return os.path.join(CC_CACHE_DIR, "aws_instance_types", f"{region}_{zone}_{type_filter}.json")
+
+    @staticmethod
+    def __get_price_keys(preemptible):
+        # Price keys to search, in order of preference
+        return ["spotPrice", "price"] if preemptible else ["price"]
+
+    def __get_cheapest(self, nr_cpus, mem, price_key):
+        with self.lock:
+            if price_key not in self.index:
+                return None
+            vcpus, groups = self.index[price_key]
+
+            # Check every group with enough vCPUs, binary searching the memory within each group
+            selected = None
+            for group_idx in range(bisect.bisect_left(vcpus, nr_cpus), len(vcpus)):
+                mems, cheapest = groups[group_idx]
+                mem_idx = bisect.bisect_left(mems, mem * 1024)
+                if mem_idx == len(mems):
+                    continue
+
+                candidate = cheapest[mem_idx]
+                if selected is None or candidate[price_key] < selected[price_key]:
+                    selected = candidate
+
+            return selected
+
+    def __get_cheapest_per_family(self, nr_cpus, mem, price_key, scratch_space=0):
+        with self.lock:
+            selected = {}
+            for instance_type in self.instance_types:
+                if price_key not in instance_type or instance_type["VCpuInfo"]["DefaultVCpus"] < nr_cpus \
+                        or instance_type["MemoryInfo"]["SizeInMiB"] < mem * 1024:
+                    continue
+
+                if scratch_space and self.get_scratch_space(instance_type) < scratch_space:
+                    continue
+
+                family = self.get_family(instance_type["InstanceType"])
+                if family not in selected or instance_type[price_key] < selected[family][price_key]:
+                    selected[family] = instance_type
+
+            return selected
+
+    def __build_index(self):
+        # For every price key, group instance types by vCPUs (sorted) and, within each group, sort them by memory
+        # Each group stores, for every memory position, the cheapest type with at least that much memory
+        index = {}
+
+        with self.lock:
+            for price_key in ["price", "spotPrice"]:
+                by_vcpus = {}
+                for instance_type in self.instance_types:
+                    if price_key not in instance_type:
+                        continue
+                    vcpus = instance_type["VCpuInfo"]["DefaultVCpus"]
+                    by_vcpus.setdefault(vcpus, []).append(instance_type)
+
+                if not by_vcpus:
+                    continue
+
+                vcpus = sorted(by_vcpus)
+                groups = []
+                for vcpu_count in vcpus:
+                    group = sorted(by_vcpus[vcpu_count], key=lambda x: x["MemoryInfo"]["SizeInMiB"])
+                    mems = [x["MemoryInfo"]["SizeInMiB"] for x in group]
+
+                    # Cheapest type among the ones with at least as much memory (suffix minimum)
+                    cheapest = [None] * len(group)
+                    for i in reversed(range(len(group))):
+                        if i == len(group) - 1 or group[i][price_key] < cheapest[i + 1][price_key]:
+                            cheapest[i] = group[i]
+                        else:
+                            cheapest[i] = cheapest[i + 1]
+
+                    groups.append((mems, cheapest))
+
+                index[price_key] = (vcpus, groups)
+
+            self.index = index
@@ -17,9 +17,11 @@ from pkg_resources import resource_filename
 
 from threading import Thread
 
-from System.Platform import Process
+from System.Platform import Process, InstanceStatusPoller
 from System.Platform.Platform import CloudPlatform
 from System.Platform.Amazon import AmazonInstance, AmazonSpotInstance
+from System.Platform.Amazon.EnhancedEC2NodeDriver import EnhancedEC2NodeDriver
+from System.Platform.Amazon.AmazonInstanceCatalog import AmazonInstanceCatalog
 from requests.exceptions import BaseHTTPError
 
 from libcloud.compute.types import Provider
@@ -39,6 +41,9 @@ class AmazonPlatform(CloudPlatform):
         # Initialize libcloud driver
         self.driver = None
 
+        # Locations of the availability zones, indexed by zone name
+        self.locations = None
+
         # Initialize platform variables
         self.ssh_key_pair = None
         self.security_group = self.extra.get("security_group", None)
@@ -53,7 +58,8 @@ class AmazonPlatform(CloudPlatform):
         # Retrieve pricing info for AWS instances
         self.instance_type_list_filter = self.extra.get("instance_type_list", [])
         self.instance_type_list = None
-        self.__build_instance_type_list()
+        self.instance_catalog = None
+        self.__build_instance_catalog()
 
     def parse_identity_file_csv(self):
 
@@ -100,9 +106,8 @@ class AmazonPlatform(CloudPlatform):
         # Retry all HTTP requests
         os.environ['LIBCLOUD_RETRY_FAILED_HTTP_REQUESTS'] = "True"
 
-        # Initialize libcloud driver
-        driver_class = get_driver(Provider.EC2)
-        self.driver = driver_class(self.identity, self.secret, region=self.region)
+        # Initialize libcloud driver (shared by all instances)
+        self.driver = EnhancedEC2NodeDriver(self.identity, self.secret, region=self.region)
 
         # Add an SSH key pair for the current run
         unique_id = f"{self.name[:10]}-{self.generate_unique_id()}"
@@ -110,6 +115,12 @@ class AmazonPlatform(CloudPlatform):
         key_pub_path = f"{self.ssh_private_key}.pub"
         self.driver.import_key_pair_from_file(self.ssh_key_pair, key_pub_path)
 
+        # Poll the status of all instances of the run at once
+        self.status_poller = InstanceStatusPoller(self.__list_run_nodes)
+
+    def get_driver(self):
+        return self.driver
+
     def get_ssh_key_pair(self):
         return self.ssh_key_pair
 
@@ -117,7 +128,18 @@ class AmazonPlatform(CloudPlatform):
         return self.security_group
 
     def get_instance_type_list(self):
-        return self.instance_type_list
+        return self.instance_catalog.get_instance_types()
+
+    def get_location(self, zone):
+        # Return the libcloud location of an availability zone, listing the locations only once
+        with self.platform_lock:
+            if self.locations is None:
+                self.locations = {location.availability_zone.name: location
+                                  for location in self.driver.list_locations()}
+            return self.locations[zone]
+
+    def get_instance_catalog(self):
+        return self.instance_catalog
 
     def validate(self):
 
@@ -196,6 +218,11 @@ class AmazonPlatform(CloudPlatform):
         key_pair = self.__aws_request(self.driver.get_key_pair, self.ssh_key_pair)
         self.__aws_request(self.driver.delete_key_pair, key_pair)
 
+    def __list_run_nodes(self):
+        # List all instances launched with the key pair of the current run in a single call, indexed by ID
+        nodes = self.__aws_request(self.driver.list_nodes, ex_filters={"key-name": self.ssh_key_pair})
+        return {node.id: node for node in nodes}
+
     def __aws_request(self, method, *args, **kwargs):
         """ Function for handling AWS requests and rate limit issues """
         # retry command up to 8 times
@@ -227,6 +254,19 @@ class AmazonPlatform(CloudPlatform):
             return True
         return False
 
+    def __build_instance_catalog(self):
+        # Load the instance type catalog from the local cache if it is recent enough
+        cache_file = AmazonInstanceCatalog.get_cache_file(self.region, self.zone, self.instance_type_list_filter)
+        self.instance_catalog = AmazonInstanceCatalog.load(cache_file)
+        if self.instance_catalog is not None:
+            logging.debug(f"Loaded AWS instance type catalog from {cache_file}.")
+            return
+
+        # Otherwise, query AWS and cache the result for future runs
+        self.__build_instance_type_list()
+        self.instance_catalog = AmazonInstanceCatalog(self.instance_type_list)
+        self.instance_catalog.save(cache_file)
+
     def __build_instance_type_list(self):
         if not self.instance_type_list:
             ec2 = boto3.client('ec2', aws_access_key_id=self.identity, aws_secret_access_key=self.secret, region_name=self.region, config=self.boto_config)
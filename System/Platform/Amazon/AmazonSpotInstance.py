@@ -93,6 +93,7 @@ class AmazonSpotInstance(AmazonInstance):
         # Reset instance if its been destroyed/disappeared unexpectedly (i.e. preemption)
         if needs_reset and self.is_preemptible:
             logging.warning("(%s) Instance preempted! Resetting..." % self.name)
+            self.record_preemption()
             self.reset()
             return can_retry
 
@@ -113,6 +114,10 @@ class AmazonSpotInstance(AmazonInstance):
         if not self.is_preemptible:
             return
 
+        # Local scratch disks do not survive stopping the instance, so it needs to be recreated
+        if self.scratch_disks:
+            force_destroy = True
+
         # Incrementing the reset count and checking if it reached the threshold
         self.reset_count += 1
         logging.info(f"({self.name}) This is reset attempt #{self.reset_count}. Max retries is {self.max_resets} attempts.")
@@ -170,23 +175,16 @@ class AmazonSpotInstance(AmazonInstance):
         # Rerun all commands if the instance is not preemptible or was previously destroyed
         if not self.is_preemptible or force_destroy:
 
-            # Rerun all commands
-            for proc_name, proc_obj in list(self.processes.items()):
-
-                # Skip processes that do not need to be rerun
-                if proc_name in ["create", "destroy", "start", "stop"]:
-                    continue
-
-                # Run and wait for the command to finish
-                self.run(job_name=proc_name,
-                         cmd=proc_obj.get_command(),
-                         docker_image=proc_obj.get_docker_image(),
-                         docker_entrypoint=proc_obj.get_docker_entrypoint())
-                self.wait_process(proc_name)
+            # Rerun all commands, resuming from the last checkpoint saved outside of the instance
+            self.rerun_processes()
 
             # Exit function as the rest of the code is related to an instance that was not destroyed
             return
 
+        # Processes that failed after a checkpoint saved outside of the instance resume from that checkpoint
+        if self.resume_from_durable_checkpoint():
+            return
+
         # Identifying which process(es) need(s) to be recalled
         commands_to_run = list()
         checkpoint_queue = list()
@@ -255,7 +253,8 @@ class AmazonSpotInstance(AmazonInstance):
                 self.run(job_name=proc_name,
                          cmd=proc_obj.get_command(),
                          docker_image=proc_obj.get_docker_image(),
-                         docker_entrypoint=proc_obj.get_docker_entrypoint())
+                         docker_entrypoint=proc_obj.get_docker_entrypoint(),
+                         docker_container=proc_obj.get_docker_container())
                 self.wait_process(proc_name)
 
     def __remove_wrk_out_dir(self):
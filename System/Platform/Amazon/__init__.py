@@ -1,3 +1,4 @@
+from .AmazonInstanceCatalog import AmazonInstanceCatalog
 from .AmazonInstance import AmazonInstance
 from .AmazonPlatform import AmazonPlatform
 from .EnhancedEC2NodeDriver import EnhancedEC2NodeDriver
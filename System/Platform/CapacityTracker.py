@@ -0,0 +1,79 @@
+import time
+import random
+import logging
+import threading
+from collections import deque
+
+
+class CapacityTracker(object):
+    # Class for tracking preemptible capacity of a platform per zone and machine family
+    # Recent creation failures and preemptions are used for spreading new preemptible instances
+    # across the allowed zones and equivalent machine families, weighted by recent success and price
+
+    EVENTS = ["created", "creation_failures", "preemptions"]
+
+    def __init__(self, window=3600):
+
+        # Sliding window (sec) over which success rates are computed
+        self.window = window
+
+        # Recent events as (timestamp, zone, family, event type)
+        self.events = deque()
+
+        # Event counts over the whole run, indexed by zone
+        self.zone_totals = {}
+
+        self.lock = threading.Lock()
+
+    def record(self, zone, family, event):
+        # Record an event ('created', 'creation_failures' or 'preemptions') of an instance from a zone and family
+        with self.lock:
+            self.events.append((time.time(), zone, family, event))
+            totals = self.zone_totals.setdefault(zone, {x: 0 for x in self.EVENTS})
+            totals[event] += 1
+
+    def get_success_rate(self, zone, family=None):
+        # Fraction of recent instances that were created and not preempted (1 = no recent failures)
+        with self.lock:
+            self.__prune()
+            counts = {x: 0 for x in self.EVENTS}
+            for _, event_zone, event_family, event in self.events:
+                if event_zone == zone and (family is None or event_family == family):
+                    counts[event] += 1
+
+        # Smooth the rate so that zones and families without history are still tried
+        failures = counts["creation_failures"] + counts["preemptions"]
+        return (counts["created"] + 1) / (counts["created"] + failures + 2)
+
+    def choose(self, options):
+        # Randomly choose one of the options (dictionaries with 'zone', 'family' and 'price' keys)
+        # with a probability growing with its recent success rate and inversely proportional to its price
+        if len(options) == 1:
+            return options[0]
+
+        cheapest = min(option["price"] for option in options) or 1
+        weights = []
+        for option in options:
+            price_ratio = cheapest / option["price"] if option["price"] else 1
+            weights.append(self.get_success_rate(option["zone"], option["family"]) ** 2 * price_ratio)
+
+        option = random.choices(options, weights=weights)[0]
+        logging.debug(f"Selected zone {option['zone']} and machine family {option['family']} "
+                      f"out of {len(options)} preemptible options.")
+        return option
+
+    def get_zone_stats(self):
+        # Return event counts over the whole run and recent success rate of each zone
+        with self.lock:
+            zones = sorted(self.zone_totals)
+            stats = {zone: dict(self.zone_totals[zone]) for zone in zones}
+
+        for zone in zones:
+            stats[zone]["recent_success_rate"] = round(self.get_success_rate(zone), 4)
+        return stats
+
+    def __prune(self):
+        # Remove events older than the sliding window
+        oldest = time.time() - self.window
+        while self.events and self.events[0][0] < oldest:
+            self.events.popleft()
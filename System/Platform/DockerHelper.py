@@ -7,10 +7,16 @@ from .DockerImage import DockerImage
 class DockerHelper(object):
     # Class designed to facilitate remote file manipulations for a processor
 
-    def __init__(self, proc):
+    def __init__(self, proc, validation_cache=None):
         self.proc = proc
 
-    def pull(self, image_name, job_name=None, log=True, **kwargs):
+        # Optional cache of image digests/sizes from previous runs
+        self.validation_cache = validation_cache
+
+        # Image digests resolved during the current run
+        self.digests = {}
+
+    def pull(self, image_name, job_name=None, log=True, timed=False, **kwargs):
         # Pull docker image on local processor
         cmd = "sudo docker pull %s" % image_name
 
@@ -19,10 +25,59 @@ class DockerHelper(object):
         # Optionally add logging
         cmd = "%s !LOG3!" % cmd if log else cmd
 
+        # Optionally print timestamps around the pull so that its duration can be parsed from stdout
+        if timed:
+            cmd = "date +%%s.%%N && %s && date +%%s.%%N" % cmd
+
+        # Run command and return job name
+        self.proc.run(job_name, cmd, **kwargs)
+        return job_name
+
+    @staticmethod
+    def get_registry_mirror_cmd(registry_mirror):
+        # Command adding a pull-through mirror for Docker Hub images to the docker daemon settings
+        # Existing settings are merged with jq (or python3 if jq is missing) and the daemon is only restarted
+        # if the mirror was not configured yet. The command fails if the settings cannot be written or docker does not restart
+        config_path = "/etc/docker/daemon.json"
+        tmp_path = "/tmp/daemon.json"
+        merge_jq = f"sudo jq --arg m {registry_mirror} '.\"registry-mirrors\" = ((.\"registry-mirrors\" // []) + [$m])' {config_path} > {tmp_path}"
+        merge_python = f"sudo python3 -c 'import json; c = json.load(open(\"{config_path}\")); " \
+                       f"c.setdefault(\"registry-mirrors\", []).append(\"{registry_mirror}\"); " \
+                       f"json.dump(c, open(\"{tmp_path}\", \"w\"), indent=4)'"
+
+        return f"if sudo grep -qF '\"{registry_mirror}\"' {config_path} 2>/dev/null; then true; " \
+               f"elif [ ! -s {config_path} ]; then sudo mkdir -p /etc/docker && " \
+               f"echo '{{\"registry-mirrors\": [\"{registry_mirror}\"]}}' | sudo tee {config_path} > /dev/null && sudo systemctl restart docker; " \
+               f"elif command -v jq > /dev/null; then {merge_jq} && sudo mv {tmp_path} {config_path} && sudo systemctl restart docker; " \
+               f"elif command -v python3 > /dev/null; then {merge_python} && sudo mv {tmp_path} {config_path} && sudo systemctl restart docker; " \
+               f"else echo \"Cannot update {config_path}: neither jq nor python3 is installed\" >&2; false; fi"
+
+    def start_container(self, image_name, container_name, job_name=None, log=True, **kwargs):
+        # Start a long-lived container with the workspace mounted, so commands can be run in it with 'docker exec'
+        # Any container left with the same name (e.g. from a previous run of the job) is replaced
+        cmd = f"sudo docker rm -f {container_name} >/dev/null 2>&1 ; " \
+              f"sudo docker run -d --name {container_name} --restart unless-stopped --entrypoint '/bin/bash' " \
+              f"--user root -v /home:/home {self.proc.generate_docker_env()} -v {self.proc.wrk_dir}:{self.proc.wrk_dir} " \
+              f"{image_name} -c 'sleep infinity'"
+
+        job_name = "start_container_%s" % container_name if job_name is None else job_name
+
+        # Optionally add logging
+        cmd = "%s !LOG3!" % cmd if log else cmd
+
         # Run command and return job name
         self.proc.run(job_name, cmd, **kwargs)
         return job_name
 
+    @staticmethod
+    def get_pull_time(pull_output):
+        # Return the duration (sec) of a timed pull from its stdout, or None if it cannot be determined
+        try:
+            timestamps = [float(x) for x in pull_output.split("\n") if x.strip() != ""]
+            return timestamps[-1] - timestamps[0]
+        except (ValueError, IndexError):
+            return None
+
     def image_exists(self, image_name, job_name=None, **kwargs):
         # Return true if file exists, false otherwise
 
@@ -31,6 +86,10 @@ class DockerHelper(object):
 
         # Wait for cmd to finish and get output
         try:
+            # Skip registry calls if the image is unchanged since it was last validated
+            if self.get_cached_image_size(image_name) is not None:
+                return True
+
             result = self.get_docker_image_info(image_name)
             if result and 'id' in result:
                 return True
@@ -56,16 +115,22 @@ class DockerHelper(object):
     def get_image_size(self, image_name, job_name=None, **kwargs):
         # Return file size in gigabytes
         try:
+            # Skip registry calls if the image is unchanged since it was last validated
+            cached_size = self.get_cached_image_size(image_name)
+            if cached_size is not None:
+                logging.debug("Docker image %s is unchanged since last validation." % image_name)
+                return cached_size
+
             result = self.get_docker_image_info(image_name)
             if result and 'full_size' in result:
                 # return the bytes converted to GB
                 # the api returns the compressed size of the image so we'll multiply by 4 to be safe
-                return int(result['full_size'])*4/(1024**3.0)
+                return self.__cache_image_size(image_name, int(result['full_size'])*4/(1024**3.0))
 
             # Size will be None if get_size() cannot be determine the image size.
             size = DockerImage(image_name).get_size()
             if size:
-                return int(size)*4/(1024**3.0)
+                return self.__cache_image_size(image_name, int(size)*4/(1024**3.0))
 
             if self.proc:
                 # this should handle everything that doesn't exist on docker hub ( way less efficient )
@@ -91,6 +156,35 @@ class DockerHelper(object):
                 logging.error("Received the following msg:\n%s" % e)
             raise
 
+    def get_image_digest(self, image_name):
+        # Return the registry digest of an image, or None if it cannot be determined
+        if image_name not in self.digests:
+            try:
+                self.digests[image_name] = DockerImage(image_name).digest
+            except BaseException as e:
+                logging.debug("Unable to determine digest of docker image %s: %s" % (image_name, e))
+                self.digests[image_name] = None
+        return self.digests[image_name]
+
+    def get_cached_image_size(self, image_name):
+        # Return the cached image size (GB) if the image digest is unchanged, otherwise None
+        if self.validation_cache is None:
+            return None
+
+        digest = self.get_image_digest(image_name)
+        if digest is None:
+            return None
+
+        return self.validation_cache.get_docker_size(image_name, digest)
+
+    def __cache_image_size(self, image_name, size):
+        # Record image size in the validation cache and return it
+        if self.validation_cache is not None:
+            digest = self.get_image_digest(image_name)
+            if digest is not None:
+                self.validation_cache.set_docker(image_name, digest, size)
+        return size
+
     def get_docker_image_info(self, image_name):
         docker_image_split = image_name.rsplit(":", 1)
         image = docker_image_split[0]
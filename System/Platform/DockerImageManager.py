@@ -0,0 +1,69 @@
+import logging
+import threading
+
+
+class DockerImageManager(object):
+    # Class for resolving the docker images used by a pipeline once and tracking how they are pulled by tasks
+
+    def __init__(self, docker_helper=None):
+
+        # Docker helper used to resolve image digests
+        self.docker_helper = docker_helper
+
+        # Metadata of resolved images, indexed by image name
+        self.images = {}
+
+        # Pull times (sec) of each task, indexed by task id
+        self.pull_times = {}
+
+        self.lock = threading.Lock()
+
+    def set_docker_helper(self, docker_helper):
+        self.docker_helper = docker_helper
+
+    def resolve(self, graph, resource_kit):
+        # Record digest and size of every docker image used by the graph
+
+        # Obtain docker images used by at least one task
+        docker_ids = set()
+        for task in graph.get_tasks().values():
+            if task.get_docker_image_id() is not None:
+                docker_ids.add(task.get_docker_image_id())
+
+        for docker_id in sorted(docker_ids):
+            docker_image = resource_kit.get_docker_images(docker_id)
+            image_name = docker_image.get_image_name()
+
+            # Digests have already been resolved by the docker helper during input validation
+            digest = None if self.docker_helper is None else self.docker_helper.get_image_digest(image_name)
+            docker_image.set_digest(digest)
+
+            with self.lock:
+                self.images[image_name] = {
+                    "docker_id": docker_id,
+                    "digest": digest,
+                    "size": docker_image.get_size()
+                }
+            logging.debug(f"Resolved docker image {image_name}. Digest: {digest}, Size: {docker_image.get_size()}GB")
+
+    def record_pull_time(self, task_id, image_name, pull_time):
+        with self.lock:
+            self.pull_times[task_id] = {"image": image_name, "pull_time": pull_time}
+
+    def get_pull_time(self, task_id):
+        with self.lock:
+            if task_id not in self.pull_times:
+                return None
+            return self.pull_times[task_id]["pull_time"]
+
+    def get_report(self):
+        # Return summary of images used by the pipeline and the time spent pulling them
+        with self.lock:
+            report = {}
+            for image_name, image_data in self.images.items():
+                pull_times = [x["pull_time"] for x in self.pull_times.values()
+                              if x["image"] == image_name and x["pull_time"] is not None]
+                report[image_name] = dict(image_data)
+                report[image_name]["num_pulls"] = len(pull_times)
+                report[image_name]["total_pull_time"] = sum(pull_times)
+            return report
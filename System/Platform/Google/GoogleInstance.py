@@ -3,13 +3,12 @@ import requests
 import time
 import os
 
-from libcloud.compute.types import Provider
-from libcloud.compute.providers import get_driver
 from libcloud.common.google import ResourceNotFoundError
 from libcloud.common.types import LibcloudError
 
 from System.Platform.Instance import CloudInstance
 from System.Platform import Process
+from System.Platform.Google import GooglePricing, GoogleMachineOptimizer
 
 
 class GoogleInstance(CloudInstance):
@@ -17,6 +16,12 @@ class GoogleInstance(CloudInstance):
     gcp_billing_api_url = "https://cloudbilling.googleapis.com/v1/services/"
     nanos_conversion_rate = .000000001  # 10^-9
 
+    # Label key identifying the run an instance belongs to
+    RUN_LABEL_KEY = "cc-run"
+
+    # Local SSDs attached through the NVMe interface
+    SCRATCH_DEVICES = "/dev/disk/by-id/google-local-nvme-ssd-*"
+
     def __init__(self, name, nr_cpus, mem, disk_space, **kwargs):
 
         super(GoogleInstance, self).__init__(name, nr_cpus, mem, disk_space, **kwargs)
@@ -27,11 +32,8 @@ class GoogleInstance(CloudInstance):
         self.api_key = ''
         self.is_preemptible = False
 
-        # Create libcloud driver
-        driver_class = get_driver(Provider.GCE)
-        self.driver = driver_class(self.service_account, self.identity,
-                                   datacenter=self.zone,
-                                   project=self.project_id)
+        # Use the libcloud driver of the platform
+        self.driver = self.platform.get_driver()
 
         # Initialize the node variable
         self.node = None
@@ -39,15 +41,30 @@ class GoogleInstance(CloudInstance):
         # check for force_standard
         self.force_standard = kwargs.get("force_standard", 'false')
 
+        # Optional offline snapshot of the price list
+        self.price_snapshot = kwargs.get("gcp_price_snapshot", None)
+
+        # Prices of the created machine shape are frozen once obtained (compute prices indexed by preemptibility)
+        # They are reset whenever the instance is created again, as its machine shape may change
+        self.compute_prices = {}
+        self.storage_price = None
+
+        # Whether the task running on the instance is IO intensive (selects faster disk types)
+        self.io_intensive = kwargs.get("io_intensive", False)
+
+        # Machine type and disk type selected at creation (None = custom machine with standard disk)
+        self.machine_shape = None
+
         # Set AWS credentials as SSH options
         self.set_ssh_option("SendEnv", "AWS_ACCESS_KEY_ID")
         self.set_ssh_option("SendEnv", "AWS_SECRET_ACCESS_KEY")
 
     def create_instance(self):
 
-        # Generate NodeSize for instance
-        size_name = f"custom-{int(self.nr_cpus)}-{int(self.mem*1024)}"
-        node_size = self.driver.ex_get_size(size_name)
+        # Create instance
+        if self.name.startswith("helper-") or self.force_standard:
+            # don't want helper instances to be preemptible
+            self.is_preemptible = False
 
         # Read the public key content
         with open(f"{self.ssh_private_key}.pub") as inp:
@@ -66,46 +83,81 @@ class GoogleInstance(CloudInstance):
             "ssh-keys": f"{self.ssh_connection_user}: {ssh_key_content} {self.ssh_connection_user}"
         }
 
-        # Generate the boot disk information
-        disks = [
-            {
-                "boot": True,
-                "initializeParams": {
-                    "sourceImage" : f"global/images/{self.disk_image.name}",
-                    "diskSizeGb"  : str(self.disk_space)
-                },
-                "autoDelete": True
-            }
-        ]
-
-        # Create instance
-        if self.name.startswith("helper-") or self.force_standard:
-            # don't want helper instances to be preemptible
-            self.is_preemptible = False
+        # Machine families that failed to be created, skipped by the next attempts
+        failed_families = set()
 
         creation_attempts = 1
         while not self.node and creation_attempts < 4:
+
+            # Select the machine shape and zone of the instance (again after a failure, as capacity may be missing)
+            self.machine_shape = self.__select_machine_shape(failed_families)
+
+            # Generate NodeSize for instance
+            if self.machine_shape is not None:
+                size_name = self.machine_shape["machine_type"]
+            else:
+                size_name = f"custom-{int(self.nr_cpus)}-{int(self.mem*1024)}"
+
+            # Generate the boot disk information
+            disks = [
+                {
+                    "boot": True,
+                    "initializeParams": {
+                        "sourceImage" : f"global/images/{self.disk_image.name}",
+                        "diskSizeGb"  : str(self.disk_space)
+                    },
+                    "autoDelete": True
+                }
+            ]
+
+            # Use the selected disk type
+            if self.machine_shape is not None:
+                disks[0]["initializeParams"]["diskType"] = f"zones/{self.zone}/diskTypes/{self.machine_shape['disk_type']}"
+
+            # Attach local SSDs for the scratch space
+            self.scratch_disks = GoogleMachineOptimizer.get_local_ssd_count(self.scratch_space)
+            for _ in range(self.scratch_disks):
+                disks.append({
+                    "type": "SCRATCH",
+                    "interface": "NVME",
+                    "initializeParams": {
+                        "diskType": f"zones/{self.zone}/diskTypes/local-ssd"
+                    },
+                    "autoDelete": True
+                })
+
             try:
                 creation_attempts += 1
+                node_size = self.driver.ex_get_size(size_name, zone=self.zone)
                 self.node = self.driver.create_node(name=self.name,
                                                     image=self.disk_image,
                                                     size=node_size,
+                                                    location=self.zone,
                                                     ex_disks_gce_struct=disks,
                                                     ex_service_accounts=sa_scope,
                                                     ex_preemptible=self.is_preemptible,
-                                                    ex_metadata=metadata)
+                                                    ex_metadata=metadata,
+                                                    ex_labels={self.RUN_LABEL_KEY: self.platform.get_run_label()})
+                self.__record_capacity_event("created")
             except Exception as e:
                 exception_string = str(e)
                 if 'alreadyExists' in exception_string:
                     logging.warning(f"({self.name}) Instance already exists. Getting status...")
                     self.get_status(log_status=True)
                 else:
+                    self.__record_capacity_event("creation_failures")
+                    failed_families.add(self.get_machine_family())
                     sleep_time = self.get_api_sleep(creation_attempts-1)
                     logging.warning(f"({self.name}) Failed to create instance due to: {str(e)}. Waiting {sleep_time} seconds before retrying.")
                     time.sleep(sleep_time)
 
         if not self.node:
             raise RuntimeError(f"({self.name}) Failed to create instance!")
+
+        # Price the machine shape that was actually created, not a shape selected by a previous creation
+        self.compute_prices = {}
+        self.storage_price = None
+
         # Return the external IP from node
         return self.node.public_ips[0]
 
@@ -169,10 +221,23 @@ class GoogleInstance(CloudInstance):
 
     def get_status(self, log_status=False):
 
-        try:
-            self.node = self.driver.ex_get_node(self.name)
-        except ResourceNotFoundError:
-            return CloudInstance.OFF
+        # Obtain the node from the status listing shared by all instances
+        node = None
+        status_poller = self.platform.get_status_poller()
+        if status_poller is not None:
+            try:
+                node = status_poller.get_node(self.name)
+            except RuntimeError as e:
+                logging.debug(f"({self.name}) {e} Querying instance directly.")
+
+        # Query the instance directly if it was not listed
+        if node is None:
+            try:
+                node = self.driver.ex_get_node(self.name, zone=self.zone)
+            except ResourceNotFoundError:
+                return CloudInstance.OFF
+
+        self.node = node
 
         # Define mapping between the cloud status and the current class status
         status_map = {
@@ -191,12 +256,14 @@ class GoogleInstance(CloudInstance):
         return status_map[self.node.extra["status"]]
 
     def get_compute_price(self):
-        price = self.gcp_compute_price_old_json()
-        return price
+        if self.is_preemptible not in self.compute_prices:
+            self.compute_prices[self.is_preemptible] = self.gcp_compute_price_old_json()
+        return self.compute_prices[self.is_preemptible]
 
     def get_storage_price(self):
-        price = self.gcp_storage_price_old_json()
-        return price
+        if self.storage_price is None:
+            self.storage_price = self.gcp_storage_price_old_json()
+        return self.storage_price
 
     def generate_docker_env(self):
         env_vars = [
@@ -248,29 +315,66 @@ class GoogleInstance(CloudInstance):
         # return sum of compute and ram costs
         return compute_cost + ram_cost
 
-    def gcp_compute_price_old_json(self):
-        compute_cost = 0
-        try:
-            price_json_url = "https://cloudpricingcalculator.appspot.com/static/data/pricelist.json"
-
-            prices = requests.get(price_json_url).json()["gcp_price_list"]
+    def get_machine_family(self):
+        # Custom machines without an optimized shape belong to the N1 family
+        return "n1" if self.machine_shape is None else self.machine_shape["family"]
 
-            # Get price of CPUs, mem for custom instance
-            cpu_price_key = "CP-COMPUTEENGINE-CUSTOM-VM-CORE"
-            mem_price_key = "CP-COMPUTEENGINE-CUSTOM-VM-RAM"
-            if self.is_preemptible:
-                cpu_price_key += "-PREEMPTIBLE"
-                mem_price_key += "-PREEMPTIBLE"
+    def record_preemption(self):
+        self.__record_capacity_event("preemptions")
 
-            # calculate hourly price for all CPUs and memory
-            compute_cost += prices[cpu_price_key][self.region] * self.nr_cpus + prices[mem_price_key][self.region] * self.mem
+    def __select_machine_shape(self, excluded_families=None):
+        # Return the cheapest machine shape offered in the zone, or None to fall back to a custom machine
+        # if prices are unavailable or all optimized machine families failed to be created
+        # Preemptible instances are spread across the allowed zones and equivalent machine families instead
+        optimizer = GoogleMachineOptimizer(self.region, snapshot=self.price_snapshot)
+        if not self.is_preemptible:
+            try:
+                return optimizer.optimize(self.nr_cpus, self.mem, self.disk_space, io_intensive=self.io_intensive,
+                                          scratch_space=self.scratch_space,
+                                          zone_types=self.platform.get_zone_machine_types(self.zone),
+                                          excluded_families=excluded_families)
+            except BaseException as e:
+                logging.warning(f"({self.name}) Could not optimize machine type: {e}. Using a custom machine type.")
+                return None
+
+        # Weight each zone and machine family by its recent preemptible capacity and its price
+        options = []
+        for zone in self.platform.get_preemptible_zones():
+            try:
+                shapes = optimizer.get_family_shapes(self.nr_cpus, self.mem, self.disk_space, preemptible=True,
+                                                     io_intensive=self.io_intensive, scratch_space=self.scratch_space,
+                                                     zone_types=self.platform.get_zone_machine_types(zone),
+                                                     excluded_families=excluded_families)
+            except BaseException as e:
+                logging.warning(f"({self.name}) Could not optimize machine type in zone '{zone}': {e}. "
+                                f"Using a custom machine type.")
+                shapes = [None]
+
+            for shape in shapes:
+                options.append({
+                    "zone": zone,
+                    "family": "n1" if shape is None else shape["family"],
+                    "price": 0 if shape is None else shape["compute_price"] + shape["storage_price"],
+                    "shape": shape
+                })
+
+        option = self.platform.get_capacity_tracker().choose(options)
+        self.zone = option["zone"]
+        return option["shape"]
+
+    def __record_capacity_event(self, event):
+        # Only the capacity of preemptible instances is tracked
+        if self.is_preemptible:
+            self.platform.get_capacity_tracker().record(self.zone, self.get_machine_family(), event)
 
-        except BaseException as e:
-            if str(e) != "":
-                logging.error("Could not obtain instance prices. The following error appeared: %s." % e)
-            raise
+    def gcp_compute_price_old_json(self):
+        # Hourly price of the selected machine shape
+        if self.machine_shape is not None:
+            return self.machine_shape["compute_price"]
 
-        return compute_cost
+        # Hourly price for all CPUs and memory of the custom instance
+        return GooglePricing.get_compute_price("custom", self.region, self.nr_cpus, self.mem,
+                                               preemptible=self.is_preemptible, snapshot=self.price_snapshot)
 
     def gcp_storage_price_new_api(self):
         storage_cost = 0
@@ -296,18 +400,7 @@ class GoogleInstance(CloudInstance):
         return storage_cost
 
     def gcp_storage_price_old_json(self):
-        storage_cost = 0
-        try:
-            price_json_url = "https://cloudpricingcalculator.appspot.com/static/data/pricelist.json"
-
-            prices = requests.get(price_json_url).json()["gcp_price_list"]
-
-            # Calculate hourly rate for all disk space
-            storage_cost += (prices["CP-COMPUTEENGINE-STORAGE-PD-CAPACITY"][self.region] / 730) * self.disk_space
-
-        except BaseException as e:
-            if str(e) != "":
-                logging.error("Could not obtain instance prices. The following error appeared: %s." % e)
-            raise
-
-        return storage_cost
+        # Hourly price for all disk space
+        if self.machine_shape is not None:
+            return self.machine_shape["storage_price"]
+        return GooglePricing.get_storage_price(self.region, self.disk_space, snapshot=self.price_snapshot)
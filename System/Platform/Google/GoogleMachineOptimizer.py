@@ -0,0 +1,218 @@
+import math
+import logging
+
+from System.Platform.Google import GooglePricing
+
+
+class GoogleMachineOptimizer(object):
+    # Selects the cheapest machine type and boot disk type able to fit a resource request
+    # Custom (with or without extended memory) and predefined machine types are compared using the cached price catalog
+
+    # Constraints of custom machine families: (size name prefix, vCPU step, min vCPUs, max vCPUs,
+    # min GB per vCPU, max GB per vCPU, extended memory support)
+    CUSTOM_FAMILIES = {
+        "custom":       ("custom",      2, 1, 96,  0.9, 6.5, True),
+        "n2-custom":    ("n2-custom",   2, 2, 80,  0.5, 8.0, True),
+        "n2d-custom":   ("n2d-custom",  2, 2, 96,  0.5, 8.0, True),
+        "e2-custom":    ("e2-custom",   2, 2, 32,  0.5, 8.0, False)
+    }
+
+    # Maximum memory (GB) of a custom machine with extended memory
+    MAX_EXTENDED_MEM = 624
+
+    # Predefined machine type families considered for the request
+    PREDEFINED_FAMILIES = ["n1", "n2", "n2d", "e2"]
+
+    # Boot disk types considered depending on whether the task is IO intensive
+    DISK_TYPES = {
+        False: ["pd-standard"],
+        True: ["pd-balanced", "pd-ssd"]
+    }
+
+    # Local SSD disk size (GB), allowed numbers of disks per instance and machine families supporting them
+    LOCAL_SSD_SIZE = 375
+    LOCAL_SSD_COUNTS = [1, 2, 4, 8, 16, 24]
+    LOCAL_SSD_FAMILIES = ["n1", "n2", "n2d"]
+
+    def __init__(self, region, snapshot=None):
+        self.region = region
+        self.snapshot = snapshot
+
+    def optimize(self, nr_cpus, mem, disk_space, preemptible=False, io_intensive=False, scratch_space=0,
+                 zone_types=None, excluded_families=None):
+        # Return the cheapest machine shape as a dictionary with keys:
+        # machine_type, family, nr_cpus, mem, disk_type, local_ssds, compute_price and storage_price (hourly prices)
+
+        # Cheapest machine type, preferring the custom N1 machine (the default) in case of ties
+        shapes = self.get_family_shapes(nr_cpus, mem, disk_space, preemptible, io_intensive, scratch_space,
+                                        zone_types=zone_types, excluded_families=excluded_families)
+        shape = min(shapes, key=lambda x: (x["compute_price"], not x["machine_type"].startswith("custom-")))
+
+        logging.debug(f"Selected machine type {shape['machine_type']} with {shape['disk_type']} disk for a request of "
+                      f"{nr_cpus} vCPUs, {mem}GB memory and {disk_space}GB disk "
+                      f"(${shape['compute_price'] + shape['storage_price']:.4f}/hour).")
+
+        return shape
+
+    def get_family_shapes(self, nr_cpus, mem, disk_space, preemptible=False, io_intensive=False, scratch_space=0,
+                          zone_types=None, excluded_families=None):
+        # Return the cheapest machine shape of each machine family (e.g. custom and predefined N1 machines are
+        # equivalent) able to fit the request, all of them using the cheapest boot disk type for the IO profile
+        # Requests for scratch space (GB) are limited to families supporting local SSDs
+        # zone_types limits the candidates to the machine types offered in the zone (None = no zone information)
+        # and excluded_families drops the families that already failed to be created
+
+        candidates = self.get_custom_candidates(nr_cpus, mem, preemptible) + \
+            self.get_predefined_candidates(nr_cpus, mem, preemptible)
+
+        if zone_types is not None:
+            candidates = [x for x in candidates if self.is_available(x["machine_type"], zone_types)]
+
+        if excluded_families:
+            candidates = [x for x in candidates if self.get_family(x["machine_type"]) not in excluded_families]
+
+        if scratch_space:
+            candidates = [x for x in candidates if self.get_family(x["machine_type"]) in self.LOCAL_SSD_FAMILIES]
+
+        if not candidates:
+            raise RuntimeError(f"No machine type with pricing information can fit {nr_cpus} vCPUs and {mem}GB memory "
+                               f"in region '{self.region}'!")
+
+        # Cheapest boot disk type for the IO profile
+        disk_type, storage_price = self.get_disk(disk_space, io_intensive)
+
+        # Local SSDs providing the scratch space
+        local_ssds = self.get_local_ssd_count(scratch_space)
+        if local_ssds:
+            try:
+                storage_price += GooglePricing.get_storage_price(self.region, local_ssds * self.LOCAL_SSD_SIZE,
+                                                                 "local-ssd", snapshot=self.snapshot)
+            except RuntimeError as e:
+                logging.warning(f"Local SSD price is not included in the instance price: {e}")
+
+        shapes = {}
+        for shape in sorted(candidates, key=lambda x: (x["compute_price"], not x["machine_type"].startswith("custom-"))):
+            family = self.get_family(shape["machine_type"])
+            if family not in shapes:
+                shape["family"] = family
+                shape["disk_type"] = disk_type
+                shape["storage_price"] = storage_price
+                shape["local_ssds"] = local_ssds
+                shapes[family] = shape
+
+        return list(shapes.values())
+
+    @classmethod
+    def get_local_ssd_count(cls, scratch_space):
+        # Number of local SSDs providing at least scratch_space GB (0 if no scratch space is needed)
+        if not scratch_space:
+            return 0
+
+        for count in cls.LOCAL_SSD_COUNTS:
+            if count * cls.LOCAL_SSD_SIZE >= scratch_space:
+                return count
+        return cls.LOCAL_SSD_COUNTS[-1]
+
+    @classmethod
+    def is_available(cls, machine_type, zone_types):
+        # Predefined machine types must be listed in the zone, custom machine types are not listed
+        # and are available if their family offers predefined machine types in the zone
+        if machine_type not in zone_types and "custom" not in machine_type:
+            return False
+        family = cls.get_family(machine_type)
+        return any(cls.get_family(x) == family for x in zone_types)
+
+    @staticmethod
+    def get_family(machine_type):
+        # Custom N1 machine types have no family prefix
+        family = machine_type.split("-")[0]
+        return "n1" if family == "custom" else family
+
+    def get_custom_candidates(self, nr_cpus, mem, preemptible=False):
+        # Return shapes of every custom family able to fit the request
+        candidates = []
+        for family, constraints in self.CUSTOM_FAMILIES.items():
+            prices = GooglePricing.get_family_prices(family, self.region, preemptible, snapshot=self.snapshot)
+            if "core" not in prices or "ram" not in prices:
+                continue
+
+            prefix, cpu_step, min_cpus, max_cpus, min_ratio, max_ratio, extended = constraints
+
+            # Round vCPUs to an allowed count
+            cpus = max(min_cpus, nr_cpus)
+            if cpus > 1:
+                cpus = int(math.ceil(cpus / cpu_step) * cpu_step)
+
+            # Option 1: add vCPUs until the memory fits in the allowed ratio
+            std_cpus = max(cpus, self.__round_cpus(mem / max_ratio, cpu_step))
+            if std_cpus <= max_cpus:
+                std_mem = self.__round_mem(max(mem, std_cpus * min_ratio))
+                candidates.append(self.__custom_shape(prefix, std_cpus, std_mem, 0, prices))
+
+            # Option 2: keep the vCPUs and pay for the extra memory as extended memory
+            if extended and "extended-ram" in prices and cpus <= max_cpus and mem > cpus * max_ratio \
+                    and mem <= self.MAX_EXTENDED_MEM:
+                base_mem = self.__round_mem(cpus * max_ratio, round_up=False)
+                ext_mem = self.__round_mem(mem - base_mem)
+                candidates.append(self.__custom_shape(prefix, cpus, base_mem, ext_mem, prices))
+
+        return candidates
+
+    def get_predefined_candidates(self, nr_cpus, mem, preemptible=False):
+        # Return predefined machine types able to fit the request
+        candidates = []
+        for machine_type in GooglePricing.get_predefined_types(self.region, preemptible, snapshot=self.snapshot):
+            if machine_type["name"].split("-")[0] not in self.PREDEFINED_FAMILIES:
+                continue
+
+            if machine_type["cores"] >= nr_cpus and machine_type["memory"] >= mem:
+                candidates.append({
+                    "machine_type": machine_type["name"],
+                    "nr_cpus": machine_type["cores"],
+                    "mem": machine_type["memory"],
+                    "compute_price": machine_type["price"]
+                })
+
+        return candidates
+
+    def get_disk(self, disk_space, io_intensive=False):
+        # Return cheapest disk type for the IO profile and its hourly price
+        disks = []
+        for disk_type in self.DISK_TYPES[bool(io_intensive)]:
+            try:
+                disks.append((disk_type, GooglePricing.get_storage_price(self.region, disk_space, disk_type,
+                                                                          snapshot=self.snapshot)))
+            except RuntimeError:
+                continue
+
+        if not disks:
+            raise RuntimeError(f"No disk type with pricing information available in region '{self.region}'!")
+
+        return min(disks, key=lambda x: x[1])
+
+    @staticmethod
+    def __custom_shape(prefix, cpus, mem, ext_mem, prices):
+        # Custom machine type names have their memory in MB and an '-ext' suffix when using extended memory
+        total_mem = mem + ext_mem
+        machine_type = f"{prefix}-{int(cpus)}-{int(total_mem * 1024)}"
+        if ext_mem > 0:
+            machine_type += "-ext"
+
+        return {
+            "machine_type": machine_type,
+            "nr_cpus": cpus,
+            "mem": total_mem,
+            "compute_price": prices["core"] * cpus + prices["ram"] * mem + prices.get("extended-ram", 0) * ext_mem
+        }
+
+    @staticmethod
+    def __round_cpus(cpus, cpu_step):
+        cpus = max(1, int(math.ceil(cpus)))
+        return cpus if cpus == 1 else int(math.ceil(cpus / cpu_step) * cpu_step)
+
+    @staticmethod
+    def __round_mem(mem, round_up=True):
+        # Custom machine memory must be a multiple of 256MB
+        if round_up:
+            return math.ceil(mem * 4) / 4.0
+        return math.floor(mem * 4) / 4.0
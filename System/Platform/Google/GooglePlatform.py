@@ -1,14 +1,15 @@
 import math
 import os
+import re
 import logging
 import base64
 import random
 import json
 import csv
-from threading import Thread
+from threading import Thread, Lock
 
 from System import CC_MAIN_DIR
-from System.Platform import Process
+from System.Platform import Process, InstanceStatusPoller
 from System.Platform.Platform import CloudPlatform
 from System.Platform.Google import GoogleInstance, GooglePreemptibleInstance
 
@@ -34,6 +35,13 @@ class GooglePlatform(CloudPlatform):
         # Initialize libcloud driver
         self.driver = None
 
+        # Label value attached to all instances of the current run
+        self.run_label = f"{re.sub(r'[^a-z0-9_-]', '-', self.name.lower())[:50]}-{self.generate_unique_id()}"
+
+        # Names of the machine types offered in each zone, listed once per zone
+        self.zone_machine_types = {}
+        self.zone_machine_types_lock = Lock()
+
     def parse_service_account_json(self):
 
         # Parse service account file
@@ -95,12 +103,32 @@ class GooglePlatform(CloudPlatform):
         else:
             os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = os.path.join(CC_MAIN_DIR, self.identity)
 
-        # Initialize libcloud driver
+        # Initialize libcloud driver (shared by all instances)
         driver_class = get_driver(Provider.GCE)
         self.driver = driver_class(self.service_account, self.identity,
                                    datacenter=self.zone,
                                    project=self.project_id)
 
+        # Poll the status of all instances of the run at once
+        self.status_poller = InstanceStatusPoller(self.__list_run_nodes)
+
+    def get_driver(self):
+        return self.driver
+
+    def get_run_label(self):
+        return self.run_label
+
+    def get_zone_machine_types(self, zone):
+        # Return the names of the machine types offered in a zone (None if they could not be listed)
+        with self.zone_machine_types_lock:
+            if zone not in self.zone_machine_types:
+                try:
+                    self.zone_machine_types[zone] = {size.name for size in self.driver.list_sizes(zone)}
+                except BaseException as e:
+                    logging.warning(f"Could not list the machine types of zone '{zone}': {e}")
+                    return None
+            return self.zone_machine_types[zone]
+
     def validate(self):
 
         # Validate if image exists
@@ -183,6 +211,14 @@ class GooglePlatform(CloudPlatform):
         for _thread in destroy_threads:
             _thread.join()
 
+    def __list_run_nodes(self):
+        # List all instances labeled with the current run in a single call, indexed by name
+        # Instances spread across several zones are listed from all zones at once
+        zone = self.zone if len(self.preemptible_zones) == 1 else "all"
+        nodes = self.driver.list_nodes(ex_zone=zone, ex_use_disk_cache=False)
+        return {node.name: node for node in nodes
+                if node.extra.get("labels", {}).get(GoogleInstance.RUN_LABEL_KEY) == self.run_label}
+
     @staticmethod
     def __send_pubsub_message(topic_name, project_id, message, encode=True):
 
@@ -93,6 +93,7 @@ class GooglePreemptibleInstance(GoogleInstance):
         # Reset instance if its been destroyed/disappeared unexpectedly (i.e. preemption)
         if needs_reset and self.is_preemptible:
             logging.warning("(%s) Instance preempted! Resetting..." % self.name)
+            self.record_preemption()
             self.reset()
             return can_retry
 
@@ -113,6 +114,10 @@ class GooglePreemptibleInstance(GoogleInstance):
         if not self.is_preemptible:
             return
 
+        # Local scratch disks do not survive stopping the instance, so it needs to be recreated
+        if self.scratch_disks:
+            force_destroy = True
+
         # Reset as standard instance if preempted b/c runtime > 24 hours
         if self.get_recent_start_time() is not None and time.time() - self.get_recent_start_time() >= (3600 * 24):
             logging.warning("(%s) Instance failed! Preemptible runtime > 24 hrs. Resetting as standard instance." % self.name)
@@ -158,23 +163,16 @@ class GooglePreemptibleInstance(GoogleInstance):
         # Rerun all commands if the instance is not preemptible or was previously destroyed
         if not self.is_preemptible or force_destroy:
 
-            # Rerun all commands
-            for proc_name, proc_obj in list(self.processes.items()):
-
-                # Skip processes that do not need to be rerun
-                if proc_name in ["create", "destroy", "start", "stop"]:
-                    continue
-
-                # Run and wait for the command to finish
-                self.run(job_name=proc_name,
-                         cmd=proc_obj.get_command(),
-                         docker_image=proc_obj.get_docker_image(),
-                         docker_entrypoint=proc_obj.get_docker_entrypoint())
-                self.wait_process(proc_name)
+            # Rerun all commands, resuming from the last checkpoint saved outside of the instance
+            self.rerun_processes()
 
             # Exit function as the rest of the code is related to an instance that was not destroyed
             return
 
+        # Processes that failed after a checkpoint saved outside of the instance resume from that checkpoint
+        if self.resume_from_durable_checkpoint():
+            return
+
         # Identifying which process(es) need(s) to be recalled
         commands_to_run = list()
         checkpoint_queue = list()
@@ -243,7 +241,8 @@ class GooglePreemptibleInstance(GoogleInstance):
                 self.run(job_name=proc_name,
                          cmd=proc_obj.get_command(),
                          docker_image=proc_obj.get_docker_image(),
-                         docker_entrypoint=proc_obj.get_docker_entrypoint())
+                         docker_entrypoint=proc_obj.get_docker_entrypoint(),
+                         docker_container=proc_obj.get_docker_container())
                 self.wait_process(proc_name)
 
     def __remove_wrk_out_dir(self):
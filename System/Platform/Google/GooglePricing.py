@@ -0,0 +1,198 @@
+import os
+import re
+import json
+import time
+import logging
+import threading
+import requests
+
+from System import CC_CACHE_DIR
+
+
+class GooglePricing(object):
+    # Process-wide Google Cloud price catalog
+    # The catalog is loaded once per process (from an offline snapshot, the local cache or the pricing calculator)
+    # and indexed by machine family, region and preemptibility for constant-time lookups
+
+    PRICE_LIST_URL = "https://cloudpricingcalculator.appspot.com/static/data/pricelist.json"
+
+    # Time (sec) after which the locally cached catalog is downloaded again
+    CACHE_TTL = 24 * 3600
+
+    # Number of hours in a month, used to convert monthly storage prices to hourly
+    HOURS_PER_MONTH = 730
+
+    # Keys of the price list matching per-core, per-GB and per-GB extended memory prices of a machine family
+    VM_PRICE_KEY = re.compile(r"^CP-COMPUTEENGINE-(?P<family>.+)-VM-(?P<resource>CORE|RAM|EXTENDED-RAM)(?P<preemptible>-PREEMPTIBLE)?$")
+
+    # Keys of the price list matching predefined machine types (e.g. CP-COMPUTEENGINE-VMIMAGE-N1-STANDARD-4)
+    PREDEFINED_PRICE_KEY = re.compile(r"^CP-COMPUTEENGINE-VMIMAGE-(?P<machine_type>.+?)(?P<preemptible>-PREEMPTIBLE)?$")
+
+    # Keys of the price list for persistent disk storage
+    DISK_PRICE_KEYS = {
+        "pd-standard": "CP-COMPUTEENGINE-STORAGE-PD-CAPACITY",
+        "pd-balanced": "CP-COMPUTEENGINE-STORAGE-PD-BALANCED",
+        "pd-ssd": "CP-COMPUTEENGINE-STORAGE-PD-SSD",
+        "local-ssd": "CP-COMPUTEENGINE-LOCAL-SSD"
+    }
+
+    # Indexed catalog shared by all instances of the process
+    compute_prices = None
+    storage_prices = None
+    predefined_types = None
+
+    lock = threading.Lock()
+
+    @classmethod
+    def get_compute_price(cls, family, region, nr_cpus, mem, preemptible=False, snapshot=None):
+        # Return hourly price of an instance with nr_cpus cores and mem GB of memory
+        cls.load(snapshot)
+
+        prices = cls.compute_prices.get((family.lower(), region, preemptible))
+        if prices is None or "core" not in prices or "ram" not in prices:
+            raise RuntimeError(f"No compute price found for machine family '{family}' in region '{region}' "
+                               f"(preemptible: {preemptible})!")
+
+        return prices["core"] * nr_cpus + prices["ram"] * mem
+
+    @classmethod
+    def get_family_prices(cls, family, region, preemptible=False, snapshot=None):
+        # Return per-core ('core'), per-GB ('ram') and per-GB extended memory ('extended-ram') prices of a family
+        cls.load(snapshot)
+        return cls.compute_prices.get((family.lower(), region, preemptible), {})
+
+    @classmethod
+    def get_predefined_types(cls, region, preemptible=False, snapshot=None):
+        # Return list of predefined machine types available in a region with their cores, memory (GB) and price
+        cls.load(snapshot)
+        return cls.predefined_types.get((region, preemptible), [])
+
+    @classmethod
+    def get_storage_price(cls, region, disk_space, disk_type="pd-standard", snapshot=None):
+        # Return hourly price of disk_space GB of persistent disk
+        cls.load(snapshot)
+
+        price = cls.storage_prices.get((disk_type, region))
+        if price is None:
+            raise RuntimeError(f"No storage price found for disk type '{disk_type}' in region '{region}'!")
+
+        return price / cls.HOURS_PER_MONTH * disk_space
+
+    @classmethod
+    def has_compute_price(cls, family, region, preemptible=False, snapshot=None):
+        cls.load(snapshot)
+        prices = cls.compute_prices.get((family.lower(), region, preemptible), {})
+        return "core" in prices and "ram" in prices
+
+    @classmethod
+    def load(cls, snapshot=None):
+        # Load and index the price catalog if it was not loaded already
+        if cls.compute_prices is not None:
+            return
+
+        with cls.lock:
+            if cls.compute_prices is not None:
+                return
+
+            price_list = cls.__read_price_list(snapshot)
+            compute_prices, storage_prices, predefined_types = cls.__index(price_list)
+            cls.storage_prices = storage_prices
+            cls.predefined_types = predefined_types
+
+            # Set last as it marks the catalog as loaded
+            cls.compute_prices = compute_prices
+
+    @classmethod
+    def __read_price_list(cls, snapshot=None):
+
+        # Use the offline snapshot if one was provided
+        if snapshot:
+            logging.debug(f"Loading Google Cloud price list from snapshot {snapshot}.")
+            with open(snapshot) as inp:
+                return json.load(inp)["gcp_price_list"]
+
+        cache_file = os.path.join(CC_CACHE_DIR, "gcp_price_list.json")
+
+        # Use the local cache if it is recent enough
+        if os.path.isfile(cache_file) and time.time() - os.path.getmtime(cache_file) < cls.CACHE_TTL:
+            try:
+                with open(cache_file) as inp:
+                    return json.load(inp)["gcp_price_list"]
+            except (OSError, ValueError, KeyError):
+                logging.warning("Could not read cached Google Cloud price list. Downloading it again.")
+
+        try:
+            logging.debug("Downloading Google Cloud price list.")
+            price_json = requests.get(cls.PRICE_LIST_URL).json()
+            price_list = price_json["gcp_price_list"]
+        except BaseException as e:
+            # Fall back to an outdated cache rather than failing
+            if os.path.isfile(cache_file):
+                logging.warning(f"Could not download Google Cloud price list ({e}). Using outdated cached copy.")
+                with open(cache_file) as inp:
+                    return json.load(inp)["gcp_price_list"]
+            if str(e) != "":
+                logging.error("Could not obtain instance prices. The following error appeared: %s." % e)
+            raise
+
+        # Save the downloaded catalog for future runs
+        try:
+            os.makedirs(CC_CACHE_DIR, exist_ok=True)
+            tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+            with open(tmp_file, "w") as out:
+                json.dump(price_json, out)
+            os.replace(tmp_file, cache_file)
+        except OSError as e:
+            logging.warning(f"Could not cache Google Cloud price list: {e}")
+
+        return price_list
+
+    @classmethod
+    def __index(cls, price_list):
+        # Index prices by (family, region, preemptible) for compute, by (disk type, region) for storage
+        # and list predefined machine types by (region, preemptible)
+        compute_prices = {}
+        storage_prices = {}
+        predefined_types = {}
+
+        for key, prices in price_list.items():
+            if not isinstance(prices, dict):
+                continue
+
+            match = cls.VM_PRICE_KEY.match(key)
+            if match:
+                family = match.group("family").lower()
+                resource = match.group("resource").lower()
+                preemptible = match.group("preemptible") is not None
+                for region, price in prices.items():
+                    if isinstance(price, (int, float)):
+                        compute_prices.setdefault((family, region, preemptible), {})[resource] = price
+                continue
+
+            match = cls.PREDEFINED_PRICE_KEY.match(key)
+            if match:
+                # Shared-core machine types do not declare a number of cores
+                try:
+                    cores = float(prices["cores"])
+                    memory = float(prices["memory"])
+                except (KeyError, TypeError, ValueError):
+                    continue
+
+                machine_type = match.group("machine_type").lower()
+                preemptible = match.group("preemptible") is not None
+                for region, price in prices.items():
+                    if region in ["cores", "memory"] or not isinstance(price, (int, float)):
+                        continue
+                    predefined_types.setdefault((region, preemptible), []).append({
+                        "name": machine_type,
+                        "cores": cores,
+                        "memory": memory,
+                        "price": price
+                    })
+
+        for disk_type, key in cls.DISK_PRICE_KEYS.items():
+            for region, price in price_list.get(key, {}).items():
+                if isinstance(price, (int, float)):
+                    storage_prices[(disk_type, region)] = price
+
+        return compute_prices, storage_prices, predefined_types
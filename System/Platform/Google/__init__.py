@@ -1,3 +1,5 @@
+from .GooglePricing import GooglePricing
+from .GoogleMachineOptimizer import GoogleMachineOptimizer
 from .GoogleInstance import GoogleInstance
 from .GooglePlatform import GooglePlatform
 from .GooglePreemptibleInstance import GooglePreemptibleInstance
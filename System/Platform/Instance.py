@@ -4,12 +4,15 @@ import abc
 import subprocess as sp
 import time
 import socket
+import tempfile
+import uuid
 import re
 import random
 import traceback
 from collections import OrderedDict
 
 from System.Platform import Process
+from System.Platform.DockerHelper import DockerHelper
 
 
 class Instance(object, metaclass=abc.ABCMeta):
@@ -22,6 +25,14 @@ class Instance(object, metaclass=abc.ABCMeta):
 
     API_SLEEP_CAP = 200
 
+    # Time (sec) an idle SSH master connection is kept open
+    SSH_CONTROL_PERSIST = 600
+
+    # Readiness polling: maximum wait (sec), maximum backoff (sec) and SSH probe timeout (sec)
+    READY_TIMEOUT = 600
+    READY_SLEEP_CAP = 30
+    SSH_PROBE_TIMEOUT = 5
+
     STATUSES    = ["OFF", "CREATING", "DESTROYING", "AVAILABLE", "TERMINATED"]
 
     def __init__(self, name, nr_cpus, mem, disk_space, **kwargs):
@@ -55,14 +66,32 @@ class Instance(object, metaclass=abc.ABCMeta):
         # Initialize the checkpoints of the instance
         self.checkpoints = []
 
+        # Checkpoints saved outside of the instance, as (process name, replaced process names, restore function)
+        self.durable_checkpoints = []
+
+        # Processes run for restoring durable checkpoints, which are never replayed
+        self.restore_processes = set()
+
         self.batch_processing = False
 
     def get_name(self):
         return self.name
 
+    def get_ready_time(self):
+        # Time (sec) between the creation request and the processor being ready, if known
+        return None
+
     def get_runtime(self):
         return self.get_stop_time() - self.get_start_time()
 
+    def can_restore_checkpoints(self):
+        # Whether steps saved outside of the processor are restored if the processor is lost and recreated
+        return False
+
+    def get_scratch_cmd(self, scratch_dir):
+        # Command mounting the local scratch disks of the processor on scratch_dir (None if there are none)
+        return None
+
     # ABSTRACT METHODS TO BE IMPLEMENTED BY INHERITING CLASSES
 
     @abc.abstractmethod
@@ -114,6 +143,9 @@ class Instance(object, metaclass=abc.ABCMeta):
 
 class CloudInstance(Instance, metaclass=abc.ABCMeta):
 
+    # Glob matching the local scratch disk devices of the instance (None if the cloud provides none)
+    SCRATCH_DEVICES = None
+
     def __init__(self, name, nr_cpus, mem, disk_space, **kwargs):
 
         super(CloudInstance, self).__init__(name, nr_cpus, mem, disk_space, **kwargs)
@@ -141,14 +173,30 @@ class CloudInstance(Instance, metaclass=abc.ABCMeta):
             "TCPKeepAlive": "yes"
         }
 
+        # Socket of the SSH master connection over which all commands are multiplexed
+        self.ssh_control_path = os.path.join(tempfile.gettempdir(), f"cc-ssh-{uuid.uuid4().hex[:12]}")
+        self.set_ssh_option("ControlPath", self.ssh_control_path)
+
         # Initialize external IP address
         self.external_IP = None
 
+        # Time (sec) between the creation request and the instance being SSH-able
+        self.ready_time = None
+
+        # Local scratch space (GB) requested and number of local SSD/NVMe disks attached to provide it
+        self.scratch_space = kwargs.pop("scratch_space", 0)
+        self.scratch_disks = 0
+
+        # Pull-through mirror for Docker Hub images, configured once the instance is started
+        self.docker_registry_mirror = kwargs.get("docker_registry_mirror", None)
+
     def create(self):
 
         # Allocate resources on the platform for current instance
         self.platform.allocate_resources(self.nr_cpus, self.mem, self.disk_space)
 
+        create_start = time.time()
+
         # Create the actual instance
         self.external_IP = self.create_instance()
 
@@ -163,10 +211,24 @@ class CloudInstance(Instance, metaclass=abc.ABCMeta):
 
         # Wait until instance is ready (aka the SSH server is responsive)
         self.__wait_until_ready()
+        self.ready_time = time.time() - create_start
+        logging.debug(f"({self.name}) Instance ready {self.ready_time:.1f} seconds after creation request.")
+
+        # Open the SSH master connection used by all following commands
+        self.open_ssh_master()
 
         # Run post_startup_tasks
         self.post_startup()
 
+        # Point the docker daemon at the registry mirror before any container is started
+        if self.docker_registry_mirror is not None:
+            self.run("configure_registry_mirror", DockerHelper.get_registry_mirror_cmd(self.docker_registry_mirror))
+            try:
+                self.wait_process("configure_registry_mirror")
+            except RuntimeError:
+                logging.error(f"({self.name}) Could not configure the docker registry mirror {self.docker_registry_mirror}!")
+                raise
+
         # Allow all SendEnv to be accepted by instance
         envs = self.get_ssh_option("SendEnv")
         if envs is not None:
@@ -177,11 +239,19 @@ class CloudInstance(Instance, metaclass=abc.ABCMeta):
             self.run("configure_ssh", cmd)
             self.wait_process("configure_ssh")
 
+            # The master connection was accepted with the old configuration, so reconnect
+            self.close_ssh_master()
+            self.open_ssh_master()
+
         # Return an instance of self
         return self
 
     def destroy(self):
 
+        # Close the SSH master connection
+        self.close_ssh_master()
+
+        attempt = 0
         while True:
 
             # Get the current instance status
@@ -208,8 +278,9 @@ class CloudInstance(Instance, metaclass=abc.ABCMeta):
                 self.__add_history_event("DESTROY")
                 break
 
-            # Wait for 30 seconds before checking again for status
-            time.sleep(30)
+            # Wait with exponential backoff before checking again for status
+            time.sleep(self.get_ready_sleep(attempt))
+            attempt += 1
 
     def recreate(self):
         # Check if we recreated too many times already
@@ -248,8 +319,14 @@ class CloudInstance(Instance, metaclass=abc.ABCMeta):
         # Wait until instance is ready (aka the SSH server is responsive)
         self.__wait_until_ready()
 
+        # Open the SSH master connection used by all following commands
+        self.open_ssh_master()
+
     def stop(self):
 
+        # Close the SSH master connection
+        self.close_ssh_master()
+
         # Stop instance
         try:
             self.stop_instance()
@@ -286,6 +363,7 @@ class CloudInstance(Instance, metaclass=abc.ABCMeta):
         docker_image = kwargs.get("docker_image", None)
         num_retries = kwargs.get("num_retries", self.default_num_cmd_retries)
         docker_entrypoint = kwargs.get("docker_entrypoint", None)
+        docker_container = kwargs.get("docker_container", None)
 
         # Checking if logging is required
         if "!LOG" in cmd:
@@ -310,8 +388,10 @@ class CloudInstance(Instance, metaclass=abc.ABCMeta):
         # Save original command
         original_cmd = cmd
 
-        # Run in docker image if specified
-        if docker_image is not None:
+        # Run in a running docker container if specified, otherwise in a new container of the docker image
+        if docker_container is not None:
+            cmd = f"sudo docker exec --user root {docker_container} /bin/bash -c '{cmd}'"
+        elif docker_image is not None:
             if docker_entrypoint is not None:
                 cmd = f"sudo docker run --entrypoint '{docker_entrypoint}' --rm --user root -v /home:/home " \
                       f"{self.generate_docker_env()} -v {self.wrk_dir}:{self.wrk_dir} {docker_image} {cmd}"
@@ -343,7 +423,8 @@ class CloudInstance(Instance, metaclass=abc.ABCMeta):
             "original_cmd": original_cmd,
             "num_retries": num_retries,
             "docker_image": docker_image,
-            "docker_entrypoint": docker_entrypoint
+            "docker_entrypoint": docker_entrypoint,
+            "docker_container": docker_container
         }
 
         # Add process to list of processes
@@ -376,11 +457,14 @@ class CloudInstance(Instance, metaclass=abc.ABCMeta):
             if 'ssh' in stderr:
                 # issue with ssh connection, sleep for 10 seconds in case the server was having trouble with connections/commands
                 time.sleep(30)
+                # Re-open the master connection in case it was dropped
+                self.open_ssh_master()
             self.run(job_name=proc_name,
                      cmd=cmd,
                      num_retries=proc_obj.get_num_retries()-1,
                      docker_image=proc_obj.get_docker_image(),
-                     docker_entrypoint=proc_obj.get_docker_entrypoint())
+                     docker_entrypoint=proc_obj.get_docker_entrypoint(),
+                     docker_container=proc_obj.get_docker_container())
             return self.wait_process(proc_name)
 
         # Process still failing and cannot be retried anymore
@@ -474,30 +558,32 @@ class CloudInstance(Instance, metaclass=abc.ABCMeta):
         self.ssh_ready = False
         needs_recreate = True
 
-        # Initializing the cycle count
-        cycle_count = 0
-
         # Waiting for 10 minutes for instance to be SSH-able
-        while cycle_count < 20:
-
-            # Increment the cycle count
-            cycle_count += 1
-
-            # Wait for 30 seconds before checking the SSH server and status again
-            time.sleep(30)
-
-            status = self.get_status(log_status=True)
-
-            # If instance is not creating, it means it does not exist on the cloud or it's stopped
-            if status not in [CloudInstance.CREATING, CloudInstance.AVAILABLE]:
-                logging.debug(f'({self.name}) Instance has been shut down, removed, or preempted. Resetting instance!')
-                break
+        # The SSH server is probed with exponential backoff, while the status is only queried every
+        # READY_SLEEP_CAP seconds to limit the number of API calls
+        start_time = time.time()
+        last_status_check = start_time
+        attempt = 0
+        while time.time() - start_time < CloudInstance.READY_TIMEOUT:
 
             # Check if ssh server is accessible
             if self.check_ssh():
                 needs_recreate = False
                 break
 
+            if time.time() - last_status_check >= CloudInstance.READY_SLEEP_CAP:
+                last_status_check = time.time()
+                status = self.get_status(log_status=True)
+
+                # If instance is not creating, it means it does not exist on the cloud or it's stopped
+                if status not in [CloudInstance.CREATING, CloudInstance.AVAILABLE]:
+                    logging.debug(f'({self.name}) Instance has been shut down, removed, or preempted. Resetting instance!')
+                    break
+
+            # Wait before checking the SSH server again
+            time.sleep(self.get_ready_sleep(attempt))
+            attempt += 1
+
         # Check if it needs resetting
         if needs_recreate:
             # TODO: Should we reset here or recreate?
@@ -511,6 +597,13 @@ class CloudInstance(Instance, metaclass=abc.ABCMeta):
         temp = min(CloudInstance.API_SLEEP_CAP, 4 * 2 ** attempt)
         return temp / 2 + random.randrange(0, temp/2)
 
+    def get_ready_sleep(self, attempt):
+        # Exponential backoff starting at 1 second, capped at READY_SLEEP_CAP
+        return min(CloudInstance.READY_SLEEP_CAP, 2 ** attempt)
+
+    def get_ready_time(self):
+        return self.ready_time
+
     def set_ssh_option(self, key, value):
         if key in self.ssh_options:
             if isinstance(self.ssh_options[key], list):
@@ -542,29 +635,70 @@ class CloudInstance(Instance, metaclass=abc.ABCMeta):
     def generate_docker_env(self):
         return ''
 
+    def open_ssh_master(self):
+        # Open a persistent SSH master connection unless one is already running
+        # Commands run while no master is available fall back to their own connection
+        if self.external_IP is None:
+            return
+
+        if self.__run_ssh_control("check"):
+            return
+
+        cmd = f"ssh -i {self.ssh_private_key} {self.generate_ssh_options()} -o ControlMaster=yes " \
+              f"-o ControlPersist={CloudInstance.SSH_CONTROL_PERSIST} -N -f " \
+              f"{self.ssh_connection_user}@{self.external_IP}"
+
+        # Output is discarded as the backgrounded master would keep the pipes open
+        try:
+            ret_code = sp.call(cmd, shell=True, stdin=sp.DEVNULL, stdout=sp.DEVNULL, stderr=sp.DEVNULL, timeout=60)
+        except sp.TimeoutExpired:
+            ret_code = -1
+
+        if ret_code != 0:
+            logging.debug(f"({self.name}) Could not open SSH master connection. Commands will use separate connections.")
+        else:
+            logging.debug(f"({self.name}) SSH master connection opened at {self.ssh_control_path}.")
+
+    def close_ssh_master(self):
+        # Close the SSH master connection, if any
+        if self.external_IP is None or not os.path.exists(self.ssh_control_path):
+            return
+
+        if self.__run_ssh_control("exit"):
+            logging.debug(f"({self.name}) SSH master connection closed.")
+
+        # Remove a stale socket left by a master that died
+        if os.path.exists(self.ssh_control_path):
+            try:
+                os.remove(self.ssh_control_path)
+            except OSError:
+                pass
+
+    def __run_ssh_control(self, control_cmd):
+        # Send a control command (check, exit) to the SSH master connection
+        cmd = f"ssh -o ControlPath={self.ssh_control_path} -O {control_cmd} " \
+              f"{self.ssh_connection_user}@{self.external_IP}"
+        try:
+            return sp.call(cmd, shell=True, stdin=sp.DEVNULL, stdout=sp.DEVNULL, stderr=sp.DEVNULL, timeout=30) == 0
+        except sp.TimeoutExpired:
+            return False
+
     def check_ssh(self):
 
         # If the instance is off, the ssh is definitely not ready
         if self.external_IP is None:
             return False
 
-        # Generate the command to run
-        cmd = "nc -w 1 {0} 22".format(self.external_IP)
-
-        # Run the command
-        proc = sp.Popen(cmd, stderr=sp.PIPE, stdout=sp.PIPE, shell=True)
-        out, err = proc.communicate()
-
-        # Convert to string formats
-        out = out.decode("utf8")
-        err = err.decode("utf8")
-
-        # If any error occured, then the ssh is not ready
-        if err:
+        # Connect to the SSH port and read the server identification banner
+        try:
+            with socket.create_connection((self.external_IP, 22), timeout=CloudInstance.SSH_PROBE_TIMEOUT) as sock:
+                banner = sock.recv(256)
+        except OSError:
+            # If any error occured, then the ssh is not ready
             return False
 
-        # Otherwise, return only if there is ssh in the received header
-        return "ssh" in out.lower()
+        # Otherwise, return only if the server identified itself as an SSH server
+        return banner.startswith(b"SSH-")
 
     def __add_history_event(self, _type, _timestamp=None):
         # make sure not to add duplicate events
@@ -611,6 +745,101 @@ class CloudInstance(Instance, metaclass=abc.ABCMeta):
         """
         self.checkpoints.append((next(reversed(self.processes)), clear_output))
 
+    def get_scratch_cmd(self, scratch_dir):
+        # Combine the local scratch disks in RAID0 (if more than one) and mount them on scratch_dir
+        # Skipped if already mounted, so that the command can be rerun safely
+        if not self.scratch_disks or self.SCRATCH_DEVICES is None:
+            return None
+
+        return f"if ! mountpoint -q {scratch_dir}; then " \
+               f"DEVS=$(for d in {self.SCRATCH_DEVICES}; do [ -b \"$d\" ] && readlink -f \"$d\"; done | sort -u); " \
+               f"N=$(echo $DEVS | wc -w); " \
+               f"if [ $N -gt 1 ]; then sudo mdadm --create /dev/md0 --level=0 --raid-devices=$N $DEVS --run --force && DEV=/dev/md0; " \
+               f"else DEV=$DEVS; fi; " \
+               f"if [ -n \"$DEV\" ]; then sudo mkfs.ext4 -q -F $DEV && sudo mkdir -p {scratch_dir} " \
+               f"&& sudo mount -o noatime $DEV {scratch_dir}; fi; " \
+               f"fi"
+
+    def can_restore_checkpoints(self):
+        # Only preemptible instances are expected to be recreated while running
+        return getattr(self, "is_preemptible", False)
+
+    def add_durable_checkpoint(self, replaced_processes, restore):
+        """ Function for marking the last process as a checkpoint saved outside of the instance.
+            -replaced_processes: Processes that do not need to be rerun on a recreated instance once the checkpoint
+                                 process completed.
+            -restore: Function restoring the checkpoint on a recreated instance instead of rerunning them.
+        """
+        self.durable_checkpoints.append((next(reversed(self.processes)), set(replaced_processes), restore))
+
+    def get_last_durable_checkpoint(self):
+        # Return the last durable checkpoint that completed successfully (None, set() and None if there is none)
+        for proc_name, replaced, restore_func in reversed(self.durable_checkpoints):
+            proc_obj = self.processes.get(proc_name)
+            if proc_obj is not None and proc_obj.is_complete() and not proc_obj.has_failed():
+                return proc_name, replaced, restore_func
+        return None, set(), None
+
+    def resume_from_durable_checkpoint(self):
+        # Resume a restarted instance from the last completed durable checkpoint, by restoring it and rerunning
+        # every process that followed it. Returns False if no process after a durable checkpoint needs to be rerun.
+        checkpoint_proc, replaced_processes, restore = self.get_last_durable_checkpoint()
+        if checkpoint_proc is None:
+            return False
+
+        proc_names = list(self.processes)
+        following = [x for x in proc_names[proc_names.index(checkpoint_proc)+1:]
+                     if x not in ["create", "destroy", "start", "stop"] and x not in self.restore_processes
+                     and x not in replaced_processes]
+        if not any(self.processes[x].has_failed() or not self.processes[x].is_complete() for x in following):
+            return False
+
+        logging.info(f"({self.name}) Restoring checkpoint '{checkpoint_proc}' and rerunning the {len(following)} "
+                     f"processes that followed it.")
+        existing_processes = set(self.processes)
+        restore()
+        self.restore_processes.update(set(self.processes) - existing_processes)
+
+        for proc_name in following:
+            proc_obj = self.processes[proc_name]
+            self.run(job_name=proc_name,
+                     cmd=proc_obj.get_command(),
+                     docker_image=proc_obj.get_docker_image(),
+                     docker_entrypoint=proc_obj.get_docker_entrypoint(),
+                     docker_container=proc_obj.get_docker_container())
+            self.wait_process(proc_name)
+        return True
+
+    def rerun_processes(self):
+        # Rerun all processes on a recreated instance, resuming from the last completed durable checkpoint
+        checkpoint_proc, replaced_processes, restore = self.get_last_durable_checkpoint()
+
+        for proc_name, proc_obj in list(self.processes.items()):
+
+            # Skip processes that do not need to be rerun
+            if proc_name in ["create", "destroy", "start", "stop"] or proc_name in self.restore_processes:
+                continue
+
+            # Restore the checkpoint in place of the processes it replaces
+            if proc_name == checkpoint_proc:
+                logging.info(f"({self.name}) Restoring checkpoint '{proc_name}' instead of rerunning "
+                             f"{len(replaced_processes)} processes.")
+                existing_processes = set(self.processes)
+                restore()
+                self.restore_processes.update(set(self.processes) - existing_processes)
+                continue
+
+            if proc_name in replaced_processes:
+                continue
+
+            # Run and wait for the command to finish
+            self.run(job_name=proc_name,
+                     cmd=proc_obj.get_command(),
+                     docker_image=proc_obj.get_docker_image(),
+                     docker_entrypoint=proc_obj.get_docker_entrypoint(),
+                     docker_container=proc_obj.get_docker_container())
+            self.wait_process(proc_name)
+
     def post_startup(self):
         pass
 
@@ -0,0 +1,93 @@
+import time
+import logging
+import threading
+
+
+class InstanceStatusPoller(object):
+    # Single background thread that lists all instances of a run in one API call and shares the result
+    # Concurrent status requests from many instances are coalesced into the same listing
+
+    def __init__(self, list_nodes, interval=2, timeout=120):
+
+        # Function returning a dictionary of all the run's nodes, indexed by the key used in get_node()
+        self.list_nodes = list_nodes
+
+        # Minimum time (sec) between two listings
+        self.interval = interval
+
+        # Maximum time (sec) a caller waits for a listing
+        self.timeout = timeout
+
+        # Latest listing and the time (sec) when it was requested from the cloud
+        self.nodes = {}
+        self.listed_at = 0
+        self.list_error = None
+
+        # Condition variable used for requesting listings and publishing their results
+        self.condition = threading.Condition()
+        self.requested = False
+
+        self.thread = None
+
+    def get_node(self, key):
+        # Return the node as seen by a listing started after this call, or None if the node was not listed
+        # Raises RuntimeError if the listing failed, so the caller can fall back to querying the node directly
+        request_time = time.time()
+
+        with self.condition:
+
+            # Start the poller on first use
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.__run, daemon=True)
+                self.thread.start()
+
+            # Request a new listing
+            self.requested = True
+            self.condition.notify_all()
+
+            # Wait for a listing that started after the request
+            deadline = request_time + self.timeout
+            while self.listed_at < request_time:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise RuntimeError("Timed out while waiting for the instance status listing!")
+                self.condition.wait(remaining)
+
+            if self.list_error is not None:
+                raise RuntimeError(f"Could not list instance statuses: {self.list_error}")
+
+            return self.nodes.get(key, None)
+
+    def __run(self):
+
+        while True:
+
+            # Wait until a listing is requested
+            with self.condition:
+                while not self.requested:
+                    self.condition.wait()
+                last_listed_at = self.listed_at
+
+            # Throttle listings so that requests arriving close together are answered by the same call
+            time.sleep(max(0, last_listed_at + self.interval - time.time()))
+
+            # Every request made until now is answered by this listing
+            with self.condition:
+                self.requested = False
+                listed_at = time.time()
+
+            try:
+                nodes = self.list_nodes()
+                list_error = None
+            except BaseException as e:
+                logging.debug(f"Instance status listing failed: {e}")
+                nodes = None
+                list_error = e
+
+            # Publish the listing to all waiting instances
+            with self.condition:
+                if nodes is not None:
+                    self.nodes = nodes
+                self.listed_at = listed_at
+                self.list_error = list_error
+                self.condition.notify_all()
@@ -9,7 +9,7 @@ from System.Platform import Process
 from System.Platform.Platform import Platform
 from threading import Thread
 
-from System.Platform.Kubernetes import KubernetesJob, KubernetesStatusManager
+from System.Platform.Kubernetes import KubernetesJob, KubernetesStatusManager, KubernetesVolumePool, KubernetesCodeBundle
 from System.Platform.Kubernetes.utils import api_request, get_api_sleep
 
 from kubernetes import config, client
@@ -18,6 +18,9 @@ from kubernetes import config, client
 class KubernetesCluster(Platform):
     CONFIG_SPEC = f"{CC_MAIN_DIR}/System/Platform/Kubernetes/Platform.validate"
 
+    # Local directory where the container logs of the jobs are streamed, next to the run log
+    POD_LOG_DIR = os.path.join(CC_MAIN_DIR, "pod_logs")
+
     def __init__(self, name, platform_config_file, final_output_dir, generate_script=False):
         super(KubernetesCluster, self).__init__(name, platform_config_file, final_output_dir, config_spec=self.CONFIG_SPEC, generate_script=generate_script)
 
@@ -29,6 +32,7 @@ class KubernetesCluster(Platform):
         self.batch_api = None
         self.core_api = None
         self.status_manager = None
+        self.volume_pool = None
 
         self.service_provider = self.config.get("provider", 'GKE')
         self.gcp_secret_configured = "gcp_secret_configured" in self.config and self.config["gcp_secret_configured"]
@@ -44,6 +48,23 @@ class KubernetesCluster(Platform):
         self.persistent_volumes = self.config.get("persistent_volumes", [])
         self.storage_price = self.config.get("storage_price", 0)
 
+        # Pool of persistent volume claims reused across jobs (disabled when no size class is configured)
+        self.volume_pool_config = self.config.get("volume_pool", {})
+
+        # Labels of the jobs and pods of the current run, used for only watching the objects of the run
+        self.run_labels = {KubernetesStatusManager.RUN_LABEL: KubernetesStatusManager.get_run_label_value(self.name)}
+
+        # ReadWriteMany volume (claim or host path) mounted by every job, where temporary outputs are handed off
+        self.shared_workspace = self.config.get("shared_workspace", None)
+        if self.shared_workspace and not self.shared_workspace.get("pvc_name") and not self.shared_workspace.get("host_path"):
+            logging.error("The shared workspace needs either a 'pvc_name' or a 'host_path'.")
+            raise RuntimeError("Invalid shared workspace configuration!")
+
+        # Archive of the code run by ModuleRunner in the containers, shipped through a ConfigMap instead of git
+        self.use_code_bundle = self.config.get("code_bundle", True)
+        self.code_bundle = None
+        self.code_bundle_published = False
+
     def get_instance(self, nr_cpus, mem, disk_space, **kwargs):
         """Initialize new job and register with platform"""
 
@@ -89,6 +110,11 @@ class KubernetesCluster(Platform):
             "batch_api": self.batch_api,
             "core_api": self.core_api,
             "status_manager": self.status_manager,
+            "run_labels": self.run_labels,
+            "volume_pool": self.volume_pool,
+            "shared_workspace": self.shared_workspace,
+            "pod_log_dir": self.POD_LOG_DIR,
+            "code_bundle": self.code_bundle,
             "script_task": script_task
         })
 
@@ -116,10 +142,23 @@ class KubernetesCluster(Platform):
         self.batch_api = client.BatchV1Api(client.ApiClient(self.configuration))
         self.core_api = client.CoreV1Api(client.ApiClient(self.configuration))
 
-        self.status_manager = KubernetesStatusManager(self.batch_api, self.core_api, self.namespace)
+        self.status_manager = KubernetesStatusManager(self.batch_api, self.core_api, self.namespace,
+                                                      run_label_value=self.run_labels[KubernetesStatusManager.RUN_LABEL])
         self.status_manager.start_job_monitoring()
 
+        if self.volume_pool_config.get("size_classes"):
+            pool_prefix = self.standardize_instance(f"{self.name[:30]}-pool", 0, 0, 0)[0]
+            self.volume_pool = KubernetesVolumePool(self.core_api, self.namespace, pool_prefix,
+                                                    self.volume_pool_config["size_classes"],
+                                                    storage_class=self.volume_pool_config.get("storage_class", "standard"),
+                                                    min_idle=self.volume_pool_config.get("min_idle", 0),
+                                                    labels=self.run_labels)
+
     def init_platform(self):
+        # Package the code run by ModuleRunner
+        if self.use_code_bundle:
+            self.__init_code_bundle()
+
         if not self.generate_script:
             # Authenticate the current platform
             self.authenticate_platform()
@@ -127,6 +166,18 @@ class KubernetesCluster(Platform):
             # Validate the current platform
             self.validate()
 
+            # Make the code archive available to the jobs
+            if self.code_bundle is not None:
+                self.code_bundle.create_config_map(self.core_api, self.namespace)
+
+    def __init_code_bundle(self):
+        code_bundle = KubernetesCodeBundle()
+        if not code_bundle.is_valid():
+            logging.warning("The code archive is too large for a ConfigMap. Containers will get the code from git.")
+            return
+        self.code_bundle = code_bundle
+        logging.debug(f"Code archive built with digest {code_bundle.get_digest()}.")
+
     def validate(self):
         if not self.generate_script:
             try:
@@ -146,6 +197,18 @@ class KubernetesCluster(Platform):
 
         return job_name, nr_cpus, mem, disk_space
 
+    def get_packing_stats(self):
+        if self.status_manager is None:
+            return {}
+        return self.status_manager.get_packing_stats()
+
+    def get_shared_workspace(self):
+        # Each run gets its own subdirectory of the shared volume
+        if not self.shared_workspace:
+            return None
+        run_dir = self.run_labels[KubernetesStatusManager.RUN_LABEL]
+        return f"{self.shared_workspace.get('path', '/shared').rstrip('/')}/{run_dir}/"
+
     def get_disk_image_size(self):
         # no disk images for Kubernetes. return 0
         return 0
@@ -164,6 +227,14 @@ class KubernetesCluster(Platform):
         cmd = "gsutil %s cp -r '%s' '%s' 1>/dev/null 2>&1 " % (options_fast, report_path, dest_path)
         Process.run_local_cmd(cmd, err_msg="Could not transfer final report to the final output directory!")
 
+        # Transfer the manifest of the code archive ConfigMap mounted by the jobs of the script, to be applied before running it
+        if self.generate_script and self.code_bundle is not None and not self.code_bundle_published:
+            manifest_path = os.path.join(os.path.dirname(report_path), f"{self.code_bundle.get_config_map_name()}.json")
+            self.code_bundle.save_manifest(manifest_path)
+            cmd = "gsutil %s cp '%s' '%s' 1>/dev/null 2>&1 " % (options_fast, manifest_path, os.path.join(self.final_output_dir, os.path.basename(manifest_path)))
+            Process.run_local_cmd(cmd, err_msg="Could not transfer the code archive manifest to the final output directory!")
+            self.code_bundle_published = True
+
     def push_log(self, log_path):
 
         # Generate destination file path
@@ -185,12 +256,27 @@ class KubernetesCluster(Platform):
         cmd = "gsutil %s cp -r '%s' '%s' 1>/dev/null 2>&1 " % (options_fast, failed_module_log_path, failed_module_dest_path)
         Process.run_local_cmd(cmd, err_msg="Could not transfer failed module log to the final output directory!")
 
+        # Transfer streamed container logs to bucket
+        if os.path.isdir(self.POD_LOG_DIR):
+            pod_log_dest_path = os.path.join(os.path.dirname(dest_path), os.path.basename(self.POD_LOG_DIR))
+            cmd = "gsutil %s cp -r '%s' '%s' 1>/dev/null 2>&1 " % (options_fast, self.POD_LOG_DIR, pod_log_dest_path)
+            Process.run_local_cmd(cmd, err_msg="Could not transfer container logs to the final output directory!")
+
     def clean_up(self):
         # Initialize the list of threads
         # destroy_threads = []
         if not self.generate_script:
             self.status_manager.stop_job_monitoring()
 
+        # Delete the temporary outputs of the run from the shared workspace
+        if self.shared_workspace and not self.generate_script:
+            self.__clean_shared_workspace()
+
+        # Delete the pooled persistent volume claims
+        if self.volume_pool is not None:
+            logging.debug(f"Persistent volume claim pool usage: {self.volume_pool.get_stats()}")
+            self.volume_pool.clean_up()
+
         # Launch the destroy process for each instance
         # for name, job_obj in self.jobs.items():
         #     if job_obj is None:
@@ -204,6 +290,47 @@ class KubernetesCluster(Platform):
         # for _thread in destroy_threads:
         #     _thread.join()
 
+    def rm_shared_paths(self, paths):
+        # Delete temporary outputs of the shared workspace before the end of the run
+        if not self.shared_workspace or self.generate_script or not paths:
+            return False
+        return self.__run_shared_workspace_job("rm-shared", f"rm -rf {' '.join(paths)}")
+
+    def __clean_shared_workspace(self):
+        # Remove the run subdirectory of the shared workspace
+        if self.__run_shared_workspace_job("clean-shared", f"rm -rf {self.get_shared_workspace()}"):
+            logging.debug(f"Started cleaning the shared workspace {self.get_shared_workspace()}.")
+
+    def __run_shared_workspace_job(self, name, cmd):
+        # The controller does not mount the shared volume, so a job runs the command on it
+        job_name = self.standardize_instance(f"{self.name[:40]}-{name}-{self.generate_unique_id()}", 0, 0, 0)[0]
+        volume_mount, volume = KubernetesJob.get_shared_workspace_volume(self.shared_workspace)
+        container = client.V1Container(
+            name=name,
+            image="gcr.io/cloud-builders/gsutil",
+            command=["/bin/bash", "-c"],
+            args=[cmd],
+            volume_mounts=[volume_mount]
+        )
+        job = client.V1Job(
+            kind="Job",
+            metadata=client.V1ObjectMeta(namespace=self.namespace, name=job_name, labels=dict(self.run_labels)),
+            spec=client.V1JobSpec(
+                backoff_limit=3,
+                ttl_seconds_after_finished=600,
+                template=client.V1PodTemplateSpec(
+                    metadata=client.V1ObjectMeta(labels=dict(self.run_labels)),
+                    spec=client.V1PodSpec(containers=[container], volumes=[volume], restart_policy="Never")
+                )
+            )
+        )
+
+        response = api_request(self.batch_api.create_namespaced_job, self.namespace, job)
+        if response.get("status", None) == "Failure" or response.get("error", None):
+            logging.warning(f"Could not run '{cmd}' on the shared workspace. Response: {response}")
+            return False
+        return True
+
     def __parse_identity_json(self, identity):
         api_key_prefix = 'Bearer'
         f = open(self.identity)
@@ -0,0 +1,126 @@
+import io
+import os
+import json
+import gzip
+import base64
+import hashlib
+import logging
+import tarfile
+
+from System import CC_MAIN_DIR
+
+from kubernetes import client
+from kubernetes.client.rest import ApiException
+
+
+class KubernetesCodeBundle(object):
+    # Versioned archive of the CloudConductor code run by ModuleRunner inside the job containers
+    # The archive is shipped to the pods through a ConfigMap named after its digest, so that containers
+    # unpack the exact code of the run instead of pulling it from git
+
+    # Paths (relative to the CloudConductor directory) packaged in the archive
+    CODE_PATHS = ["ModuleRunner", "Modules", "System", "Config"]
+
+    # Name of the archive in the ConfigMap and directory where the ConfigMap is mounted
+    ARCHIVE_NAME = "code.tar.gz"
+    MOUNT_PATH = "/etc/cloud_conductor/code"
+
+    # Directory where containers unpack the archive
+    UNPACK_DIR = "/tmp/CloudConductor"
+
+    # Maximum archive size (bytes), keeping the base64 encoded ConfigMap under the 1MiB object limit
+    MAX_SIZE = 700 * 1024
+
+    # Label of the ConfigMaps holding code archives
+    LABEL = "cloud-conductor-code"
+
+    # Status of the API response when the ConfigMap already exists
+    HTTP_CONFLICT = 409
+
+    def __init__(self, code_dir=CC_MAIN_DIR):
+        self.code_dir = code_dir
+        self.archive = self.__build_archive()
+        self.digest = hashlib.sha256(self.archive).hexdigest()
+
+        # ConfigMaps are shared by all runs using the same code
+        self.config_map_name = f"cc-code-{self.digest[:16]}"
+
+    def is_valid(self):
+        return len(self.archive) <= self.MAX_SIZE
+
+    def get_digest(self):
+        return self.digest
+
+    def get_config_map_name(self):
+        return self.config_map_name
+
+    def get_unpack_cmd(self):
+        # Command checking the digest of the mounted archive, unpacking it and moving to the code directory
+        archive_path = f"{self.MOUNT_PATH}/{self.ARCHIVE_NAME}"
+        unpack_dir = f"{self.UNPACK_DIR}-{self.digest[:16]}"
+        return f'echo "{self.digest}  {archive_path}" | sha256sum -c - > /dev/null ' \
+               f'&& mkdir -p {unpack_dir} && tar -xzf {archive_path} -C {unpack_dir} && cd {unpack_dir}'
+
+    def get_volume(self):
+        # Return the mount and volume of the ConfigMap holding the archive
+        volume_mount = client.V1VolumeMount(mount_path=self.MOUNT_PATH, name="cc-code", read_only=True)
+        volume = client.V1Volume(name="cc-code", config_map=client.V1ConfigMapVolumeSource(name=self.config_map_name))
+        return volume_mount, volume
+
+    def create_config_map(self, core_api, namespace):
+        # Create the ConfigMap holding the archive, unless a previous run with the same code already did
+        config_map = client.V1ConfigMap(
+            metadata=client.V1ObjectMeta(name=self.config_map_name, namespace=namespace, labels={self.LABEL: self.digest[:16]}),
+            binary_data={self.ARCHIVE_NAME: self.__get_encoded_archive()}
+        )
+        try:
+            core_api.create_namespaced_config_map(namespace, config_map)
+        except ApiException as e:
+            if e.status != self.HTTP_CONFLICT:
+                raise RuntimeError(f"Failure to create the code archive ConfigMap {self.config_map_name}: {e.reason}")
+            logging.debug(f"Code archive ConfigMap {self.config_map_name} already exists.")
+            return
+
+        logging.debug(f"Code archive ConfigMap {self.config_map_name} created ({len(self.archive)} bytes).")
+
+    def save_manifest(self, path):
+        # Write the ConfigMap manifest, to be created with 'kubectl apply -f' before running a generated script
+        manifest = {
+            "apiVersion": "v1",
+            "kind": "ConfigMap",
+            "metadata": {"name": self.config_map_name, "labels": {self.LABEL: self.digest[:16]}},
+            "binaryData": {self.ARCHIVE_NAME: self.__get_encoded_archive()}
+        }
+        with open(path, "w") as out:
+            json.dump(manifest, out)
+
+    def __get_encoded_archive(self):
+        return base64.b64encode(self.archive).decode("ascii")
+
+    def __build_archive(self):
+        # Build a reproducible archive (sorted entries, no timestamps or owners) so that the same code gives the same digest
+        paths = []
+        for code_path in self.CODE_PATHS:
+            full_path = os.path.join(self.code_dir, code_path)
+            if os.path.isfile(full_path):
+                paths.append(code_path)
+                continue
+            for root, dirs, files in os.walk(full_path):
+                dirs[:] = [x for x in dirs if x != "__pycache__"]
+                for file_name in files:
+                    if not file_name.endswith(".pyc"):
+                        paths.append(os.path.relpath(os.path.join(root, file_name), self.code_dir))
+
+        data = io.BytesIO()
+        with gzip.GzipFile(fileobj=data, mode="wb", mtime=0) as gz:
+            with tarfile.open(fileobj=gz, mode="w", format=tarfile.PAX_FORMAT) as tar:
+                for path in sorted(paths):
+                    full_path = os.path.join(self.code_dir, path)
+                    info = tar.gettarinfo(full_path, arcname=path)
+                    info.mtime = 0
+                    info.uid = info.gid = 0
+                    info.uname = info.gname = ""
+                    with open(full_path, "rb") as inp:
+                        tar.addfile(info, inp)
+
+        return data.getvalue()
@@ -8,7 +8,7 @@ import tempfile
 import yaml
 import json
 
-from System.Platform.Kubernetes import KubernetesStatusManager
+from System.Platform.Kubernetes import KubernetesStatusManager, KubernetesLogStreamer
 from System.Platform.Instance import Instance
 from System.Platform import Platform, Process
 from System.Platform.Kubernetes.utils import api_request, get_api_sleep
@@ -19,6 +19,18 @@ from kubernetes import client, config
 
 class KubernetesJob(Instance):
 
+    # Maximum time (sec) between two job status checks when no update is received
+    STATUS_CHECK_INTERVAL = 60
+
+    # Prefixes of the input and output transfer processes, which are merged into one container each
+    TRANSFER_PREFIXES = ["load_input_", "save_output_"]
+
+    # Maximum number of files transferred at the same time by a merged transfer container
+    MAX_PARALLEL_TRANSFERS = 8
+
+    # Number of log lines read from a container that was not followed by the log streamer
+    LOG_TAIL_LINES = 1000
+
     def __init__(self, name, nr_cpus, mem, disk_space, **kwargs):
         super(KubernetesJob, self).__init__(name, nr_cpus, mem, disk_space, **kwargs)
 
@@ -38,12 +50,16 @@ class KubernetesJob(Instance):
         self.job_def = None
         self.pvc_name = ''
         self.task_pvc = None
+        self.pvc_leased = False
         self.monitoring = False
         self.start_time = 0
         self.stop_time = 0
 
         self.failed_container = None
 
+        # Follows the container logs of the running job
+        self.log_streamer = None
+
         # define how long the job lasts after completion
         self.termination_seconds = 600
 
@@ -58,6 +74,14 @@ class KubernetesJob(Instance):
         self.batch_api = kwargs.pop("batch_api")
         self.core_api = kwargs.pop("core_api")
         self.status_manager = kwargs.pop("status_manager")
+        self.run_labels = kwargs.pop("run_labels", {})
+        self.volume_pool = kwargs.pop("volume_pool", None)
+        self.shared_workspace = kwargs.pop("shared_workspace", None)
+        self.pod_log_dir = kwargs.pop("pod_log_dir", None)
+        self.code_bundle = kwargs.pop("code_bundle", None)
+
+        # Factor by which the resources requested by the module are divided, letting more jobs share a node
+        self.overcommit = max(float(kwargs.pop("overcommit", 1) or 1), 1)
 
         # Get platform/cluster specific data
         self.storage_price = kwargs.pop("storage_price")
@@ -80,6 +104,10 @@ class KubernetesJob(Instance):
 
         self.node_label, self.nodepool_info = self.get_nodepool_info()
 
+        # Jobs lease their volume from the pool of their node pool once they start
+        if self.volume_pool is not None and not self.script_task:
+            self.volume_pool.add_to_queue(self.disk_space, self.node_label)
+
         if not self.script_task:
             self.status_manager.check_monitoring_status()
 
@@ -90,9 +118,35 @@ class KubernetesJob(Instance):
         if self.preemptible and self.preemptible_node_pools:
             node_pool_dict = self.preemptible_node_pools
 
+        # Select the pool whose nodes are best filled by jobs of the same shape, preferring smaller nodes
+        cpu_request, mem_request = self.get_resource_requests()
+        candidates = []
         for pool in node_pool_dict:
-            if pool['max_cpu'] >= self.nr_cpus and pool['max_mem'] >= self.mem:
-                return pool['name'], pool
+            if pool['max_cpu'] < self.nr_cpus or pool['max_mem'] < self.mem:
+                continue
+
+            # Requests are capped to what the node offers once the reserve is removed (see run())
+            max_cpu = pool['max_cpu'] - self.cpu_reserve
+            max_mem = pool['max_mem'] - self.mem_reserve
+            if max_cpu <= 0 or max_mem <= 0:
+                continue
+            pool_cpu_request = min(cpu_request, max_cpu)
+            pool_mem_request = min(mem_request, max_mem)
+
+            jobs_per_node = int(min(max_cpu / pool_cpu_request, max_mem / pool_mem_request))
+            waste = 1 - jobs_per_node * (pool_cpu_request / max_cpu + pool_mem_request / max_mem) / 2
+            candidates.append((waste, pool['max_cpu'], pool['max_mem'], pool))
+
+        if not candidates:
+            raise RuntimeError(f"({self.name}) No {'preemptible ' if node_pool_dict is self.preemptible_node_pools else ''}"
+                               f"node pool can fit {self.nr_cpus} vCPUs and {self.mem} GB of memory!")
+
+        pool = min(candidates, key=lambda x: x[:3])[3]
+        return pool['name'], pool
+
+    def get_resource_requests(self):
+        # Resources (vCPUs, GB) requested for the job: what the module asked for, divided by the overcommit factor
+        return self.nr_cpus / self.overcommit, self.mem / self.overcommit
 
     def run(self, job_name, cmd, **kwargs):
 
@@ -154,7 +208,7 @@ class KubernetesJob(Instance):
         if self.script_task and self.script_task.update_input_required and job_name == self.script_task.task_id:
             # if the input for the given task needs to be updated because a parent's output will update
             update_command_task = {
-                "original_cmd": 'cd /CloudConductor && git pull && git checkout "${GIT_COMMIT}" && python3 ModuleRunner -m '+self.script_task.module_name+submodule_arg+' -task '+ self.script_task.task_id +' -inputs "${MODULE_INPUTS}" -c '+self.wrk_out_dir+'/command.txt -o '+self.wrk_out_dir+'/output_values.json',
+                "original_cmd": self.__get_module_runner_cmd()+' && python3 ModuleRunner -m '+self.script_task.module_name+submodule_arg+' -task '+ self.script_task.task_id +' -inputs "${MODULE_INPUTS}" -c '+self.wrk_out_dir+'/command.txt -o '+self.wrk_out_dir+'/output_values.json',
                 "num_retries": self.default_num_cmd_retries,
                 "docker_image": "davelabhub/cloudconductor",
                 "docker_entrypoint": None,
@@ -179,7 +233,7 @@ class KubernetesJob(Instance):
         if self.script_task and self.script_task.post_processing_required and job_name == self.script_task.task_id:
             self.processes[job_name] = task
             process_output_task = {
-                "original_cmd": 'cd /CloudConductor && git pull && git checkout "${GIT_COMMIT}" && python3 ModuleRunner -m '+self.script_task.module_name+submodule_arg+' -task '+ self.script_task.task_id +' -inputs "${MODULE_INPUTS}" -ro '+log_file+' -o '+self.wrk_out_dir+'/output_values.json',
+                "original_cmd": self.__get_module_runner_cmd()+' && python3 ModuleRunner -m '+self.script_task.module_name+submodule_arg+' -task '+ self.script_task.task_id +' -inputs "${MODULE_INPUTS}" -ro '+log_file+' -o '+self.wrk_out_dir+'/output_values.json',
                 "num_retries": self.default_num_cmd_retries,
                 "docker_image": "davelabhub/cloudconductor",
                 "docker_entrypoint": None,
@@ -236,20 +290,24 @@ class KubernetesJob(Instance):
         # launch and monitor the job if we're not just generating a script
         if not self.script_task:
             self.__launch_job()
+            self.log_streamer = KubernetesLogStreamer(self.core_api, self.namespace, self.inst_name, self.pod_log_dir)
 
             # begin monitoring job for completion/failure
             self.monitoring = True
             while self.monitoring:
-                time.sleep(5)
+                # Wake up as soon as the job or its pod is updated, checking the status regularly in any case
+                self.status_manager.wait_for_update(self.inst_name, timeout=self.STATUS_CHECK_INTERVAL)
+                self.log_streamer.update(self.status_manager.get_pod_info(self.inst_name))
                 job_status = self.get_status(log_status=True)
                 if job_status and (job_status.succeeded or (job_status.failed and job_status.failed >= self.default_num_cmd_retries and not job_status.active)):
                     self.monitoring = False
+                    self.log_streamer.stop()
                     if job_status.succeeded:
                         self.stop_time = job_status.completion_time.timestamp()
                         logging.info(f"({self.name}) Process complete!")
                         if return_last_task_log:
                             logging.debug("Returning logs from last process.")
-                            logs = self.__get_container_log(self.job_containers[len(self.job_containers)-1].name)
+                            logs = self.__get_container_log(self.tool_container_name or self.job_containers[len(self.job_containers)-1].name)
                             return logs, ''
                     elif job_status.failed and job_status.failed >= self.default_num_cmd_retries and not job_status.active:
                         logging.warning(f"{self.name}) Job marked as failed. Status response:\n{str(job_status)}")
@@ -383,6 +441,14 @@ class KubernetesJob(Instance):
             raise RuntimeError(f"({self.name}) Failure to create the job on the cluster Reason: {str(e)}")
 
     def __create_volume_claim(self):
+        # lease a persistent volume claim from the pool if it has a size class fitting the task
+        if self.volume_pool is not None:
+            pvc_name = self.volume_pool.lease(self.disk_space, self.node_label)
+            if pvc_name is not None:
+                self.pvc_name = pvc_name
+                self.pvc_leased = True
+                return
+
         # create the persistent volume claim for the task
         self.pvc_name = self.name+'-vc'
         pvc_meta = client.V1ObjectMeta(name=self.pvc_name, namespace=self.namespace)
@@ -417,7 +483,7 @@ class KubernetesJob(Instance):
             self.inst_name = self.inst_name + '-' + str(self.job_count)
         self.job_count += 1
         job_def = client.V1Job(kind="Job")
-        job_def.metadata = client.V1ObjectMeta(namespace=self.namespace, name=self.inst_name)
+        job_def.metadata = client.V1ObjectMeta(namespace=self.namespace, name=self.inst_name, labels=dict(self.run_labels))
 
         # initialize job pieces
         self.job_containers = []
@@ -443,17 +509,22 @@ class KubernetesJob(Instance):
         cpu_request_max = self.nodepool_info['max_cpu'] - self.cpu_reserve
         mem_request_max = self.nodepool_info['max_mem'] - self.mem_reserve
 
+        # request what the module asked for so that several jobs fit on a node, and let the job burst to the whole node
+        cpu_request, mem_request = self.get_resource_requests()
+        cpu_request = round(min(cpu_request, cpu_request_max), 3)
+        mem_request = round(min(mem_request, mem_request_max), 3)
+
         # define resource limits/requests
         resource_def = client.V1ResourceRequirements(
             limits={'cpu': cpu_request_max, 'memory': str(mem_request_max)+'G'},
-            requests={'cpu': cpu_request_max*.8, 'memory': str(mem_request_max-1)+'G'}
+            requests={'cpu': cpu_request, 'memory': str(mem_request)+'G'}
         )
 
         # update script task with job info
         if self.script_task:
-            self.script_task.cpu_request = cpu_request_max*.8
+            self.script_task.cpu_request = cpu_request
             self.script_task.cpu_max = cpu_request_max
-            self.script_task.memory_request = mem_request_max-1
+            self.script_task.memory_request = mem_request
             self.script_task.memory_max = mem_request_max
             self.script_task.instance_name = self.inst_name
             self.script_task.force_standard = not self.preemptible
@@ -498,6 +569,22 @@ class KubernetesJob(Instance):
                     if self.script_task:
                         self.script_task.extra_volumes.append({"path": pv["path"], "name": pv["volume_name"], "read_only": pv["read_only"], "claim_name": pv["pvc_name"]})
 
+        # mount the shared workspace where parent tasks leave their temporary outputs
+        if self.shared_workspace:
+            volume_mount, volume = self.get_shared_workspace_volume(self.shared_workspace)
+            volume_mounts.append(volume_mount)
+            volumes.append(volume)
+            if self.script_task and self.shared_workspace.get("pvc_name"):
+                self.script_task.extra_volumes.append({"path": volume_mount.mount_path, "name": volume.name, "read_only": False, "claim_name": self.shared_workspace["pvc_name"]})
+
+        # mount the code archive unpacked by ModuleRunner commands, if the job runs any
+        if self.code_bundle is not None and any(x in self.processes for x in ("update_command_task", "process_output")):
+            volume_mount, volume = self.code_bundle.get_volume()
+            volume_mounts.append(volume_mount)
+            volumes.append(volume)
+            if self.script_task and not any(x["name"] == volume.name for x in self.script_task.config_map_volumes):
+                self.script_task.config_map_volumes.append({"path": volume_mount.mount_path, "name": volume.name, "read_only": True, "config_map": self.code_bundle.get_config_map_name()})
+
         # incorporate configured secrets
         if self.gcp_secret_configured:
             volume_mounts.append(
@@ -534,7 +621,10 @@ class KubernetesJob(Instance):
         storage_tasks = ['mkdir_', 'grant_']
         container_name_list = []
 
-        for k, v in self.processes.items():
+        # Name of the container running the last tool command, whose logs are post-processed
+        self.tool_container_name = None
+
+        for k, v in self.__merge_transfers().items():
             # if the process is for storage (i.e. mkdir, etc.)
             entrypoint = ["/bin/bash", "-c"]
             if any(x in k for x in storage_tasks) or not v['docker_image']:
@@ -584,6 +674,9 @@ class KubernetesJob(Instance):
                 )
             )
 
+            if not any(k.startswith(x) for x in self.TRANSFER_PREFIXES):
+                self.tool_container_name = formatted_container_name
+
             if self.script_task and container_name not in self.script_task.commands:
                 self.script_task.commands[container_name] = ({"name": formatted_container_name, "docker_image": container_image, "entrypoint": entrypoint, "args": [args]})
 
@@ -591,6 +684,19 @@ class KubernetesJob(Instance):
             backoff_limit=self.default_num_cmd_retries
         )
 
+        # Wipe the files left by the previous user of a pooled volume before the first job of the task
+        if self.pvc_leased and self.job_count == 2:
+            containers.insert(0, client.V1Container(
+                    image=storage_image,
+                    command=["/bin/bash", "-c"],
+                    args=[f"find {self.wrk_dir} -xdev -mindepth 1 -delete"],
+                    name="wipe-volume-" + Platform.generate_unique_id(id_len=5),
+                    volume_mounts=volume_mounts,
+                    resources=resource_def,
+                    image_pull_policy='IfNotPresent'
+                )
+            )
+
         self.job_containers = containers
 
         # Run jobs in order using init_containers
@@ -606,6 +712,7 @@ class KubernetesJob(Instance):
         job_template = client.V1PodTemplateSpec()
         job_labels = {}
         job_labels[self.inst_name] = 'CC-Job'
+        job_labels.update(self.run_labels)
         # add annotation to prevent autoscaler from killing nodes running jobs
         annotations = {'cluster-autoscaler.kubernetes.io/safe-to-evict': 'false'}
         job_template.metadata = client.V1ObjectMeta(labels=job_labels, annotations=annotations)
@@ -629,40 +736,108 @@ class KubernetesJob(Instance):
 
         return job_def
 
+    def __get_module_runner_cmd(self):
+        # Move to the code of the run, unpacked from the mounted code archive or checked out from git
+        if self.code_bundle is not None:
+            return self.code_bundle.get_unpack_cmd()
+        return 'cd /CloudConductor && git pull && git checkout "${GIT_COMMIT}"'
+
+    @staticmethod
+    def get_shared_workspace_volume(shared_workspace):
+        # Return the mount and volume of the shared workspace (a ReadWriteMany claim or a host path for local clusters)
+        volume_mount = client.V1VolumeMount(mount_path=shared_workspace.get("path", "/shared"), name="shared-workspace")
+        if shared_workspace.get("pvc_name"):
+            volume = client.V1Volume(
+                name="shared-workspace",
+                persistent_volume_claim=client.V1PersistentVolumeClaimVolumeSource(claim_name=shared_workspace["pvc_name"])
+            )
+        else:
+            volume = client.V1Volume(
+                name="shared-workspace",
+                host_path=client.V1HostPathVolumeSource(path=shared_workspace["host_path"], type="DirectoryOrCreate")
+            )
+        return volume_mount, volume
+
+    def __merge_transfers(self):
+        # Merge consecutive input (or output) transfers into a single process running them in parallel,
+        # so that the pod starts one container instead of one per file
+        merged = OrderedDict()
+        group_name, group = None, []
+
+        for k, v in list(self.processes.items()) + [(None, None)]:
+            prefix = None if k is None else next((x for x in self.TRANSFER_PREFIXES if k.startswith(x)), None)
+            is_transfer = prefix is not None and v["docker_image"] is not None and "rclone" in v["docker_image"]
+
+            # Close the current group when the process cannot join it
+            if group and (not is_transfer or prefix != group_name):
+                if len(group) == 1:
+                    merged[group[0][0]] = group[0][1]
+                else:
+                    merged[f"{group_name}{len(group)}_files"] = self.__get_parallel_transfer(group)
+                group_name, group = None, []
+
+            if is_transfer:
+                group_name = prefix
+                group.append((k, v))
+            elif k is not None:
+                merged[k] = v
+
+        return merged
+
+    def __get_parallel_transfer(self, transfers):
+        # Run the transfers in the background (at most MAX_PARALLEL_TRANSFERS at a time) and fail if any fails
+        cmds = []
+        for k, v in transfers:
+            cmd = v['original_cmd']
+            if v['docker_entrypoint'] is not None and cmd.find(v['docker_entrypoint']) == -1:
+                cmd = v['docker_entrypoint'] + ' ' + cmd
+            cmds.append(cmd.replace("|&", "2>&1 |"))
+
+        wait_cmd = 'for pid in $pids; do wait $pid || rc=1; done; pids=""'
+        script = ['rc=0', 'pids=""']
+        for idx, cmd in enumerate(cmds):
+            script.append(f'( {cmd} ) & pids="$pids $!"')
+            if (idx + 1) % self.MAX_PARALLEL_TRANSFERS == 0:
+                script.append(wait_cmd)
+        script.extend([wait_cmd, 'exit $rc'])
+
+        return {
+            "original_cmd": "; ".join(script),
+            "num_retries": max(v['num_retries'] for k, v in transfers),
+            "docker_image": transfers[0][1]['docker_image'],
+            "docker_entrypoint": None
+        }
+
     def __get_failed_container(self):
-        """ Returns the logs for the specified container name in the currently running job """
+        """ Returns the failed container of the currently running job, with the end of its log and of the logs of the containers that ran before it """
         response = api_request(self.core_api.list_namespaced_pod, namespace=self.namespace, label_selector=self.inst_name, watch=False, pretty='true')
         if response.get("items"):
             pod = response["items"][len(response["items"])-1]
             pod_name = pod.get("metadata", {}).get("name", '')
             module_log = ''
-            init_container_statuses = pod['status']['init_container_statuses']
-            container_index = 0
-            if init_container_statuses:
-                for status in init_container_statuses:
-                    if not status['ready']:
-                        failed_container = pod['spec']['init_containers'][container_index]
-                        failed_container['log'] = api_request(self.core_api.read_namespaced_pod_log, pod_name, self.namespace, container=status['name'], follow=False, pretty='true')
-                        failed_container['module_log'] = module_log
-                        return failed_container
-                    else:
-                        module_log += '\n' + api_request(self.core_api.read_namespaced_pod_log, pod_name, self.namespace, container=status['name'], follow=False, pretty='true')
-                    container_index += 1
-            container_statuses = pod['status']['container_statuses']
-            container_index = 0
-            if container_statuses:
-                for status in container_statuses:
+            for status_key, spec_key in [('init_container_statuses', 'init_containers'), ('container_statuses', 'containers')]:
+                container_statuses = pod['status'][status_key]
+                if not container_statuses:
+                    continue
+                for container_index, status in enumerate(container_statuses):
                     if not status['ready']:
-                        failed_container = pod['spec']['containers'][container_index]
-                        failed_container['log'] = api_request(self.core_api.read_namespaced_pod_log, pod_name, self.namespace, container=status['name'], follow=False, pretty='true')
+                        failed_container = pod['spec'][spec_key][container_index]
+                        failed_container['log'] = self.__get_container_tail(pod_name, status['name'])
                         failed_container['module_log'] = module_log
                         return failed_container
                     else:
-                        module_log += '\n' + api_request(self.core_api.read_namespaced_pod_log, pod_name, self.namespace, container=status['name'], follow=False, pretty='true')
-                    container_index += 1
+                        module_log += '\n' + self.__get_container_tail(pod_name, status['name'])
         logging.warning(f"Failed to retrieve failed container in job {self.inst_name}")
         return None
 
+    def __get_container_tail(self, pod_name, container_name):
+        """ Returns the end of the log of a container, as followed by the log streamer if possible """
+        tail = self.log_streamer.get_tail(pod_name, container_name) if self.log_streamer else None
+        if tail is None:
+            tail = api_request(self.core_api.read_namespaced_pod_log, pod_name, self.namespace, container=container_name,
+                               follow=False, tail_lines=self.LOG_TAIL_LINES)
+        return str(tail)
+
     def __get_container_log(self, container_name):
         """ Returns the logs for the specified container name in the currently running job """
         response = api_request(self.core_api.list_namespaced_pod, namespace=self.namespace, label_selector=self.inst_name, watch=False, pretty='true')
@@ -698,7 +873,14 @@ class KubernetesJob(Instance):
                 self.__cleanup_pods(job_name)
 
     def __cleanup_volume_claim(self):
-        if self.pvc_name:
+        if self.pvc_name and self.pvc_leased:
+            # Return the persistent volume claim to the pool once the pods of all jobs of the task are terminated,
+            # as pods still terminating keep the volume attached to their node
+            pvc_name = self.pvc_name
+            job_names = [self.name if i == 1 else f"{self.name}-{i}" for i in range(1, self.job_count)]
+            self.status_manager.on_pods_terminated(job_names, lambda: self.volume_pool.release(pvc_name))
+            self.pvc_leased = False
+        elif self.pvc_name:
             # Destroy the persistent volume claim
             pvc_response = api_request(self.core_api.delete_namespaced_persistent_volume_claim, self.pvc_name, self.namespace)
 
@@ -0,0 +1,143 @@
+import os
+import time
+import logging
+import threading
+from collections import deque
+
+from kubernetes.client.rest import ApiException
+
+
+class KubernetesLogStreamer(object):
+    # Follows the logs of the containers of a job's pods while they run
+    # Each container log is streamed into a bounded ring buffer holding its tail and flushed to a file in chunks,
+    # so that large logs never have to be read in one call nor kept in memory
+
+    # Size (bytes) of the tail kept in memory for each container
+    TAIL_SIZE = 64 * 1024
+
+    # Size (bytes) of the chunks written to the log files
+    FLUSH_SIZE = 1024 * 1024
+
+    # Size (bytes) of the chunks read from the log stream
+    READ_SIZE = 16 * 1024
+
+    # Maximum number of times a broken log stream is resumed
+    MAX_RESUMES = 10
+
+    def __init__(self, core_api, namespace, job_name, log_dir=None):
+
+        self.core_api = core_api
+        self.namespace = namespace
+        self.job_name = job_name
+
+        # Directory where the container logs are written (None to only keep the tails)
+        self.log_dir = os.path.join(log_dir, job_name) if log_dir else None
+
+        # Followed containers indexed by (pod name, container name)
+        self.streams = {}
+
+        self.lock = threading.Lock()
+
+    def update(self, pod):
+        # Start following the containers of the pod that have started
+        if pod is None or pod.status is None:
+            return
+
+        pod_name = pod.metadata.name
+        statuses = (pod.status.init_container_statuses or []) + (pod.status.container_statuses or [])
+        for status in statuses:
+            if status.state is None or (status.state.running is None and status.state.terminated is None):
+                continue
+
+            with self.lock:
+                if (pod_name, status.name) in self.streams:
+                    continue
+                stream = {
+                    "tail": deque(),
+                    "tail_size": 0,
+                    "buffer": [],
+                    "buffer_size": 0,
+                    "last_read": None,
+                    "thread": None
+                }
+                self.streams[(pod_name, status.name)] = stream
+
+            stream["thread"] = threading.Thread(target=self.__follow, args=(pod_name, status.name, stream), daemon=True)
+            stream["thread"].start()
+
+    def get_tail(self, pod_name, container_name, timeout=30):
+        # Return the last TAIL_SIZE bytes of a container log (None if the container was never followed)
+        with self.lock:
+            stream = self.streams.get((pod_name, container_name), None)
+        if stream is None:
+            return None
+
+        # Give the stream a chance to reach the end of the log of a terminated container
+        stream["thread"].join(timeout)
+        with self.lock:
+            tail = b"".join(stream["tail"])
+        return tail[-self.TAIL_SIZE:].decode("utf-8", errors="replace")
+
+    def stop(self, timeout=30):
+        # Wait for the followed logs to end and flush them
+        with self.lock:
+            streams = list(self.streams.values())
+        for stream in streams:
+            stream["thread"].join(timeout)
+
+    def __follow(self, pod_name, container_name, stream):
+        # Stream the container log until it ends, resuming from the last read time if the connection breaks
+        for i in range(self.MAX_RESUMES):
+            kwargs = {"container": container_name, "follow": True, "_preload_content": False}
+            if stream["last_read"] is not None:
+                kwargs["since_seconds"] = max(int(time.time() - stream["last_read"]) + 1, 1)
+
+            try:
+                response = self.core_api.read_namespaced_pod_log(pod_name, self.namespace, **kwargs)
+                for chunk in response.stream(self.READ_SIZE):
+                    stream["last_read"] = time.time()
+                    self.__add_chunk(pod_name, container_name, stream, chunk)
+                response.release_conn()
+                break
+            except ApiException as e:
+                logging.debug(f"({self.job_name}) Could not stream the log of container {container_name}: {e.reason}")
+                break
+            except Exception as e:
+                logging.debug(f"({self.job_name}) Log stream of container {container_name} broken: {str(e)}")
+                time.sleep(i + 1)
+
+        self.__flush(pod_name, container_name, stream)
+
+    def __add_chunk(self, pod_name, container_name, stream, chunk):
+        with self.lock:
+            # Keep only the tail of the log in memory
+            stream["tail"].append(chunk)
+            stream["tail_size"] += len(chunk)
+            while stream["tail_size"] - len(stream["tail"][0]) >= self.TAIL_SIZE:
+                stream["tail_size"] -= len(stream["tail"].popleft())
+
+            if self.log_dir is None:
+                return
+            stream["buffer"].append(chunk)
+            stream["buffer_size"] += len(chunk)
+            flush = stream["buffer_size"] >= self.FLUSH_SIZE
+
+        if flush:
+            self.__flush(pod_name, container_name, stream)
+
+    def __flush(self, pod_name, container_name, stream):
+        # Append the buffered part of the log to the container log file
+        with self.lock:
+            data = b"".join(stream["buffer"])
+            stream["buffer"] = []
+            stream["buffer_size"] = 0
+
+        if self.log_dir is None or not data:
+            return
+
+        try:
+            os.makedirs(self.log_dir, exist_ok=True)
+            with open(os.path.join(self.log_dir, f"{pod_name}_{container_name}.log"), "ab") as log_file:
+                log_file.write(data)
+        except OSError as e:
+            logging.warning(f"({self.job_name}) Could not write the log of container {container_name}: {e}")
@@ -1,42 +1,84 @@
 import logging
-import requests
-import time
-import os
-import ast
 import re
-import tempfile
-import yaml
-import json
-
-from System.Platform.Instance import Instance
-from System.Platform import Platform, Process
-from System.Platform.Kubernetes.utils import api_request, get_api_sleep
-from collections import OrderedDict
+import time
+import threading
+
+from System.Platform.Kubernetes.utils import get_api_sleep, parse_quantity
 from threading import Thread
 
-from kubernetes import client, config, watch
+from kubernetes import watch
+from kubernetes.client.rest import ApiException
 
 
 class KubernetesStatusManager(object):
+    # Informer-style cache of the jobs and pods of the current run
+    # Objects are listed once and then watched from the listed resourceVersion, filtered by the run label.
+    # Watches resume from the last seen resourceVersion (or bookmark) and only relist once it expired (410 Gone).
+
+    # Label added to every job and pod of a run
+    RUN_LABEL = "cloud-conductor-run"
 
-    def __init__(self, batch_api, core_api, namespace):
+    # Number of consecutive watch failures after which job statuses are considered unavailable
+    MAX_WATCH_FAILURES = 5
+
+    # Time (sec) after which the API server closes a watch, which is then resumed
+    WATCH_TIMEOUT = 300
+
+    # HTTP status returned when the resourceVersion of a watch is too old
+    HTTP_GONE = 410
+
+    def __init__(self, batch_api, core_api, namespace, run_label_value=None):
 
         self.batch_api = batch_api
         self.core_api = core_api
         self.is_monitoring = False
         self.namespace = namespace
 
-        self.job_list = None
-        self.job_watch = None
-        self.job_watch_reset = 0
-        self.pod_watch = None
-        self.pod_watch_reset = 0
+        # Only watch the objects of the current run
+        self.label_selector = f"{self.RUN_LABEL}={run_label_value}" if run_label_value else None
+
+        # Cached jobs and latest pod of each job, indexed by job name
+        self.job_list = {}
+        self.pod_list = {}
+
+        # Names of the pods of each job that may still use their volumes (neither deleted nor terminated),
+        # and callbacks waiting for the pods of a set of jobs to terminate
+        self.active_pods = {}
+        self.termination_callbacks = []
+
+        # Events set whenever a job or one of its pods is updated, indexed by job name
+        self.lock = threading.Lock()
+        self.job_events = {}
+
+        # Active watches, indexed by resource kind
+        self.watches = {}
+        self.monitoring_failure = False
+
+        # Resources (vCPUs, GB) requested by the active pods of the run and allocatable on their nodes
+        self.pod_requests = {}
+        self.node_allocatable = {}
+
+        # Requested and allocatable resources of the used nodes integrated over time (resource-seconds)
+        self.packing = {"requested_cpu": 0, "allocatable_cpu": 0, "requested_mem": 0, "allocatable_mem": 0}
+        self.packing_time = None
+        self.node_seconds = {}
+
         # list of jobs that we want to log when we have updates
         self.log_update_list = {}
         self.pod_status_dict = {}
 
-        self.monitoring_thread = Thread(target=self.__monitor_jobs)
-        self.pod_monitoring_thread = Thread(target=self.__monitor_pods)
+        self.monitoring_thread = Thread(target=self.__monitor,
+                                        args=("job", self.batch_api.list_namespaced_job, self.__update_job))
+        self.pod_monitoring_thread = Thread(target=self.__monitor,
+                                            args=("pod", self.core_api.list_namespaced_pod, self.__update_pod))
+        self.monitoring_thread.daemon = True
+        self.pod_monitoring_thread.daemon = True
+
+    @staticmethod
+    def get_run_label_value(run_name):
+        # Label values are limited to 63 alphanumeric characters, '-', '_' or '.', starting and ending alphanumeric
+        value = re.sub(r"[^A-Za-z0-9_.-]", "-", run_name)[:63]
+        return value.strip("-_.")
 
     def start_job_monitoring(self):
         self.is_monitoring = True
@@ -45,127 +87,339 @@ class KubernetesStatusManager(object):
 
     def stop_job_monitoring(self):
         self.is_monitoring = False
-        if self.job_watch:
-            self.job_watch.stop()
-        if self.pod_watch:
-            self.pod_watch.stop()
+        for kind_watch in list(self.watches.values()):
+            kind_watch.stop()
+        self.__notify_all()
         logging.info("Stopped watching job status updates.")
 
-    def __monitor_pods(self):
-        global pod_monitoring_failure
-        pod_monitoring_failure = False
-        self.pod_status_dict = {}
-        while self.pod_watch_reset < 5 and self.is_monitoring:
+    def wait_for_update(self, job_name, timeout=None):
+        # Block until the job or one of its pods is updated, or until the timeout expires
+        # The event is cleared before returning, so the caller must read the job status afterwards
+        with self.lock:
+            event = self.__get_event(job_name)
+        updated = event.wait(timeout)
+        event.clear()
+        return updated
+
+    def __monitor(self, kind, list_func, update_func):
+        resource_version = None
+        failures = 0
+        while self.is_monitoring and failures < self.MAX_WATCH_FAILURES:
             try:
-                self.pod_watch = watch.Watch()
-                for event in self.pod_watch.stream(self.core_api.list_namespaced_pod, namespace=self.namespace):
-                    pod = event['object']
-                    if pod.kind == 'Pod':
-                        pod_job = None
-                        pod_name = pod.metadata.name
-                        if pod and 'job-name' in pod.metadata.labels:
-                            pod_job = pod.metadata.labels['job-name']
-                        if pod_job:
-                            if pod_job in self.log_update_list:
-                                self.pod_watch_reset = 0
-                                if pod.status.init_container_statuses and pod.status.container_statuses:
-                                    num_containers = len(pod.status.init_container_statuses) + len(pod.status.container_statuses)
-                                    current_running_container = None
-                                    container_index = 0
-                                    for container in pod.status.init_container_statuses:
-                                        if container.state.running:
-                                            current_running_container = container
-                                            break
-                                        container_index += 1
-                                    if not current_running_container:
-                                        for container in pod.status.container_statuses:
-                                            if container.state.running:
-                                                current_running_container = container
-                                                break
-                                            container_index += 1
-                                    if current_running_container:
-                                        new_index = container_index + 1
-                                        if pod_job in self.pod_status_dict and pod_name != self.pod_status_dict[pod_job]["pod_name"]:
-                                            self.pod_status_dict[pod_job] = {"checkpoint": new_index, "preemptions": self.pod_status_dict[pod_job]['preemptions'] + 1, "pod_name": pod_name}
-                                            if self.pod_status_dict[pod_job]['preemptions'] <= 2:
-                                                logging.info(f"({pod_job}) Job was preempted, is rerunning, and is on task {container_index + 1}/{num_containers}. Preemptions {self.pod_status_dict[pod_job]['preemptions']}/2")
-                                        else:
-                                            if (pod_job in self.pod_status_dict and new_index > self.pod_status_dict[pod_job]['checkpoint']) or pod_job not in self.pod_status_dict:
-                                                logging.info(f"({pod_job}) Job is currently on task {container_index + 1}/{num_containers}. Current running task: ({current_running_container.name})")
-                                            preempts = self.pod_status_dict[pod_job]['preemptions'] if pod_job in self.pod_status_dict else 0
-                                            self.pod_status_dict[pod_job] = {"checkpoint": new_index, "preemptions": preempts, "pod_name": pod_name}
-                    else:
-                        self.pod_watch.stop()
-                        self.pod_watch_reset += 1
-                        logging.warning(f"No pod info with event. We will try to reset the pod watch.")
-                        break
+                # List all objects only when starting or when the last resourceVersion has expired
+                if resource_version is None:
+                    resource_version = self.__relist(kind, list_func, update_func)
+
+                # Watch from the last seen resourceVersion, receiving bookmarks to keep it recent
+                kind_watch = watch.Watch()
+                self.watches[kind] = kind_watch
+                kwargs = {"namespace": self.namespace, "resource_version": resource_version,
+                          "allow_watch_bookmarks": True, "timeout_seconds": self.WATCH_TIMEOUT}
+                if self.label_selector:
+                    kwargs["label_selector"] = self.label_selector
+
+                for event in kind_watch.stream(list_func, **kwargs):
+                    if event["type"] == "ERROR":
+                        raise ApiException(status=event["raw_object"].get("code"),
+                                           reason=event["raw_object"].get("message"))
+
+                    obj = event["object"]
+                    resource_version = obj.metadata.resource_version
+                    failures = 0
+                    if event["type"] != "BOOKMARK":
+                        update_func(event["type"], obj)
+
+            except ApiException as e:
+                if e.status == self.HTTP_GONE:
+                    logging.debug(f"The {kind} watch expired. Listing the {kind}s again.")
+                    resource_version = None
+                    continue
+                failures += 1
+                logging.warning(f"Exception caught in {kind} watch. Will try to resume the watch. Exception caught: \n{str(e)}")
+                self.__sleep(failures)
             except Exception as e:
-                logging.warning(f"Exception caught in podnnnn watch. Will try to reset the watch. Exception caught: \n{str(e)}")
-                self.pod_watch.stop()
-                self.pod_watch_reset += 1
-        if self.pod_watch_reset >= 5:
-            pod_monitoring_failure = True
-            logging.error("Failure to setup the pod watch. Will not be able to get pod status from the Kubernetes cluster.")
-
-    def __monitor_jobs(self):
-        global job_monitoring_failure
-        job_monitoring_failure = False
-        while self.job_watch_reset < 5 and self.is_monitoring:
+                failures += 1
+                logging.warning(f"Exception caught in {kind} watch. Will try to resume the watch. Exception caught: \n{str(e)}")
+                self.__sleep(failures)
+
+        if failures >= self.MAX_WATCH_FAILURES:
+            self.monitoring_failure = True
+            self.__notify_all()
+            logging.error(f"Failure to setup the {kind} watch. Will not be able to get {kind} status from the Kubernetes cluster.")
+
+    def __relist(self, kind, list_func, update_func):
+        # Update the cached objects from a fresh list and return the resourceVersion to watch from
+        kwargs = {"namespace": self.namespace}
+        if self.label_selector:
+            kwargs["label_selector"] = self.label_selector
+        response = list_func(**kwargs)
+
+        # Drop jobs and pods deleted while the watch was down
+        listed = set(obj.metadata.name for obj in response.items)
+        if kind == "job":
+            with self.lock:
+                for job_name in [x for x in self.job_list if x not in listed]:
+                    del self.job_list[job_name]
+
+        elif kind == "pod":
+            with self.lock:
+                for job_name in [x for x, pod in self.pod_list.items() if pod.metadata.name not in listed]:
+                    del self.pod_list[job_name]
+                for job_name in list(self.active_pods):
+                    self.active_pods[job_name] &= listed
+                    if not self.active_pods[job_name]:
+                        del self.active_pods[job_name]
+                self.__integrate_packing()
+                for pod_name in [x for x in self.pod_requests if x not in listed]:
+                    del self.pod_requests[pod_name]
+
+        for obj in response.items:
+            update_func("ADDED", obj)
+
+        if kind == "pod":
+            self.__run_termination_callbacks()
+
+        return response.metadata.resource_version
+
+    def __update_job(self, event_type, job):
+        job_name = job.metadata.name
+        if not job_name:
+            return
+
+        with self.lock:
+            if event_type == "DELETED":
+                self.job_list.pop(job_name, None)
+            else:
+                self.job_list[job_name] = job
+            self.__get_event(job_name).set()
+
+        if job_name in self.log_update_list and event_type != "DELETED":
+            status_str = str(job.status).replace("\n", "")
+            logging.info(f"({job_name}) Job Status: {status_str}")
+            if job.status.succeeded:
+                self.remove_job_from_log_list(job_name)
+
+    def __update_pod(self, event_type, pod):
+        labels = pod.metadata.labels or {}
+        pod_job = labels.get("job-name", None)
+        if not pod_job:
+            return
+
+        # Pods being deleted stay active (and keep their volumes attached) until their containers stop
+        active = event_type != "DELETED" and not (pod.status and pod.status.phase in ["Succeeded", "Failed"])
+
+        with self.lock:
+            # Keep only the newest pod of each job, as events of an older pod (e.g. a preempted one) can arrive late
+            latest = self.__is_latest_pod(self.pod_list.get(pod_job, None), pod)
+            if event_type == "DELETED":
+                if pod_job in self.pod_list and self.pod_list[pod_job].metadata.name == pod.metadata.name:
+                    del self.pod_list[pod_job]
+            elif latest:
+                self.pod_list[pod_job] = pod
+
+            if active:
+                self.active_pods.setdefault(pod_job, set()).add(pod.metadata.name)
+            elif pod_job in self.active_pods:
+                self.active_pods[pod_job].discard(pod.metadata.name)
+                if not self.active_pods[pod_job]:
+                    del self.active_pods[pod_job]
+            self.__get_event(pod_job).set()
+
+        if not active:
+            self.__run_termination_callbacks()
+
+        self.__update_packing(event_type, pod)
+
+        if pod_job in self.log_update_list and event_type != "DELETED" and latest:
+            self.__update_pod_progress(pod_job, pod)
+
+    @staticmethod
+    def __is_latest_pod(cached_pod, pod):
+        # Whether the pod is at least as recent as the cached pod of its job
+        if cached_pod is None or cached_pod.metadata.name == pod.metadata.name:
+            return True
+        if cached_pod.metadata.creation_timestamp is None or pod.metadata.creation_timestamp is None:
+            return True
+        return pod.metadata.creation_timestamp >= cached_pod.metadata.creation_timestamp
+
+    def __update_pod_progress(self, pod_job, pod):
+        # Log the task currently running in the pod and count the preemptions of the job
+        if not pod.status.init_container_statuses or not pod.status.container_statuses:
+            return
+
+        pod_name = pod.metadata.name
+        num_containers = len(pod.status.init_container_statuses) + len(pod.status.container_statuses)
+        current_running_container = None
+        container_index = 0
+        for container in pod.status.init_container_statuses + pod.status.container_statuses:
+            if container.state.running:
+                current_running_container = container
+                break
+            container_index += 1
+
+        if not current_running_container:
+            return
+
+        new_index = container_index + 1
+        with self.lock:
+            if pod_job in self.pod_status_dict and pod_name != self.pod_status_dict[pod_job]["pod_name"]:
+                self.pod_status_dict[pod_job] = {"checkpoint": new_index, "preemptions": self.pod_status_dict[pod_job]['preemptions'] + 1, "pod_name": pod_name}
+                if self.pod_status_dict[pod_job]['preemptions'] <= 2:
+                    logging.info(f"({pod_job}) Job was preempted, is rerunning, and is on task {container_index + 1}/{num_containers}. Preemptions {self.pod_status_dict[pod_job]['preemptions']}/2")
+            else:
+                if (pod_job in self.pod_status_dict and new_index > self.pod_status_dict[pod_job]['checkpoint']) or pod_job not in self.pod_status_dict:
+                    logging.info(f"({pod_job}) Job is currently on task {container_index + 1}/{num_containers}. Current running task: ({current_running_container.name})")
+                preempts = self.pod_status_dict[pod_job]['preemptions'] if pod_job in self.pod_status_dict else 0
+                self.pod_status_dict[pod_job] = {"checkpoint": new_index, "preemptions": preempts, "pod_name": pod_name}
+
+    def on_pods_terminated(self, job_names, callback):
+        # Call back once all the pods of the jobs are deleted or terminated (right away if none is active)
+        with self.lock:
+            if any(job_name in self.active_pods for job_name in job_names):
+                self.termination_callbacks.append((set(job_names), callback))
+                return
+        callback()
+
+    def __run_termination_callbacks(self):
+        with self.lock:
+            ready = [x for x in self.termination_callbacks if not any(y in self.active_pods for y in x[0])]
+            self.termination_callbacks = [x for x in self.termination_callbacks if x not in ready]
+
+        for job_names, callback in ready:
             try:
-                self.job_watch = watch.Watch()
-                self.job_list = {}
-                for event in self.job_watch.stream(self.batch_api.list_namespaced_job, namespace=self.namespace):
-                    job_name = event['object'].metadata.name
-                    if job_name:
-                        self.job_watch_reset = 0
-                        self.job_list[str(job_name)] = event['object']
-                        if job_name in self.log_update_list:
-                            status_str = str(event['object'].status).replace("\n", "")
-                            logging.info(f"({job_name}) Job Status: {status_str}")
-                            if event['object'].status.succeeded:
-                                self.remove_job_from_log_list(job_name)
-                    else:
-                        self.job_watch.stop()
-                        self.job_watch_reset += 1
-                        logging.warning(f"No job info with event. We will try to reset the job watch.")
-                        break
+                callback()
             except Exception as e:
-                logging.warning(f"Exception caught in job watch. Will try to reset the watch. Exception caught: \n{str(e)}")
-                self.job_watch.stop()
-                self.job_watch_reset += 1
-        if self.job_watch_reset >= 5:
-            job_monitoring_failure = True
-            logging.error("Failure to setup the job watch. Will not be able to get job status from the Kubernetes cluster.")
+                logging.warning(f"Failure to run the pod termination callback of jobs {', '.join(job_names)}: {str(e)}")
+
+    def get_packing_stats(self):
+        # Requested over allocatable resources of the nodes running jobs of the run, averaged over time
+        with self.lock:
+            self.__integrate_packing()
+            packing = dict(self.packing)
+
+        if not packing["allocatable_cpu"]:
+            return {}
+        return {
+            "cpu_efficiency": round(packing["requested_cpu"] / packing["allocatable_cpu"], 4),
+            "mem_efficiency": round(packing["requested_mem"] / packing["allocatable_mem"], 4) if packing["allocatable_mem"] else None,
+            "node_hours": round(sum(self.__get_node_hours().values()), 4)
+        }
+
+    def __update_packing(self, event_type, pod):
+        # Track the resources requested by the active pods of the run on each node
+        pod_name = pod.metadata.name
+        node_name = pod.spec.node_name if pod.spec else None
+        active = event_type != "DELETED" and node_name and pod.status and pod.status.phase in ["Pending", "Running"]
+
+        if active and node_name not in self.node_allocatable:
+            self.__load_node(node_name)
+
+        with self.lock:
+            self.__integrate_packing()
+            if active:
+                self.pod_requests[pod_name] = (node_name,) + self.__get_pod_requests(pod)
+            else:
+                self.pod_requests.pop(pod_name, None)
+
+    def __load_node(self, node_name):
+        # Cache the resources allocatable to pods on a node
+        try:
+            allocatable = self.core_api.read_node(node_name).status.allocatable
+            self.node_allocatable[node_name] = (parse_quantity(allocatable["cpu"]),
+                                                parse_quantity(allocatable["memory"]) / 2**30)
+        except Exception as e:
+            logging.debug(f"Could not read the allocatable resources of node {node_name}: {str(e)}")
+
+    @staticmethod
+    def __get_pod_requests(pod):
+        # Init containers run one after the other, so the pod requests the most of its largest init container
+        # and of the sum of its containers
+        def get_requests(containers):
+            requests = []
+            for container in containers or []:
+                container_requests = (container.resources.requests if container.resources else None) or {}
+                requests.append((parse_quantity(container_requests.get("cpu", 0)),
+                                 parse_quantity(container_requests.get("memory", 0)) / 2**30))
+            return requests
+
+        init_requests = get_requests(pod.spec.init_containers)
+        requests = get_requests(pod.spec.containers)
+        cpu = max([x[0] for x in init_requests] + [sum(x[0] for x in requests)])
+        mem = max([x[1] for x in init_requests] + [sum(x[1] for x in requests)])
+        return cpu, mem
+
+    def __integrate_packing(self):
+        # Must be called while holding the lock
+        now = time.time()
+        elapsed = now - self.packing_time if self.packing_time is not None else 0
+        self.packing_time = now
+        if not elapsed:
+            return
+
+        used_nodes = set()
+        for node_name, cpu, mem in self.pod_requests.values():
+            if node_name in self.node_allocatable:
+                used_nodes.add(node_name)
+                self.packing["requested_cpu"] += cpu * elapsed
+                self.packing["requested_mem"] += mem * elapsed
+
+        for node_name in used_nodes:
+            self.packing["allocatable_cpu"] += self.node_allocatable[node_name][0] * elapsed
+            self.packing["allocatable_mem"] += self.node_allocatable[node_name][1] * elapsed
+            self.node_seconds[node_name] = self.node_seconds.get(node_name, 0) + elapsed
+
+    def __get_node_hours(self):
+        with self.lock:
+            return {node_name: seconds / 3600.0 for node_name, seconds in self.node_seconds.items()}
+
+    def __get_event(self, job_name):
+        # Must be called while holding the lock
+        if job_name not in self.job_events:
+            self.job_events[job_name] = threading.Event()
+        return self.job_events[job_name]
+
+    def __notify_all(self):
+        with self.lock:
+            for event in self.job_events.values():
+                event.set()
+
+    def __sleep(self, failures):
+        # Back off before resuming a failed watch
+        time.sleep(get_api_sleep(failures))
 
     def add_job_to_log_list(self, job_name):
         self.log_update_list[job_name] = True
 
     def remove_job_from_log_list(self, job_name):
-        del self.log_update_list[job_name]
+        self.log_update_list.pop(job_name, None)
 
     def update_statuses(self):
+        # Refresh the cached jobs outside of the watch
         try:
-            response = api_request(self.batch_api.list_namespaced_job, namespace=self.namespace)
-            if response and response.get("items"):
-                self.job_list = {job.get("metadata", {}).get("name"): job for job in response.get("items")}
+            self.__relist("job", self.batch_api.list_namespaced_job, self.__update_job)
         except Exception:
             logging.error("Error with updating the job list to check statuses.")
 
     def check_monitoring_status(self):
-        if job_monitoring_failure or pod_monitoring_failure:
+        if self.monitoring_failure:
             raise RuntimeError("Failure to get pod/job status stream connected. Stopping execution.")
 
     def get_job_status(self, job_name, force_refresh=False):
         self.check_monitoring_status()
         self.add_job_to_log_list(job_name)
-        if self.job_list and job_name in self.job_list:
-            pod_status = [val for key, val in self.pod_status_dict.items() if job_name in key]
-            if pod_status and pod_status[0]:
-                return self.job_list[job_name].status, pod_status[0]['preemptions']
-            return self.job_list[job_name].status, 0
+        with self.lock:
+            job = self.job_list.get(job_name, None)
+            pod_status = self.pod_status_dict.get(job_name, None)
+        if job is not None:
+            if pod_status:
+                return job.status, pod_status['preemptions']
+            return job.status, 0
         return "", 0
 
     def get_job_info(self, job_name, force_refresh=False):
-        if self.job_list and job_name in self.job_list:
-            return self.job_list[job_name]
-        return ""
+        with self.lock:
+            return self.job_list.get(job_name, "")
+
+    def get_pod_info(self, job_name):
+        with self.lock:
+            return self.pod_list.get(job_name, None)
@@ -0,0 +1,144 @@
+import bisect
+import logging
+import threading
+import time
+
+from System.Platform.Platform import Platform
+from System.Platform.Kubernetes.utils import api_request, get_api_sleep
+
+from kubernetes import client
+
+
+class KubernetesVolumePool(object):
+    # Pool of persistent volume claims reused by the jobs of a run
+    # Claims are grouped in size classes; a job leases the smallest class fitting its disk space and
+    # returns the claim once its pods are gone. Idle claims are kept only while jobs are waiting for that class.
+    # Claims are zonal and bound where they are first used, so they are only reused within the same node pool.
+
+    def __init__(self, core_api, namespace, name_prefix, size_classes, storage_class="standard", min_idle=0, labels=None):
+
+        self.core_api = core_api
+        self.namespace = namespace
+        self.name_prefix = name_prefix
+        self.storage_class = storage_class
+        self.labels = labels or {}
+
+        # Sizes (GB) of the claims in the pool
+        self.size_classes = sorted(size_classes)
+
+        # Number of idle claims kept per size class regardless of the queue
+        self.min_idle = min_idle
+
+        # Idle claims, leased claims (name to node pool and size class) and jobs created but not started,
+        # per node pool and size class
+        self.idle = {}
+        self.leased = {}
+        self.queued = {}
+
+        # Number of claims created and leases served by an already provisioned claim
+        self.created = 0
+        self.reused = 0
+
+        self.lock = threading.Lock()
+
+    def get_size_class(self, disk_space):
+        # Return the smallest size class fitting disk_space GB (None if it is larger than all classes)
+        idx = bisect.bisect_left(self.size_classes, disk_space)
+        return self.size_classes[idx] if idx < len(self.size_classes) else None
+
+    def add_to_queue(self, disk_space, node_pool):
+        # Register a job of a node pool that will lease a claim once it starts
+        size = self.get_size_class(disk_space)
+        if size is None:
+            return
+        with self.lock:
+            self.queued[(node_pool, size)] = self.queued.get((node_pool, size), 0) + 1
+
+    def lease(self, disk_space, node_pool):
+        # Return the name of a claim of at least disk_space GB for a job of the node pool,
+        # or None if the pool has no fitting size class
+        size = self.get_size_class(disk_space)
+        if size is None:
+            return None
+
+        key = (node_pool, size)
+        with self.lock:
+            self.queued[key] = max(self.queued.get(key, 0) - 1, 0)
+            pvc_name = self.idle[key].pop() if self.idle.get(key) else None
+            if pvc_name is not None:
+                self.leased[pvc_name] = key
+                self.reused += 1
+                logging.debug(f"Leased persistent volume claim {pvc_name} ({size}GB) from the pool of {node_pool}.")
+                return pvc_name
+
+        pvc_name = self.__create_claim(size)
+        with self.lock:
+            self.leased[pvc_name] = key
+            self.created += 1
+        return pvc_name
+
+    def release(self, pvc_name):
+        # Return a claim to the pool, deleting it if no queued job is expected to need it
+        # Must only be called once no pod uses the claim anymore, as it can only be attached to one node
+        with self.lock:
+            key = self.leased.pop(pvc_name, None)
+            if key is None:
+                return
+
+            keep = len(self.idle.get(key, [])) < self.queued.get(key, 0) + self.min_idle
+            if keep:
+                self.idle.setdefault(key, []).append(pvc_name)
+
+        if keep:
+            logging.debug(f"Returned persistent volume claim {pvc_name} ({key[1]}GB) to the pool of {key[0]}.")
+        else:
+            self.__delete_claim(pvc_name)
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                "created": self.created,
+                "reused": self.reused,
+                "idle": sum(len(x) for x in self.idle.values()),
+                "leased": len(self.leased)
+            }
+
+    def clean_up(self):
+        # Delete all the claims of the pool
+        with self.lock:
+            pvc_names = [x for claims in self.idle.values() for x in claims] + list(self.leased)
+            self.idle = {}
+            self.leased = {}
+
+        for pvc_name in pvc_names:
+            self.__delete_claim(pvc_name)
+
+    def __create_claim(self, size):
+        pvc_name = f"{self.name_prefix}-{size}g-{Platform.generate_unique_id()}"
+        pvc_meta = client.V1ObjectMeta(name=pvc_name, namespace=self.namespace, labels=dict(self.labels))
+        pvc_resources = client.V1ResourceRequirements(requests={'storage': f"{size}Gi"})
+        pvc_spec = client.V1PersistentVolumeClaimSpec(access_modes=['ReadWriteOnce'], resources=pvc_resources,
+                                                      storage_class_name=self.storage_class)
+        pvc = client.V1PersistentVolumeClaim(metadata=pvc_meta, spec=pvc_spec)
+
+        for i in range(10):
+            pvc_response = api_request(self.core_api.create_namespaced_persistent_volume_claim, self.namespace, pvc)
+            pvc_status = pvc_response.get("status", None)
+            if pvc_status and isinstance(pvc_status, dict):
+                logging.debug(f"Persistent volume claim {pvc_name} ({size}GB) added to the pool.")
+                return pvc_name
+
+            if 'Connection aborted' in str(pvc_response) or 'Connection reset' in str(pvc_response):
+                time.sleep(get_api_sleep(i+1))
+                continue
+            break
+
+        raise RuntimeError(f"Failure to create a Persistent Volume Claim for the pool. Response: {str(pvc_response)}")
+
+    def __delete_claim(self, pvc_name):
+        pvc_response = api_request(self.core_api.delete_namespaced_persistent_volume_claim, pvc_name, self.namespace)
+        pvc_status = pvc_response.get("status", None)
+        if pvc_status == 'Failure' and 'not found' not in pvc_response.get('message', ''):
+            logging.warning(f"Failed to destroy pooled Persistent Volume Claim {pvc_name}. Message: {pvc_response.get('message', '')}")
+        else:
+            logging.debug(f"Persistent volume claim {pvc_name} removed from the pool.")
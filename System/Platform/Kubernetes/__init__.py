@@ -1,3 +1,6 @@
+from .KubernetesVolumePool import KubernetesVolumePool
+from .KubernetesLogStreamer import KubernetesLogStreamer
+from .KubernetesCodeBundle import KubernetesCodeBundle
 from .KubernetesJob import KubernetesJob
 from .KubernetesCluster import KubernetesCluster
 from .KubernetesStatusManager import KubernetesStatusManager
@@ -117,3 +117,20 @@ def get_dict_value(dictionary, *keys, default=None):
             return default
         d = d.get(key, dict())
     return d
+
+
+def parse_quantity(quantity):
+    """Convert a Kubernetes resource quantity (e.g. '3920m', '15Gi', '500M', '4') to a number.
+
+    Returns: The number of cores for CPU quantities, or the number of bytes for memory quantities.
+
+    """
+    suffixes = {
+        "m": 1e-3, "k": 1e3, "M": 1e6, "G": 1e9, "T": 1e12,
+        "Ki": 2**10, "Mi": 2**20, "Gi": 2**30, "Ti": 2**40
+    }
+    quantity = str(quantity)
+    for suffix in sorted(suffixes, key=len, reverse=True):
+        if quantity.endswith(suffix):
+            return float(quantity[:-len(suffix)]) * suffixes[suffix]
+    return float(quantity)
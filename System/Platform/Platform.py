@@ -13,7 +13,7 @@ from cryptography.hazmat.backends import default_backend
 
 from Config import ConfigParser
 from System import CC_MAIN_DIR
-from System.Platform import Process
+from System.Platform import Process, CapacityTracker
 
 
 class Platform(object, metaclass=abc.ABCMeta):
@@ -79,6 +79,23 @@ class Platform(object, metaclass=abc.ABCMeta):
     def get_final_output_dir(self):
         return self.final_output_dir
 
+    def get_capacity_stats(self):
+        # Preemptible capacity statistics per zone (empty if the platform does not track them)
+        return {}
+
+    def get_packing_stats(self):
+        # Requested over allocatable resources of the nodes used by the run (empty if the platform does not track them)
+        return {}
+
+    def get_shared_workspace(self):
+        # Directory shared by all processors of the run for temporary outputs (None if there is none)
+        return None
+
+    def rm_shared_paths(self, paths):
+        # Delete paths of the shared workspace and return whether the deletion was started
+        # Platforms without a shared workspace have nothing to delete
+        return False
+
     # ABSTRACT METHODS TO BE IMPLEMENTED BY INHERITING CLASSES
 
     @abc.abstractmethod
@@ -150,6 +167,13 @@ class CloudPlatform(Platform, metaclass=abc.ABCMeta):
         # Dictionary to hold instances currently managed by the platform
         self.instances = {}
 
+        # Poller shared by all instances for obtaining their status (None if instances query their own status)
+        self.status_poller = None
+
+        # Zones where preemptible instances can be created and tracker of their recent capacity
+        self.preemptible_zones = self.extra.get("preemptible_zones", None) or [self.zone]
+        self.capacity_tracker = CapacityTracker(window=self.extra.get("capacity_window", 3600))
+
         # Platform resource threading lock
         self.platform_lock = threading.Lock()
 
@@ -306,6 +330,18 @@ class CloudPlatform(Platform, metaclass=abc.ABCMeta):
             # Raise the actual exception
             raise
 
+    def get_status_poller(self):
+        return self.status_poller
+
+    def get_preemptible_zones(self):
+        return self.preemptible_zones
+
+    def get_capacity_tracker(self):
+        return self.capacity_tracker
+
+    def get_capacity_stats(self):
+        return self.capacity_tracker.get_zone_stats()
+
     def lock(self):
         with self.platform_lock:
             self.__locked = True
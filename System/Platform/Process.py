@@ -12,6 +12,7 @@ class Process(sp.Popen):
         self.num_retries = kwargs.pop("num_retries", 0)
         self.docker_image = kwargs.pop("docker_image", None)
         self.docker_entrypoint = kwargs.pop("docker_entrypoint", None)
+        self.docker_container = kwargs.pop("docker_container", None)
 
         # Initialize process status
         self.complete = False
@@ -62,6 +63,9 @@ class Process(sp.Popen):
     def get_docker_entrypoint(self):
         return self.docker_entrypoint
 
+    def get_docker_container(self):
+        return self.docker_container
+
     def get_output(self):
         return self.out, self.err
 
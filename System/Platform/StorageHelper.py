@@ -1,8 +1,10 @@
 import logging
 import os
 import time
+import threading
 
 from System.Platform import Platform
+from System.Workers import ThreadPool, PoolWorker
 import traceback
 from Aries.storage import StorageFile, StoragePrefix, StorageFolder
 
@@ -14,10 +16,20 @@ class InvalidStorageTypeError(Exception):
 class StorageHelper(object):
     # Class designed to facilitate remote file manipulations for a processor
 
+    # Transfers up to this size (GB) are treated as small files and moved in bulk
+    SMALL_TRANSFER_SIZE = 0.25
+
+    # Files above this size (GB) are moved as parallel multipart streams
+    LARGE_TRANSFER_SIZE = 5
+
     def __init__(self, proc):
         self.proc = proc
 
-    def mv(self, src_path, dest_path, job_name=None, log=True, wait=False, **kwargs):
+        # Thread pool deleting sub-folders in parallel, created on first use and reused by every delete
+        self.delete_pool = None
+        self.delete_pool_lock = threading.Lock()
+
+    def mv(self, src_path, dest_path, job_name=None, log=True, wait=False, file_size=None, **kwargs):
         # Transfer file or dir from src_path to dest_path
         # Log the transfer unless otherwise specified
         cmd_generator = StorageHelper.__get_storage_cmd_generator(src_path, dest_path)
@@ -25,6 +37,12 @@ class StorageHelper(object):
 
         job_name = f"mv_{Platform.generate_unique_id()}" if job_name is None else job_name
 
+        # Tune rclone concurrency and buffers to the size of the transfer
+        if cmd_generator.PROTOCOL != "Local":
+            nr_cpus = getattr(self.proc, "nr_cpus", None)
+            transfer_flags = self.get_transfer_flags(cmd_generator.PROTOCOL, file_size, nr_cpus)
+            cmd = f"{cmd} {transfer_flags}" if transfer_flags else cmd
+
         # Optionally add logging
         cmd = f"{cmd} !LOG3!" if log else cmd
 
@@ -39,6 +57,38 @@ class StorageHelper(object):
             self.proc.wait_process(job_name)
         return job_name
 
+    @staticmethod
+    def get_transfer_flags(protocol, file_size=None, nr_cpus=None):
+        # Return rclone flags suited to the size (GB) of the transfer and the vCPUs of the processor
+        # Transfers of unknown size keep the rclone defaults
+        if file_size is None:
+            return ""
+
+        nr_cpus = 1 if not nr_cpus else int(nr_cpus)
+
+        # Small files (or sets of them) are copied in bulk with many concurrent transfers
+        if file_size <= StorageHelper.SMALL_TRANSFER_SIZE:
+            transfers = min(max(8, 4 * nr_cpus), 64)
+            return f"--transfers {transfers} --checkers {transfers} --buffer-size 4M"
+
+        # Medium files use the rclone defaults with a larger buffer
+        if file_size <= StorageHelper.LARGE_TRANSFER_SIZE:
+            streams = min(max(4, nr_cpus), 16)
+            flags = f"--transfers 4 --multi-thread-streams {streams} --multi-thread-cutoff 256M --buffer-size 32M"
+            chunk_size = "32M"
+
+        # Large files are moved as parallel multipart streams
+        else:
+            streams = min(max(8, 2 * nr_cpus), 32)
+            flags = f"--transfers 2 --multi-thread-streams {streams} --multi-thread-cutoff 256M --buffer-size 128M"
+            chunk_size = "128M"
+
+        # Multipart upload settings are specific to S3
+        if protocol == "s3":
+            flags += f" --s3-chunk-size {chunk_size} --s3-upload-concurrency {streams}"
+
+        return flags
+
     def mkdir(self, dir_path, job_name=None, log=False, wait=False, **kwargs):
         # Makes a directory if it doesn't already exists
         cmd_generator = StorageHelper.__get_storage_cmd_generator(dir_path)
@@ -58,6 +108,26 @@ class StorageHelper(object):
             self.proc.wait_process(job_name)
         return job_name
 
+    def mkdirs(self, dir_paths, job_name=None, log=False, wait=False, **kwargs):
+        # Makes several directories in a single command, skipping the ones that don't need to be created
+        cmds = [StorageHelper.__get_storage_cmd_generator(dir_path).mkdir(dir_path) for dir_path in dir_paths]
+        cmds = [cmd for cmd in cmds if cmd is not None]
+
+        if not cmds:
+            return None
+
+        job_name = f"mkdir_{Platform.generate_unique_id()}" if job_name is None else job_name
+
+        # Optionally add logging
+        cmd = " && ".join(cmds)
+        cmd = f"{cmd} !LOG3!" if log else cmd
+
+        # Run command and return job name
+        self.proc.run(job_name, cmd, **kwargs)
+        if wait:
+            self.proc.wait_process(job_name)
+        return job_name
+
     def path_exists(self, path, job_name=None, **kwargs):
 
         # Ignore local paths
@@ -84,6 +154,22 @@ class StorageHelper(object):
             logging.error(f"Unable to check path existence: {path}")
             raise
 
+    def read_file(self, path):
+        # Return the content of a small remote file (None if it does not exist or cannot be read)
+        if self.__get_file_protocol(path) == "Local":
+            return None
+
+        try:
+            _file = StorageFile(path)
+            if not _file.exists():
+                return None
+            with StorageFile.init(path, "r") as inp:
+                content = inp.read()
+            return content.decode("utf8") if isinstance(content, bytes) else content
+        except BaseException as e:
+            logging.debug(f"Unable to read {path}: {e}")
+            return None
+
     def get_file_size(self, path, job_name=None, **kwargs):
 
         retry_count = kwargs.get("retry_count", 0)
@@ -140,15 +226,75 @@ class StorageHelper(object):
             logging.warning(f"Failed to get size of '{path}'! Attempted to retrieve size {retry_count + 1} times.")
             return 0
 
-    def rm(self, path, job_name=None, log=True, wait=False, **kwargs):
+    def list_prefix(self, prefix, delimiter="/"):
+        # Return metadata of every object found directly under a remote prefix
+        # The storage clients paginate the listing, so a single call answers existence and size for many objects
+        protocol = self.__get_file_protocol(prefix)
+
+        # Local paths are never listed
+        if protocol == "Local":
+            return {}
+
+        logging.debug(f"Listing objects under {prefix}...")
+        _prefix = StoragePrefix(prefix).raw
+        bucket_name = _prefix.bucket_name
+
+        objects = {}
+        if protocol == "gs":
+            for blob in _prefix.blobs(delimiter=delimiter):
+                if blob.name.endswith("/"):
+                    continue
+                objects[f"gs://{bucket_name}/{blob.name}"] = {
+                    "size": blob.size,
+                    "etag": blob.etag,
+                    "generation": blob.generation
+                }
+
+        elif protocol == "s3":
+            for obj in _prefix.blobs(delimiter=delimiter):
+                if obj.key.endswith("/"):
+                    continue
+                objects[f"s3://{bucket_name}/{obj.key}"] = {
+                    "size": obj.size,
+                    "etag": obj.e_tag.strip('"'),
+                    "generation": None
+                }
+
+        else:
+            logging.error(f"StorageHelper cannot list objects with protocol '{protocol}'!")
+            raise InvalidStorageTypeError("Cannot list input file storage type!")
+
+        return objects
+
+    def rm(self, path, job_name=None, log=True, wait=False, num_threads=1, **kwargs):
         # Delete file from file system
         # Log the transfer unless otherwise specified
 
-        # Create prefix object
-        _prefix_path = StoragePrefix(path)
-
         try:
-
+            # Delete single files exactly so that other files sharing their name as prefix are kept
+            if not path.endswith("/") and not path.endswith("*"):
+                _file = StorageFile(path)
+                if _file.exists():
+                    _file.delete()
+                    return
+
+                # Otherwise the path is a folder
+                path = f"{path}/"
+
+            # Create prefix object
+            _prefix_path = StoragePrefix(path.rstrip("*"))
+
+            # Delete each sub-folder concurrently to spread the delete calls across threads
+            if num_threads > 1:
+                sub_folders = [_folder.uri for _folder in _prefix_path.folders]
+                if len(sub_folders) > 1:
+                    logging.debug(f"Deleting {len(sub_folders)} sub-folders of {path} using {num_threads} threads.")
+                    thread_pool = self.__get_delete_pool(num_threads)
+                    for sub_folder in sub_folders:
+                        thread_pool.add_task(sub_folder)
+                    thread_pool.wait_completion()
+
+            # Delete whatever remains under the prefix
             if _prefix_path.exists():
                 _prefix_path.delete()
 
@@ -156,6 +302,12 @@ class StorageHelper(object):
             logging.error(f"Unable to delete path: {path}")
             raise
 
+    def __get_delete_pool(self, num_threads):
+        with self.delete_pool_lock:
+            if self.delete_pool is None:
+                self.delete_pool = ThreadPool(num_threads, worker_class=DeleteWorker, storage_helper=self)
+            return self.delete_pool
+
     @staticmethod
     def __get_storage_cmd_generator(src_path, dest_path=None):
         # Determine the class of file handler to use base on input file protocol types
@@ -199,6 +351,29 @@ class StorageHelper(object):
         return path.rstrip("/").split("/")[-1]
 
 
+class DeleteWorker(PoolWorker):
+    # ThreadPool worker for deleting remote paths in parallel
+    def __init__(self, task_queue, storage_helper=None):
+
+        # Storage helper used to delete paths
+        self.storage_helper = storage_helper
+
+        # Start running task worker
+        super(DeleteWorker, self).__init__(task_queue)
+
+    def task(self, path, on_delete=None):
+        try:
+            self.storage_helper.rm(path)
+        except BaseException as e:
+            # Paths that cannot be deleted are left for the end-of-run cleanup
+            logging.warning(f"Unable to delete {path}: {e}")
+            return
+
+        # Notify caller that path has been deleted
+        if on_delete is not None:
+            on_delete(path)
+
+
 class StorageCmdGenerator(object):
     PROTOCOL = None
 
@@ -0,0 +1,75 @@
+import os
+import json
+import logging
+import threading
+
+from System import CC_CACHE_DIR
+
+
+class ValidationCache(object):
+    # Local on-disk cache of docker image metadata that stays valid across pipeline runs
+    # Images are keyed by image name and invalidated when their registry digest changes
+
+    def __init__(self, cache_file=None):
+
+        # Path of the JSON file where the cache is persisted
+        self.cache_file = os.path.join(CC_CACHE_DIR, "validation_cache.json") if cache_file is None else cache_file
+
+        # Lock for accessing the cache from multiple validation threads
+        self.cache_lock = threading.Lock()
+
+        # Cached metadata
+        self.dockers = {}
+
+        self.__load()
+
+    def get_docker_size(self, image_name, digest):
+        # Return cached size (GB) of a docker image if its digest is unchanged, otherwise None
+        with self.cache_lock:
+            entry = self.dockers.get(image_name)
+            if entry is None:
+                return None
+
+            # Invalidate entry if the image was pushed again since it was cached
+            if entry["digest"] != digest:
+                logging.debug(f"Validation cache entry for docker image {image_name} is outdated!")
+                del self.dockers[image_name]
+                return None
+
+            return entry["size"]
+
+    def set_docker(self, image_name, digest, size):
+        with self.cache_lock:
+            self.dockers[image_name] = {
+                "digest": digest,
+                "size": size
+            }
+
+    def save(self):
+        # Persist cache to disk
+        with self.cache_lock:
+            try:
+                os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+
+                # Write to a temporary file first so that an interrupted run cannot corrupt the cache
+                tmp_file = f"{self.cache_file}.tmp"
+                with open(tmp_file, "w") as out:
+                    json.dump({"dockers": self.dockers}, out, indent=4)
+                os.replace(tmp_file, self.cache_file)
+
+            except OSError as e:
+                logging.warning(f"Unable to save validation cache to {self.cache_file}: {e}")
+
+    def __load(self):
+        # Load cache from disk if available
+        if not os.path.exists(self.cache_file):
+            return
+
+        try:
+            with open(self.cache_file) as inp:
+                data = json.load(inp)
+            self.dockers = data.get("dockers", {})
+
+        except (OSError, ValueError) as e:
+            logging.warning(f"Unable to load validation cache from {self.cache_file}. Starting with empty cache: {e}")
+            self.dockers = {}
@@ -1,7 +1,11 @@
 from .Process import Process
 
+from .InstanceStatusPoller import InstanceStatusPoller
+from .CapacityTracker import CapacityTracker
 from .Platform import Platform, CloudPlatform
 from .Instance import Instance, CloudInstance
 
 from .StorageHelper import StorageHelper
 from .DockerHelper import DockerHelper
+from .DockerImageManager import DockerImageManager
+from .ValidationCache import ValidationCache
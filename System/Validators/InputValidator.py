@@ -16,8 +16,13 @@ class InputValidator(Validator):
         self.storage_helper = storage_helper
         self.docker_helper  = docker_helper
 
-        # Create thread pool for parallelizing input file validation
-        self.thread_pool = ThreadPool(num_threads, worker_class=InputWorker, storage_helper=self.storage_helper, docker_helper=self.docker_helper)
+        # Object listings of remote parent prefixes, indexed by prefix
+        self.listings = {}
+
+        # Create thread pools for parallelizing prefix listing and input file validation
+        self.listing_pool = ThreadPool(num_threads, worker_class=PrefixListWorker, storage_helper=self.storage_helper, listings=self.listings)
+        self.thread_pool = ThreadPool(num_threads, worker_class=InputWorker, storage_helper=self.storage_helper, docker_helper=self.docker_helper,
+                                      listings=self.listings)
 
     def validate(self):
 
@@ -31,6 +36,14 @@ class InputValidator(Validator):
         # Check sample data paths
         inputs["sample"] = self.__get_sample_data_paths()
 
+        # List every parent prefix once so most files are validated without per-file calls
+        for prefix in self.__get_parent_prefixes(inputs["resource"] + inputs["sample"]):
+            logging.info("Listing %s..." % prefix)
+            self.listing_pool.add_task(prefix)
+
+        # Wait for all listings to finish
+        self.listing_pool.wait_completion()
+
         # Validate all files by adding them to thread pool's queue
         for input_file_src in inputs:
             for input_file in inputs[input_file_src]:
@@ -89,6 +102,18 @@ class InputValidator(Validator):
         else:
             return "Docker '%s' with image %s" % (input_obj.get_ID(), input_obj.get_image_name())
 
+    @staticmethod
+    def __get_parent_prefixes(input_files):
+        # Return the set of remote parent prefixes containing the input files
+        prefixes = set()
+        for input_file in input_files:
+            if not isinstance(input_file, GAPFile):
+                continue
+            parent = InputWorker.get_parent_prefix(input_file)
+            if parent is not None:
+                prefixes.add(parent)
+        return sorted(prefixes)
+
     def __get_resource_paths(self):
         # Check whether all paths in resource kit exist
         # Obtain the resource paths
@@ -125,14 +150,43 @@ class InputValidator(Validator):
         return paths
 
 
+class PrefixListWorker(PoolWorker):
+    # ThreadPool worker for listing all objects directly under a remote prefix
+    def __init__(self, task_queue, storage_helper=None, listings=None):
+
+        # Storage helper used to list prefixes
+        self.storage_helper = storage_helper
+
+        # Shared dictionary where listings are saved
+        self.listings = listings
+
+        # Check to make sure it's the correct class
+        assert isinstance(storage_helper, StorageHelper), "PrefixListWorker needs valid StorageHelper class upon instantiation!"
+
+        # Start running task worker
+        super(PrefixListWorker, self).__init__(task_queue)
+
+    def task(self, prefix):
+        try:
+            self.listings[prefix] = self.storage_helper.list_prefix(prefix)
+        except BaseException as e:
+            # Files under an unlisted prefix are validated individually by the InputWorker
+            logging.warning("Unable to list %s! Files under it will be validated individually." % prefix)
+            if str(e) != "":
+                logging.debug("Received the following msg:\n%s" % e)
+
+
 class InputWorker(PoolWorker):
     # ThreadPool worker for determining whether a single input (docker images/files, etc.) exists
-    def __init__(self, task_queue, storage_helper=None, docker_helper=None):
+    def __init__(self, task_queue, storage_helper=None, docker_helper=None, listings=None):
 
         # Docker and storage helpers used to check existence of inputs
         self.storage_helper = storage_helper
         self.docker_helper  = docker_helper
 
+        # Object listings of remote parent prefixes
+        self.listings = {} if listings is None else listings
+
         # Check to make sure they're the correct class
         assert isinstance(storage_helper, StorageHelper), "InputWorker needs valid StorageHelper class upon instantiation!"
         assert isinstance(docker_helper, DockerHelper), "InputWorker needs valid DockerHelper class upon instantiation!"
@@ -165,7 +219,40 @@ class InputWorker(PoolWorker):
             logging.error("Unable to validate %s!" % input_desc)
             raise
 
+    @staticmethod
+    def get_parent_prefix(input_obj):
+        # Return the remote prefix whose listing contains the input file, if it can be listed
+        # Files in containing directories are checked individually
+        if not input_obj.is_remote() or input_obj.get_containing_dir() is not None:
+            return None
+        return input_obj.get_path().rsplit("/", 1)[0] + "/"
+
+    def get_listed_object(self, input_obj):
+        # Return the listed metadata (e.g. size in bytes) of an input file found in a prefix listing, or None if not found
+        listing = self.listings.get(self.get_parent_prefix(input_obj))
+        if not listing:
+            return None
+
+        path = input_obj.get_path()
+
+        # Prefix files are the sum of all objects sharing the prefix
+        if input_obj.is_prefix():
+            objs = [obj for uri, obj in sorted(listing.items()) if uri.startswith(path)]
+            if not objs:
+                return None
+            return {"size": sum(obj["size"] for obj in objs)}
+
+        return listing.get(path)
+
     def validate_file(self, input_obj):
+        # Use the prefix listing if the file was found there
+        listed_obj = self.get_listed_object(input_obj)
+        if listed_obj is not None:
+            input_obj.unflag("missing")
+            input_obj.set_size(float(listed_obj["size"])/2**30)
+            return
+
+        # Otherwise fall back to per-object checks
         # Check whether input file exists
         path_to_check = input_obj.get_transferrable_path() if input_obj.is_prefix() else input_obj.get_path()
 
@@ -69,9 +69,9 @@ class PoolWorker(threading.Thread):
 
 class ThreadPool:
     """ Pool of threads consuming tasks from a queue """
-    def __init__(self, num_threads, worker_class=None, **worker_kwargs):
-        # Create task queue
-        self.tasks = Queue(num_threads)
+    def __init__(self, num_threads, worker_class=None, queue_size=None, **worker_kwargs):
+        # Create task queue (bounded to the number of threads by default, 0 for an unbounded queue)
+        self.tasks = Queue(num_threads if queue_size is None else queue_size)
 
         # Set class of Worker in thread pool
         self.worker_class = PoolWorker if worker_class is None else worker_class
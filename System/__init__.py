@@ -1,5 +1,8 @@
 # Define the main CloudConductor directory
-from os.path import dirname, abspath
+from os.path import dirname, abspath, expanduser, join
 CC_MAIN_DIR = dirname(dirname(abspath(__file__)))
 
+# Define the directory where CloudConductor caches data across runs
+CC_CACHE_DIR = join(expanduser("~"), ".cloud_conductor")
+
 from .GAPipeline import GAPipeline, GAPReport
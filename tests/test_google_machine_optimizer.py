@@ -0,0 +1,161 @@
+import unittest
+from unittest import mock
+
+from System.Platform.Google import GooglePricing, GoogleMachineOptimizer
+
+
+REGION = "us-east1"
+
+# Offline snapshot of the indexed price catalog (hourly compute prices, monthly storage prices)
+COMPUTE_PRICES = {
+    ("custom", REGION, False):      {"core": 0.0332, "ram": 0.0045, "extended-ram": 0.0095},
+    ("n2-custom", REGION, False):   {"core": 0.0331, "ram": 0.0044, "extended-ram": 0.0095},
+    ("n2d-custom", REGION, False):  {"core": 0.0288, "ram": 0.0039, "extended-ram": 0.0083},
+    ("e2-custom", REGION, False):   {"core": 0.0226, "ram": 0.0030},
+    ("custom", REGION, True):       {"core": 0.0070, "ram": 0.0010, "extended-ram": 0.0020},
+    ("n2-custom", REGION, True):    {"core": 0.0080, "ram": 0.0011, "extended-ram": 0.0023},
+    ("n2d-custom", REGION, True):   {"core": 0.0070, "ram": 0.0009, "extended-ram": 0.0020},
+    ("e2-custom", REGION, True):    {"core": 0.0068, "ram": 0.0009}
+}
+
+PREDEFINED_TYPES = {
+    (REGION, False): [
+        {"name": "n1-standard-4",   "cores": 4.0, "memory": 15.0, "price": 0.1900},
+        {"name": "n2-standard-4",   "cores": 4.0, "memory": 16.0, "price": 0.1942},
+        {"name": "n2d-standard-4",  "cores": 4.0, "memory": 16.0, "price": 0.1690},
+        {"name": "e2-standard-4",   "cores": 4.0, "memory": 16.0, "price": 0.1340},
+        {"name": "n1-highmem-8",    "cores": 8.0, "memory": 52.0, "price": 0.4736},
+        {"name": "c2-standard-8",   "cores": 8.0, "memory": 32.0, "price": 0.1000}
+    ],
+    (REGION, True): [
+        {"name": "n1-standard-4",   "cores": 4.0, "memory": 15.0, "price": 0.0400},
+        {"name": "e2-standard-4",   "cores": 4.0, "memory": 16.0, "price": 0.0402}
+    ]
+}
+
+STORAGE_PRICES = {
+    ("pd-standard", REGION): 0.040,
+    ("pd-balanced", REGION): 0.100,
+    ("pd-ssd", REGION): 0.170,
+    ("local-ssd", REGION): 0.080
+}
+
+# Machine types listed in the zones
+ALL_TYPES = {"n1-standard-4", "n2-standard-4", "n2d-standard-4", "e2-standard-4", "n1-highmem-8"}
+NO_E2_TYPES = {"n1-standard-4", "n2-standard-4", "n2d-standard-4", "n1-highmem-8"}
+N1_TYPES = {"n1-standard-4", "n1-highmem-8"}
+
+
+class TestGoogleMachineOptimizer(unittest.TestCase):
+
+    # Decision table: (request, expected machine type, expected disk type, expected number of local SSDs)
+    DECISIONS = [
+        # Cheapest predefined machine type beats the equivalent custom machine types (C2 machines are not considered)
+        (dict(nr_cpus=4, mem=16, disk_space=100),
+         "e2-standard-4", "pd-standard", 0),
+
+        # Odd vCPU counts are rounded and the cheapest custom family fitting them is selected
+        (dict(nr_cpus=3, mem=6, disk_space=100),
+         "e2-custom-4-6144", "pd-standard", 0),
+
+        # Adding vCPUs to fit the memory can be cheaper than paying for extended memory
+        (dict(nr_cpus=2, mem=40, disk_space=100),
+         "e2-custom-6-40960", "pd-standard", 0),
+
+        # ... and the other way around once E2 machines failed to be created
+        (dict(nr_cpus=2, mem=40, disk_space=100, excluded_families={"e2"}),
+         "n2d-custom-2-40960-ext", "pd-standard", 0),
+
+        # IO intensive tasks use the cheapest SSD backed boot disk
+        (dict(nr_cpus=4, mem=16, disk_space=100, io_intensive=True),
+         "e2-standard-4", "pd-balanced", 0),
+
+        # Scratch space restricts the choice to families supporting local SSDs
+        (dict(nr_cpus=4, mem=16, disk_space=100, scratch_space=500),
+         "n2d-standard-4", "pd-standard", 2),
+
+        # Machine types missing from the zone are skipped
+        (dict(nr_cpus=4, mem=16, disk_space=100, zone_types=NO_E2_TYPES),
+         "n2d-standard-4", "pd-standard", 0),
+
+        # Families that failed to be created are skipped
+        (dict(nr_cpus=4, mem=16, disk_space=100, excluded_families={"e2", "n2d"}),
+         "n2-standard-4", "pd-standard", 0),
+
+        # Zones offering only N1 machines fall back to custom N1 machines
+        (dict(nr_cpus=4, mem=16, disk_space=100, zone_types=N1_TYPES),
+         "custom-4-16384", "pd-standard", 0),
+
+        # Preemptible prices are compared separately
+        (dict(nr_cpus=4, mem=15, disk_space=100, preemptible=True),
+         "n1-standard-4", "pd-standard", 0)
+    ]
+
+    def setUp(self):
+        patcher = mock.patch.multiple(GooglePricing, compute_prices=COMPUTE_PRICES,
+                                      storage_prices=STORAGE_PRICES, predefined_types=PREDEFINED_TYPES)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.optimizer = GoogleMachineOptimizer(REGION)
+
+    def test_decision_table(self):
+        for request, machine_type, disk_type, local_ssds in self.DECISIONS:
+            with self.subTest(**{k: str(v) for k, v in request.items()}):
+                shape = self.optimizer.optimize(**request)
+                self.assertEqual(shape["machine_type"], machine_type)
+                self.assertEqual(shape["disk_type"], disk_type)
+                self.assertEqual(shape["local_ssds"], local_ssds)
+                self.assertGreaterEqual(shape["nr_cpus"], request["nr_cpus"])
+                self.assertGreaterEqual(shape["mem"], request["mem"])
+
+    def test_storage_price_includes_local_ssds(self):
+        shape = self.optimizer.optimize(4, 16, 100, scratch_space=500)
+        expected = (0.040 * 100 + 0.080 * 2 * GoogleMachineOptimizer.LOCAL_SSD_SIZE) / GooglePricing.HOURS_PER_MONTH
+        self.assertAlmostEqual(shape["storage_price"], expected)
+
+    def test_family_shapes(self):
+        # One shape per family, each being the cheapest of its family
+        shapes = self.optimizer.get_family_shapes(4, 16, 100, zone_types=ALL_TYPES)
+        self.assertEqual(sorted(x["family"] for x in shapes), ["e2", "n1", "n2", "n2d"])
+
+        by_family = {x["family"]: x["machine_type"] for x in shapes}
+        self.assertEqual(by_family["n1"], "custom-4-16384")
+        self.assertEqual(by_family["n2"], "n2-standard-4")
+        self.assertEqual(by_family["n2d"], "n2d-standard-4")
+        self.assertEqual(by_family["e2"], "e2-standard-4")
+
+    def test_no_candidate(self):
+        with self.assertRaises(RuntimeError):
+            self.optimizer.optimize(4, 16, 100, excluded_families={"n1", "n2", "n2d", "e2"})
+
+        with self.assertRaises(RuntimeError):
+            self.optimizer.optimize(4, 16, 100, zone_types=set())
+
+    def test_is_available(self):
+        table = [
+            ("e2-standard-4", ALL_TYPES, True),
+            ("e2-standard-4", NO_E2_TYPES, False),
+            ("e2-custom-4-16384", ALL_TYPES, True),
+            ("e2-custom-4-16384", NO_E2_TYPES, False),
+            ("custom-4-16384", N1_TYPES, True),
+            ("n2-custom-4-16384-ext", N1_TYPES, False)
+        ]
+        for machine_type, zone_types, expected in table:
+            with self.subTest(machine_type=machine_type):
+                self.assertEqual(GoogleMachineOptimizer.is_available(machine_type, zone_types), expected)
+
+    def test_local_ssd_count(self):
+        table = [(0, 0), (1, 1), (375, 1), (376, 2), (750, 2), (751, 4), (5000, 16), (100000, 24)]
+        for scratch_space, expected in table:
+            with self.subTest(scratch_space=scratch_space):
+                self.assertEqual(GoogleMachineOptimizer.get_local_ssd_count(scratch_space), expected)
+
+    def test_family(self):
+        self.assertEqual(GoogleMachineOptimizer.get_family("custom-4-16384"), "n1")
+        self.assertEqual(GoogleMachineOptimizer.get_family("n2d-custom-4-16384-ext"), "n2d")
+        self.assertEqual(GoogleMachineOptimizer.get_family("e2-standard-4"), "e2")
+
+
+if __name__ == "__main__":
+    unittest.main()